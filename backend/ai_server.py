@@ -1,11 +1,32 @@
 
-from fastapi import FastAPI, File, UploadFile
+import os, sys
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, File, Form, UploadFile
 from fastapi.responses import JSONResponse
-import io, numpy as np
-from PIL import Image
 import tensorflow as tf
 
-app = FastAPI(title="AI Brain")
+# ml/ holds the shared preprocessing module
+ML_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "ml")
+if ML_DIR not in sys.path:
+    sys.path.insert(0, ML_DIR)
+
+from preprocessing import preprocess_image
+from backend.services.firebase_service import persistence_from_env
+from backend.services.profiler import install_fastapi, profiler_from_env
+
+# Predictions are saved write-behind to the store main_server's /reports reads
+persistence = persistence_from_env()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    persistence.start()
+    yield
+    await persistence.close()
+
+
+app = FastAPI(title="AI Brain", lifespan=lifespan)
+install_fastapi(app, profiler_from_env())  # POST /debug/profile, needs PROFILER_TOKEN
 
 MODEL_PATH = "ml/trained_models/efficientnet_v1/model.h5"
 
@@ -24,13 +45,17 @@ def health():
     return {"status":"ok", "server":"ai_server", "model_loaded": bool(model)}
 
 @app.post("/predict")
-async def predict(image: UploadFile = File(...)):
+async def predict(image: UploadFile = File(...), user_id: str | None = Form(None)):
     contents = await image.read()
-    img = Image.open(io.BytesIO(contents)).convert('RGB').resize((224,224))
-    arr = np.array(img)/255.0
-    arr = arr.reshape((1,224,224,3))
+    arr = preprocess_image(contents)
     if model is None:
         # Dummy response fallback
         return JSONResponse(content={"label":"unknown","confidence":0.0,"warning":"model not loaded - running dummy"}, status_code=200)
     preds = model.predict(arr).tolist()
-    return {"label":"class_x","confidence":0.9,"raw_preds": preds}
+    result = {"label":"class_x","confidence":0.9,"raw_preds": preds}
+    result["record_id"] = await persistence.record("predictions", user_id, result)
+    return result
+
+@app.get("/persistence/stats")
+def persistence_stats():
+    return persistence.stats()
@@ -1,27 +1,218 @@
+# Combined single-process server ("all-in-one") for hackathon local failover.
+# Serves chat, quick analysis, the Grad-CAM report, two-stage prediction and
+# report hashing from one app:
+#   - every model file is loaded exactly once, in the lifespan hook
+#   - routes call the model code in-process (no HTTP hop to ai_server.py)
+#   - all inference runs on one shared thread pool, results land in one cache
+# Run from the repo root: uvicorn backend.aio_server:app --host 0.0.0.0 --port 8000
 
-# Combined server for hackathon local failover. Runs both main logic & AI endpoints.
-# You can run this with: uvicorn backend.aio_server:app --host 0.0.0.0 --port 8000
+import asyncio
+import hashlib
+import io
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import List
 
-from fastapi import FastAPI, UploadFile, File
-from backend.main_server import hash_report
-from backend.ai_server import predict, health as ai_health
+from fastapi import FastAPI, File, Form, HTTPException, UploadFile
+from fastapi.middleware.cors import CORSMiddleware
+
+# ml/ is a folder of scripts that import each other by module name
+ML_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "ml")
+if ML_DIR not in sys.path:
+    sys.path.insert(0, ML_DIR)
+
+import report_model
+from two_stage_predictor import TwoStagePredictor
+
+from backend import main_server
+from backend.main_server import ChatResponse, TriageResponse
+from backend.services.metrics import resident_memory_mb
+from backend.services.profiler import install_fastapi
+from backend.services.result_cache import ResultCache
+
+# --- Configuration ---
+REPORT_MODEL_PATH = os.getenv("REPORT_MODEL_PATH", report_model.MODEL_PATH)
+STAGE1_MODEL_PATH = os.getenv("STAGE1_MODEL_PATH", os.path.join(ML_DIR, "models", "finetuned_model.h5"))
+STAGE2_MODEL_PATH = os.getenv("STAGE2_MODEL_PATH", os.path.join(ML_DIR, "models", "skin_cancer_model.h5"))
+STUDENT_MODEL_PATH = os.getenv("STUDENT_MODEL_PATH")  # distilled two-head model, replaces both stages
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", "2"))
+
+# --- Shared state: one executor, one result cache, models filled in by lifespan ---
+inference_executor = ThreadPoolExecutor(max_workers=INFERENCE_WORKERS, thread_name_prefix="inference")
+results = ResultCache(
+    max_entries=int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "512")),
+    ttl_seconds=float(os.getenv("RESULT_CACHE_TTL_SECONDS", "3600")),
+)
+state = {
+    "report_model": None,
+    "last_conv_layer": None,
+    "two_stage": None,
+    "loaded_model_files": [],
+    "startup_seconds": None,
+}
+
+
+def load_models():
+    """
+    Loads every model file once. By default the report model and the Stage 2
+    model are the same file, so they share one in-memory model.
+    """
+    loaded = {}
+
+    def model_at(path):
+        if path not in loaded:
+            loaded[path] = report_model.load_report_model(path)
+        return loaded[path]
+
+    state["report_model"] = model_at(REPORT_MODEL_PATH)
+    if state["report_model"] is not None:
+        state["last_conv_layer"] = report_model.find_last_conv_layer(state["report_model"])
+
+    if STUDENT_MODEL_PATH:
+        student = model_at(STUDENT_MODEL_PATH)
+        if student is not None:
+            state["two_stage"] = TwoStagePredictor(student_model=student)
+        else:
+            print("❌ Two-stage predictor disabled: the student model failed to load.")
+    else:
+        stage1, stage2 = model_at(STAGE1_MODEL_PATH), model_at(STAGE2_MODEL_PATH)
+        if stage1 is not None and stage2 is not None:
+            state["two_stage"] = TwoStagePredictor(stage1_model=stage1, stage2_model=stage2)
+        else:
+            print("❌ Two-stage predictor disabled: a stage model failed to load.")
+    state["loaded_model_files"] = [path for path, model in loaded.items() if model is not None]
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    started = time.perf_counter()
+    load_models()
+    # Gemini, chat cache warm-up and their shutdown come from the app server's own lifespan
+    async with main_server.lifespan(app):
+        state["startup_seconds"] = round(time.perf_counter() - started, 2)
+        print(f"AIO server ready in {state['startup_seconds']}s, RSS {resident_memory_mb()} MB.")
+        yield
+    inference_executor.shutdown(wait=False)
+
+
+app = FastAPI(title="AIO Combined Server", lifespan=lifespan)
+
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=main_server.origins,
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+install_fastapi(app, main_server.profiler)  # POST /debug/profile
+
+# --- Routes served by the app server's own handlers (in-process) ---
+app.add_api_route("/chat", main_server.handle_chat, methods=["POST"], response_model=ChatResponse)
+app.add_api_route("/chat/stream", main_server.handle_chat_stream, methods=["POST"])
+app.add_api_route("/chat/stats", main_server.chat_stats, methods=["GET"])
+app.add_api_route("/analyze/quick", main_server.quick_analysis, methods=["POST"], response_model=TriageResponse)
+app.add_api_route("/hash_report", main_server.hash_report_endpoint, methods=["POST"])
+app.add_api_route("/verify_report", main_server.verify_report_endpoint, methods=["POST"])
+app.add_api_route("/hash_report/stats", main_server.anchor_stats, methods=["GET"])
+app.add_api_route("/uv", main_server.uv_index, methods=["GET"])
+app.add_api_route("/uv/stats", main_server.uv_stats, methods=["GET"])
+app.add_api_route("/persistence/stats", main_server.persistence_stats, methods=["GET"])
+app.add_api_route("/reports", main_server.list_reports, methods=["GET"])
+app.add_api_route("/reports/{record_id}", main_server.get_report, methods=["GET"])
+app.add_api_route("/reports/{record_id}/heatmap", main_server.get_report_heatmap, methods=["GET"])
+
+
+async def run_inference(fn, *args):
+    """Runs blocking model code on the shared inference pool."""
+    return await asyncio.get_running_loop().run_in_executor(inference_executor, fn, *args)
+
+
+def image_key(route: str, image_bytes: bytes, *extra) -> tuple:
+    return (route, hashlib.sha256(image_bytes).hexdigest(), *extra)
+
+
+async def persist(collection: str, user_id: str | None, result: dict) -> str | None:
+    """Queues a result for write-behind persistence; returns its record id (None if the buffer is full)."""
+    return await main_server.persistence.record(collection, user_id, result)
 
-app = FastAPI(title="AIO Combined Server")
 
 @app.get("/health")
 def health():
-    return {"status":"ok", "server":"aio_combined"}
+    return {
+        "status": "ok",
+        "server": "aio_combined",
+        "report_model_loaded": state["report_model"] is not None,
+        "two_stage_loaded": state["two_stage"] is not None,
+        "loaded_model_files": state["loaded_model_files"],
+        "startup_seconds": state["startup_seconds"],
+        "rss_mb": resident_memory_mb(),
+        "result_cache": results.stats(),
+    }
+
+
+@app.post("/generate_report")
+async def generate_report(file: UploadFile = File(...), user_id: str | None = Form(None)):
+    """Prediction + Grad-CAM report (same response as ml/main.py)."""
+    model = state["report_model"]
+    if not model:
+        raise HTTPException(status_code=500, detail="Model is not loaded.")
+
+    image_bytes = await file.read()
+    key = image_key("generate_report", image_bytes)
+    report = results.get(key)
+    if report is not None:
+        return dict(report, record_id=await persist("reports", user_id, report))
+
+    try:
+        processed_image = await run_inference(report_model.preprocess_image, image_bytes)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Invalid image file. Error: {e}")
+
+    report = await run_inference(report_model.build_report, model, state["last_conv_layer"], image_bytes, processed_image)
+    results.put(key, report)
+    return dict(report, record_id=await persist("reports", user_id, report))
+
+
+async def two_stage_predict(image_bytes: bytes, filename: str, confidence_threshold: float,
+                            user_id: str | None = None) -> dict:
+    predictor = state["two_stage"]
+    key = image_key("two_stage", image_bytes, confidence_threshold)
+    result = results.get(key)
+    if result is None:
+        try:
+            processed_image = await run_inference(predictor.preprocess_image, io.BytesIO(image_bytes))
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=f"Invalid image file '{filename}'. Error: {e}")
+        result = await run_inference(predictor.predict_array, processed_image, confidence_threshold, filename)
+        results.put(key, result)
+    # Cached results are shared; metadata is per request
+    result = dict(result, metadata={
+        'filename': filename,
+        'timestamp': datetime.now().isoformat(),
+        'confidence_threshold': confidence_threshold,
+    })
+    result['record_id'] = await persist("predictions", user_id, result)
+    return result
+
 
-# Mount or re-use functions from other modules (simple adaptation)
 @app.post("/predict")
-async def predict_proxy(image: UploadFile = File(...)):
-    return await predict(image)
-
-@app.post("/hash_report")
-def hash_report_proxy(payload: dict):
-    class R:
-        def __init__(self, d):
-            self.report_id = d.get("report_id","unknown")
-            self.diagnosis = d.get("diagnosis",{})
-    r = R(payload)
-    return hash_report(r)
+async def predict(image: UploadFile = File(...), confidence_threshold: float = Form(0.5),
+                  user_id: str | None = Form(None)):
+    """Two-stage prediction (same response as ml/api_two_stage.py)."""
+    if not state["two_stage"]:
+        raise HTTPException(status_code=500, detail="Two-stage models are not loaded.")
+    return await two_stage_predict(await image.read(), image.filename, confidence_threshold, user_id)
+
+
+@app.post("/predict/batch")
+async def predict_batch(images: List[UploadFile] = File(...), confidence_threshold: float = Form(0.5),
+                        user_id: str | None = Form(None)):
+    if not state["two_stage"]:
+        raise HTTPException(status_code=500, detail="Two-stage models are not loaded.")
+    uploads = [(await image.read(), image.filename) for image in images]
+    batch = await asyncio.gather(*(two_stage_predict(data, name, confidence_threshold, user_id) for data, name in uploads))
+    return {'count': len(batch), 'results': batch}
@@ -0,0 +1,66 @@
+# Load test for /chat admission control.
+#
+#   FAKE_LLM_LATENCY_SECONDS=1 FAKE_LLM_REQUESTS_PER_MINUTE=120 \
+#     uvicorn backend.services.fake_llm:app --port 8090 &
+#   FAKE_LLM_URL=http://localhost:8090 LLM_MAX_IN_FLIGHT=4 LLM_REQUESTS_PER_MINUTE=100 \
+#     uvicorn backend.main_server:app --port 8001 &
+#   python -m backend.benchmarks.chat_load --requests 300 --concurrency 64
+#
+# Every request asks a distinct question so the cache and single-flight layers
+# do not hide the load from the limiter. Expect 200s up to the configured
+# quota, then fast 429/503s with Retry-After instead of slow 500s, and no 429s
+# from the fake upstream itself (see its /stats).
+
+import argparse
+import asyncio
+import json
+import time
+from collections import Counter
+
+import httpx
+
+from backend.services.metrics import LatencyRecorder
+
+
+async def run(args):
+    statuses = Counter()
+    retry_after = Counter()
+    latency = {}
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async with httpx.AsyncClient(base_url=args.url, timeout=120.0) as client:
+        async def one(i):
+            async with semaphore:
+                started = time.perf_counter()
+                resp = await client.post("/chat", json={"message": f"load test question {i}", "context": "Psoriasis"})
+                latency.setdefault(resp.status_code, LatencyRecorder()).record(time.perf_counter() - started)
+                statuses[resp.status_code] += 1
+                if "retry-after" in resp.headers:
+                    retry_after[resp.headers["retry-after"]] += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(args.requests)))
+        elapsed = time.perf_counter() - started
+        server_stats = (await client.get("/chat/stats")).json()
+
+    print(json.dumps({
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "elapsed_seconds": round(elapsed, 2),
+        "statuses": dict(statuses),
+        "retry_after": dict(retry_after),
+        "latency_by_status": {status: rec.summary() for status, rec in latency.items()},
+        "admission": server_stats.get("admission"),
+    }, indent=2))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Drive concurrent /chat traffic at the app server.")
+    parser.add_argument("--url", default="http://localhost:8001")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
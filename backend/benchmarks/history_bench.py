@@ -0,0 +1,96 @@
+# Report history query latency as the store grows.
+#
+#   python -m backend.benchmarks.history_bench                       # up to 1M reports
+#   python -m backend.benchmarks.history_bench --checkpoints 100000 1000000 3000000
+#
+# Synthetic predictions are bulk-inserted through the same write path the
+# persistence queue uses. At each checkpoint the common queries are timed:
+# a patient's newest page, a deep page via cursor, by class, by severity, by
+# id. With the (filter, created_at, id) indexes and keyset pagination these
+# stay flat as the table grows.
+
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+
+from backend.services.metrics import percentile
+from backend.services.report_history import SEVERITIES, ReportHistoryStore
+
+STAGE1 = ["Eczema", "Atopic Dermatitis", "Melanoma", "Psoriasis", "Basal Cell Carcinoma (BCC)",
+          "Melanocytic Nevi (NV)", "Benign Keratosis-like Lesions (BKL)", "Tinea Ringworm Candidiasis",
+          "Seborrheic Keratoses", "Warts Molluscum Viral Infections"]
+STAGE2 = ["Actinic Keratoses", "Basal Cell Carcinoma", "Benign Keratosis", "Dermatofibroma",
+          "Melanocytic Nevi", "Vascular Lesions", "Melanoma"]
+
+
+def synthetic(i, users, rng):
+    stage2 = rng.choice(STAGE2) if rng.random() < 0.4 else None
+    return ("predictions", f"rec-{i}", {
+        "user_id": f"user-{rng.randrange(users)}",
+        "created_at": 1.7e9 + i * 0.5,
+        "stage1": {"class": rng.choice(STAGE1), "confidence": rng.random()},
+        "stage2": {"class": stage2, "confidence": rng.random()} if stage2 else None,
+        "recommendation": {"severity": rng.choice(SEVERITIES), "action": "...", "details": "..."},
+    })
+
+
+def timed(fn, repeats):
+    samples = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return {"p50_ms": round(percentile(samples, 50), 3), "p99_ms": round(percentile(samples, 99), 3)}
+
+
+def deep_page(store, user_id, pages):
+    cursor = None
+    for _ in range(pages):
+        cursor = store.query(user_id=user_id, limit=20, cursor=cursor)["next_cursor"]
+        if cursor is None:
+            break
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark report history queries at growing sizes.")
+    parser.add_argument("--checkpoints", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--users", type=int, default=20000)
+    parser.add_argument("--repeats", type=int, default=200)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        store = ReportHistoryStore(os.path.join(tmp, "history.db"))
+        inserted = 0
+        for checkpoint in sorted(args.checkpoints):
+            started = time.perf_counter()
+            while inserted < checkpoint:
+                n = min(10000, checkpoint - inserted)
+                store.write_batch([synthetic(inserted + k, args.users, rng) for k in range(n)])
+                inserted += n
+            insert_seconds = time.perf_counter() - started
+
+            users = [f"user-{rng.randrange(args.users)}" for _ in range(args.repeats)]
+            it = iter(users * 2)
+            rows.append({
+                "reports": inserted,
+                "insert_seconds": round(insert_seconds, 1),
+                "db_mb": round(sum(os.path.getsize(os.path.join(tmp, f)) for f in os.listdir(tmp)) / 1e6, 1),
+                "user_page": timed(lambda: store.query(user_id=next(it), limit=20), args.repeats),
+                "user_page_depth_5": timed(lambda: deep_page(store, next(it), 5), args.repeats),
+                "by_stage2": timed(lambda: store.query(stage2=rng.choice(STAGE2), limit=50), args.repeats),
+                "by_severity": timed(lambda: store.query(severity="HIGH", limit=50), args.repeats),
+                "by_id": timed(lambda: store.get(f"rec-{rng.randrange(inserted)}"), args.repeats),
+            })
+            print(json.dumps(rows[-1]))
+        store.close()
+    print(json.dumps(rows, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,293 @@
+# End-to-end load test and latency benchmark for the serving endpoints.
+#
+#   python -m backend.benchmarks.load_test --start                      # AIO server + fake LLM, all endpoints
+#   python -m backend.benchmarks.load_test --url http://localhost:8000 --endpoints predict,chat \
+#       --requests 200 --concurrency 16 --rate 10
+#   python -m backend.benchmarks.load_test --start --save-baseline      # record the current numbers
+#   python -m backend.benchmarks.load_test --start --check              # exit 1 on regression
+#
+# Drives /generate_report, /predict, /predict/batch, /analyze/quick and /chat
+# one endpoint at a time. Images are synthetic photos of realistic sizes
+# (--sizes) or the files of --images DIR. Each upload gets a few random bytes
+# appended after the image data so the result cache does not answer it
+# (--allow-cache-hits to measure the cached path instead). Chat questions are
+# distinct for the same reason, and --start points the server at the fake LLM
+# (backend/services/fake_llm.py) so /chat never reaches Gemini.
+#
+# Closed loop by default (--concurrency requests in flight). With --rate,
+# requests start on a fixed schedule and latency counts from the scheduled
+# start, so queueing inside the server shows up in the percentiles.
+#
+# Prints one JSON document (throughput, status counts and p50/p95/p99 per
+# endpoint). Latency percentiles cover 2xx responses only; rejected and
+# failed requests are summarised separately under error_latency. With --check it is compared to the stored baseline: a percentile
+# more than --tolerance slower, throughput more than --tolerance lower, or an
+# error rate more than 1 point higher fails the run.
+
+import argparse
+import asyncio
+import io
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from collections import Counter
+
+import httpx
+from PIL import Image, ImageFilter
+
+from backend.benchmarks.startup_compare import ROOT, uvicorn, wait_ready
+from backend.services.metrics import LatencyRecorder
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines", "load_test.json")
+IMAGE_TYPES = (".jpg", ".jpeg", ".png")
+
+# name -> (path, multipart field or None for JSON)
+ENDPOINTS = {
+    "generate_report": ("/generate_report", "file"),
+    "predict": ("/predict", "image"),
+    "predict_batch": ("/predict/batch", "images"),
+    "analyze_quick": ("/analyze/quick", "image"),
+    "chat": ("/chat", None),
+}
+
+CHAT_CONTEXTS = ["Psoriasis", "Eczema", "Melanoma", "Basal Cell Carcinoma", "Tinea Ringworm"]
+
+
+# --- Inputs ---
+def synthetic_image(width, height, seed):
+    """A JPEG that compresses like a phone photo (smooth shapes plus sensor noise)."""
+    rng = random.Random(seed)
+    channels = [Image.effect_noise((width, height), rng.uniform(30, 60)) for _ in range(3)]
+    img = Image.merge("RGB", channels).filter(ImageFilter.GaussianBlur(radius=max(width, height) / 200))
+    noise = Image.merge("RGB", [Image.effect_noise((width, height), 8) for _ in range(3)])
+    img = Image.blend(img, noise, 0.15)
+    buffer = io.BytesIO()
+    img.save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue()
+
+
+def load_images(args):
+    """[(filename, bytes)] from --images DIR or one synthetic image per --sizes entry."""
+    if args.images:
+        names = sorted(n for n in os.listdir(args.images) if n.lower().endswith(IMAGE_TYPES))
+        if not names:
+            sys.exit(f"No .jpg/.png files in {args.images}")
+        images = []
+        for name in names[:args.max_images]:
+            with open(os.path.join(args.images, name), "rb") as f:
+                images.append((name, f.read()))
+        return images
+    images = []
+    for i, size in enumerate(args.sizes.split(",")):
+        width, height = (int(v) for v in size.lower().split("x"))
+        images.append((f"synthetic_{width}x{height}.jpg", synthetic_image(width, height, seed=i)))
+    return images
+
+
+class RequestFactory:
+    """Builds the kwargs for request number i of an endpoint."""
+
+    def __init__(self, images, allow_cache_hits, batch_images):
+        self.images = images
+        self.allow_cache_hits = allow_cache_hits
+        self.batch_images = batch_images
+
+    def upload(self, i):
+        name, data = self.images[i % len(self.images)]
+        if not self.allow_cache_hits:
+            data = data + os.urandom(16)  # decoders ignore trailing bytes; the cache key changes
+        return name, data
+
+    def build(self, endpoint, i):
+        path, field = ENDPOINTS[endpoint]
+        if field is None:
+            context = CHAT_CONTEXTS[i % len(CHAT_CONTEXTS)]
+            return path, {"json": {"message": f"load test question {i}: is this contagious?", "context": context}}
+        if endpoint == "predict_batch":
+            uploads = [self.upload(i * self.batch_images + j) for j in range(self.batch_images)]
+            return path, {"files": [(field, (name, data, "image/jpeg")) for name, data in uploads]}
+        name, data = self.upload(i)
+        return path, {"files": {field: (name, data, "image/jpeg")}}
+
+
+# --- Load generation ---
+def succeeded(status):
+    return isinstance(status, int) and 200 <= status < 300
+
+
+async def drive(client, factory, endpoint, requests, concurrency, rate):
+    # Fast 429/503s and transport errors would flatter the percentiles, so
+    # they get their own recorder and only 2xx responses count as latency.
+    latency = LatencyRecorder(max_samples=requests)
+    error_latency = LatencyRecorder(max_samples=requests)
+    statuses = Counter()
+    semaphore = asyncio.Semaphore(concurrency)
+    started = time.perf_counter()
+
+    async def one(i):
+        scheduled = started + i / rate if rate else None
+        if scheduled is not None:
+            await asyncio.sleep(max(0.0, scheduled - time.perf_counter()))
+        async with semaphore:
+            begin = scheduled if scheduled is not None else time.perf_counter()
+            path, kwargs = factory.build(endpoint, i)
+            try:
+                resp = await client.post(path, **kwargs)
+                status = resp.status_code
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            (latency if succeeded(status) else error_latency).record(time.perf_counter() - begin)
+            statuses[status] += 1
+
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    elapsed = time.perf_counter() - started
+    ok = sum(count for status, count in statuses.items() if succeeded(status))
+    return {
+        "requests": requests,
+        "elapsed_seconds": round(elapsed, 3),
+        "throughput_rps": round(ok / elapsed, 3) if elapsed else 0.0,
+        "error_rate": round(1 - ok / requests, 4) if requests else 0.0,
+        "statuses": {str(status): count for status, count in statuses.items()},
+        "latency": latency.summary(),
+        "error_latency": error_latency.summary(),
+    }
+
+
+async def run(args, images):
+    factory = RequestFactory(images, args.allow_cache_hits, args.batch_images)
+    results = {}
+    async with httpx.AsyncClient(base_url=args.url, timeout=args.timeout) as client:
+        for endpoint in args.endpoints.split(","):
+            if endpoint not in ENDPOINTS:
+                sys.exit(f"Unknown endpoint '{endpoint}' (choose from {', '.join(ENDPOINTS)})")
+            if args.warmup:
+                await drive(client, factory, endpoint, args.warmup, args.concurrency, None)
+            print(f"Driving {endpoint} ({args.requests} requests)...", file=sys.stderr)
+            results[endpoint] = await drive(client, factory, endpoint, args.requests, args.concurrency, args.rate)
+    return results
+
+
+# --- Servers ---
+def start_servers(args):
+    """Fake LLM + AIO server as subprocesses; returns them once both answer."""
+    llm_port = 8090
+    env = dict(os.environ,
+               FAKE_LLM_LATENCY_SECONDS=str(args.llm_latency),
+               FAKE_LLM_REQUESTS_PER_MINUTE="1000000",
+               FAKE_LLM_URL=f"http://127.0.0.1:{llm_port}")
+    port = httpx.URL(args.url).port or 8000
+    procs = [
+        (subprocess.Popen(uvicorn("backend.services.fake_llm:app", llm_port), cwd=ROOT, env=env,
+                          stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL),
+         f"http://127.0.0.1:{llm_port}/stats"),
+        (subprocess.Popen(uvicorn("backend.aio_server:app", port), cwd=ROOT, env=env,
+                          stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL),
+         f"http://127.0.0.1:{port}/health"),
+    ]
+    for proc, url in procs:
+        if not wait_ready(url, args.startup_timeout):
+            stop_servers(procs)
+            sys.exit(f"Server at {url} did not become ready")
+    return procs
+
+
+def stop_servers(procs):
+    for proc, _ in procs:
+        proc.terminate()
+    for proc, _ in procs:
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+# --- Baselines ---
+def regressions(report, baseline, tolerance):
+    """Human-readable list of everything worse than the baseline."""
+    found = []
+    if baseline.get("config") != report["config"]:
+        print("Warning: the baseline was recorded with a different configuration.", file=sys.stderr)
+    for endpoint, result in report["endpoints"].items():
+        base = baseline.get("endpoints", {}).get(endpoint)
+        if base is None:
+            continue
+        for pct in ("p50_ms", "p95_ms", "p99_ms"):
+            now, before = result["latency"][pct], base["latency"][pct]
+            if before and now > before * (1 + tolerance):
+                found.append(f"{endpoint}: {pct} {now:.1f} > {before:.1f} (+{now / before - 1:.0%})")
+        now, before = result["throughput_rps"], base["throughput_rps"]
+        if before and now < before * (1 - tolerance):
+            found.append(f"{endpoint}: throughput {now:.2f} < {before:.2f} rps ({now / before - 1:.0%})")
+        if result["error_rate"] > base["error_rate"] + 0.01:
+            found.append(f"{endpoint}: error rate {result['error_rate']:.2%} > {base['error_rate']:.2%}")
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the serving endpoints and compare with a baseline.")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--start", action="store_true", help="Start the AIO server and a fake LLM for the run")
+    parser.add_argument("--endpoints", default=",".join(ENDPOINTS))
+    parser.add_argument("--requests", type=int, default=100, help="Requests per endpoint")
+    parser.add_argument("--warmup", type=int, default=5, help="Unmeasured requests per endpoint first")
+    parser.add_argument("--concurrency", type=int, default=8, help="Maximum requests in flight")
+    parser.add_argument("--rate", type=float, default=None, help="Open loop: requests started per second")
+    parser.add_argument("--sizes", default="640x480,1280x960,3024x4032", help="Synthetic image sizes")
+    parser.add_argument("--images", default=None, help="Directory of sample images instead of synthetic ones")
+    parser.add_argument("--max-images", type=int, default=50)
+    parser.add_argument("--batch-images", type=int, default=4, help="Images per /predict/batch request")
+    parser.add_argument("--allow-cache-hits", action="store_true", help="Send identical bytes for repeated images")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="Fake LLM latency in seconds (--start)")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Per-request timeout in seconds")
+    parser.add_argument("--startup-timeout", type=float, default=300.0)
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true", help="Store this run as the baseline")
+    parser.add_argument("--check", action="store_true", help="Exit 1 if this run regresses past the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative slowdown (0.2 = 20%%)")
+    parser.add_argument("--output", default=None, help="Also write the JSON report here")
+    args = parser.parse_args()
+
+    images = load_images(args)
+    procs = start_servers(args) if args.start else []
+    try:
+        endpoints = asyncio.run(run(args, images))
+    finally:
+        stop_servers(procs)
+
+    report = {
+        "config": {
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "rate": args.rate,
+            "images": [f"{name} ({len(data) // 1024} KiB)" for name, data in images],
+            "batch_images": args.batch_images,
+            "allow_cache_hits": args.allow_cache_hits,
+        },
+        "endpoints": endpoints,
+    }
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline saved to {args.baseline}", file=sys.stderr)
+    elif args.check:
+        if not os.path.exists(args.baseline):
+            sys.exit(f"No baseline at {args.baseline}; record one with --save-baseline")
+        with open(args.baseline) as f:
+            found = regressions(report, json.load(f), args.tolerance)
+        if found:
+            print("REGRESSION:\n  " + "\n  ".join(found), file=sys.stderr)
+            sys.exit(1)
+        print(f"No regression past {args.tolerance:.0%} of the baseline.", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
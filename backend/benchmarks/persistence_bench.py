@@ -0,0 +1,75 @@
+# Write-behind persistence throughput per batch size (SQLite backend).
+#
+#   python -m backend.benchmarks.persistence_bench
+#   python -m backend.benchmarks.persistence_bench --records 20000 --batch-sizes 1 10 100 500
+#
+# For each batch size: time for a handler to enqueue one report (what a
+# request pays) and end-to-end throughput until every record is committed.
+
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+from backend.services.firebase_service import SQLiteBackend, WriteBehindQueue
+from backend.services.metrics import percentile
+
+
+def make_record(i):
+    return {
+        "user_id": f"user-{i % 500}",
+        "created_at": time.time(),
+        "prediction": "Melanocytic Nevus (nv)",
+        "confidence": 0.87,
+        "probabilities": {f"class_{c}": c / 7 for c in range(7)},
+    }
+
+
+async def measure(batch_size, records, db_dir):
+    queue = WriteBehindQueue(
+        SQLiteBackend(os.path.join(db_dir, f"bench_{batch_size}.db")),
+        max_batch_size=batch_size,
+        flush_interval_seconds=0.05,
+        max_buffer=max(records, 1),
+    )
+    queue.start()
+    enqueue_us = []
+    started = time.perf_counter()
+    for i in range(records):
+        t0 = time.perf_counter()
+        await queue.write("predictions", f"doc-{i}", make_record(i))
+        enqueue_us.append((time.perf_counter() - t0) * 1e6)
+        if i % 100 == 0:
+            await asyncio.sleep(0)  # let the writer run, as it would between requests
+    await queue.flush()
+    elapsed = time.perf_counter() - started
+    stats = queue.stats()
+    await queue.close()
+    enqueue_us.sort()
+    return {
+        "batch_size": batch_size,
+        "records_per_second": round(records / elapsed),
+        "enqueue_p50_us": round(percentile(enqueue_us, 50), 2),
+        "enqueue_p99_us": round(percentile(enqueue_us, 99), 2),
+        "batches": stats["batches"],
+        "commit_p50_ms": stats["commit"]["p50_ms"],
+    }
+
+
+async def run(args):
+    with tempfile.TemporaryDirectory() as db_dir:
+        return [await measure(size, args.records, db_dir) for size in args.batch_sizes]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark write-behind persistence per batch size.")
+    parser.add_argument("--records", type=int, default=10000)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 10, 50, 100, 500])
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+# Report hashing cost vs heatmap size: canonical streaming digest vs json.dumps + sha256.
+#
+#   python -m backend.benchmarks.report_hash_bench
+#   python -m backend.benchmarks.report_hash_bench --sizes-kb 64 256 1024 4096
+#
+# Reports peak extra memory (tracemalloc) and time per report. The canonical
+# digest's peak stays around one chunk no matter how large the heatmap gets.
+
+import argparse
+import base64
+import hashlib
+import json
+import os
+import time
+import tracemalloc
+
+from backend.services.report_hash import canonical_digest
+
+
+def make_report(heatmap_kb):
+    heatmap = base64.b64encode(os.urandom(heatmap_kb * 1024)).decode("ascii")
+    return {
+        "report_id": "bench",
+        "diagnosis": {
+            "prediction": "Melanoma (mel)",
+            "confidence": 0.9173,
+            "probabilities": {f"class_{i}": i / 7 for i in range(7)},
+            "heatmap_image": f"data:image/jpeg;base64,{heatmap}",
+        },
+    }
+
+
+def json_digest(report):
+    payload = json.dumps(report, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def measure(fn, report, repeats):
+    tracemalloc.start()
+    fn(report)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    started = time.perf_counter()
+    for _ in range(repeats):
+        fn(report)
+    return {
+        "ms_per_report": round((time.perf_counter() - started) * 1000 / repeats, 3),
+        "peak_extra_kb": round(peak / 1024, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark canonical report hashing.")
+    parser.add_argument("--sizes-kb", type=int, nargs="+", default=[16, 128, 512, 2048])
+    parser.add_argument("--repeats", type=int, default=20)
+    args = parser.parse_args()
+
+    rows = []
+    for size_kb in args.sizes_kb:
+        report = make_report(size_kb)
+        rows.append({
+            "heatmap_kb": size_kb,
+            "canonical": measure(canonical_digest, report, args.repeats),
+            "json_dumps": measure(json_digest, report, args.repeats),
+        })
+    print(json.dumps(rows, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+# Startup time and resident memory: combined AIO server vs the split deployment.
+#
+#   python -m backend.benchmarks.startup_compare            # both modes
+#   python -m backend.benchmarks.startup_compare --mode aio
+#
+# Each mode's processes are started fresh. Startup time is measured until every
+# health URL answers 200. Memory is the summed RSS of each process tree once
+# it is ready (Linux only). Run from the repo root with the models in ml/models/.
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+import httpx
+
+from backend.services.metrics import resident_memory_mb
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+ML_DIR = os.path.join(ROOT, "ml")
+
+
+def uvicorn(target, port):
+    return [sys.executable, "-m", "uvicorn", target, "--host", "127.0.0.1", "--port", str(port)]
+
+
+# name -> [(process name, command, cwd, readiness URL)]
+MODES = {
+    "aio": [
+        ("aio_server", uvicorn("backend.aio_server:app", 8100), ROOT, "http://127.0.0.1:8100/health"),
+    ],
+    "split": [
+        ("main_server", uvicorn("backend.main_server:app", 8101), ROOT, "http://127.0.0.1:8101/"),
+        ("ai_server", uvicorn("backend.ai_server:app", 8102), ROOT, "http://127.0.0.1:8102/health"),
+        ("report_brain", uvicorn("main:app", 8103), ML_DIR, "http://127.0.0.1:8103/"),
+        ("two_stage_api", [sys.executable, "api_two_stage.py"], ML_DIR, "http://127.0.0.1:5000/health"),
+    ],
+}
+
+
+def children(pid):
+    found = []
+    try:
+        for task in os.listdir(f"/proc/{pid}/task"):
+            with open(f"/proc/{pid}/task/{task}/children") as f:
+                found.extend(int(child) for child in f.read().split())
+    except OSError:
+        pass
+    return found
+
+
+def tree_rss_mb(pid):
+    """RSS of a process and all its descendants (reloaders spawn children)."""
+    total = resident_memory_mb(pid) or 0.0
+    for child in children(pid):
+        total += tree_rss_mb(child)
+    return total
+
+
+def wait_ready(url, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(url, timeout=2.0).status_code == 200:
+                return True
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.25)
+    return False
+
+
+def measure(mode, timeout):
+    started = time.perf_counter()
+    procs = [
+        (name, subprocess.Popen(cmd, cwd=cwd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL), url)
+        for name, cmd, cwd, url in MODES[mode]
+    ]
+    try:
+        ready = {name: wait_ready(url, timeout) for name, _, url in procs}
+        startup_seconds = time.perf_counter() - started
+        rss = {name: round(tree_rss_mb(proc.pid), 1) for name, proc, _ in procs}
+    finally:
+        for _, proc, _ in procs:
+            proc.terminate()
+        for _, proc, _ in procs:
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+    return {
+        "mode": mode,
+        "ready": ready,
+        "startup_seconds": round(startup_seconds, 2),
+        "rss_mb": rss,
+        "total_rss_mb": round(sum(rss.values()), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare AIO vs split deployment startup time and memory.")
+    parser.add_argument("--mode", choices=sorted(MODES) + ["both"], default="both")
+    parser.add_argument("--timeout", type=float, default=300.0, help="Seconds to wait for each server")
+    args = parser.parse_args()
+    modes = sorted(MODES) if args.mode == "both" else [args.mode]
+    print(json.dumps([measure(mode, args.timeout) for mode in modes], indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+# In-process UV service benchmark with the fake provider.
+#
+#   python -m backend.benchmarks.uv_bench
+#   python -m backend.benchmarks.uv_bench --lookups 200000 --provider-latency 0.3
+#
+# Phases:
+#   cold    concurrent lookups scattered in a few cells -> one provider call per cell
+#   hits    lookups against warm cells -> latency of the cache path (expect microseconds)
+#   stale   entries past their TTL with a slow provider -> still served from memory
+
+import argparse
+import asyncio
+import json
+import random
+import time
+
+from backend.services.metrics import percentile
+from backend.services.uv_service import FakeUVProvider, UVService
+
+
+def jitter(rng, lat, lon):
+    return lat + rng.uniform(0, 0.2), lon + rng.uniform(0, 0.2)
+
+
+async def timed_lookups(service, points):
+    """Per-lookup latency in microseconds."""
+    samples = []
+    for lat, lon in points:
+        started = time.perf_counter()
+        await service.get(lat, lon)
+        samples.append((time.perf_counter() - started) * 1e6)
+    samples.sort()
+    return {
+        "count": len(samples),
+        "mean_us": round(sum(samples) / len(samples), 2),
+        **{f"p{pct}_us": round(percentile(samples, pct), 2) for pct in (50, 95, 99)},
+    }
+
+
+async def run(args):
+    rng = random.Random(0)
+    provider = FakeUVProvider(latency_seconds=args.provider_latency)
+    service = UVService(provider, grid_degrees=0.25, ttl_seconds=args.ttl)
+    cities = [(12.9, 77.5), (19.0, 72.8), (28.6, 77.2), (40.7, -74.0), (51.5, -0.1)]
+
+    started = time.perf_counter()
+    await asyncio.gather(*(service.get(*jitter(rng, *rng.choice(cities))) for _ in range(args.concurrency)))
+    cold = {
+        "lookups": args.concurrency,
+        "provider_calls": provider.calls,
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+
+    points = [jitter(rng, *rng.choice(cities)) for _ in range(args.lookups)]
+    hits = await timed_lookups(service, points)
+
+    await asyncio.sleep(args.ttl)  # every cell is now stale
+    stale = await timed_lookups(service, points[:1000])
+
+    print(json.dumps({
+        "cold": cold,
+        "hit_latency": hits,
+        "stale_latency": stale,
+        "service": service.stats(),
+    }, indent=2))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the cached UV service in-process.")
+    parser.add_argument("--lookups", type=int, default=100000)
+    parser.add_argument("--concurrency", type=int, default=500)
+    parser.add_argument("--provider-latency", type=float, default=0.2, help="Fake provider delay (seconds)")
+    parser.add_argument("--ttl", type=float, default=1.0, help="Cache TTL for the run (seconds)")
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
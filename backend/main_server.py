@@ -1,7 +1,8 @@
 # This is the code for: backend/main_server.py
 
 import uvicorn
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Request
+from fastapi.responses import Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 import time
@@ -9,11 +10,26 @@ import httpx
 import asyncio
 from contextlib import asynccontextmanager
 import os # NEW: To load environment variables
+import json
 
 # --- NEW: Imports for Gemini ---
 import google.generativeai as genai
 from dotenv import load_dotenv # NEW: To load .env file
 
+from backend.services.chat_cache import DEFAULT_CONTEXT, chat_cache_from_env, make_cache_key
+from backend.services.metrics import EndpointTimings, ValueRecorder
+from backend.services.chat_sessions import estimate_tokens, session_store_from_env
+from backend.services.chatbot import FAQAnswerer
+from backend.services.blockchain_hash import report_anchor_from_env, report_digest, verify_inclusion
+from backend.services.singleflight import SingleFlight
+from backend.services.uv_service import uv_service_from_env
+from backend.services.firebase_service import persistence_from_env
+from backend.services.report_history import ReportHistoryStore
+from backend.services.llm_limiter import AdmissionRejected, llm_admission_from_env
+from backend.services.fake_llm import FakeGeminiModel
+from backend.services.profiler import install_fastapi, profiler_from_env
+from google.api_core.exceptions import ResourceExhausted
+
 # --- NEW: Load .env file ---
 # This reads your .env file and makes the API key available
 load_dotenv()
@@ -21,8 +37,40 @@ load_dotenv()
 # --- NEW: Global state for Gemini Model ---
 gemini_model = None
 
+# --- Chat answer cache (see backend/services/chat_cache.py) ---
+chat_cache = chat_cache_from_env()
+chat_flights = SingleFlight()
+
+# --- Local FAQ answers for common per-condition questions (see backend/services/chatbot.py) ---
+faq_answerer = FAQAnswerer.from_env()
+local_replies = {"requests": 0, "greeting": 0, "faq": 0, "cache": 0}
+
+# --- Conversation sessions (see backend/services/chat_sessions.py) ---
+chat_sessions = session_store_from_env()
+prompt_tokens = ValueRecorder()
+
+# --- Admission control in front of Gemini (see backend/services/llm_limiter.py) ---
+llm_admission = llm_admission_from_env()
+
+# --- Batched Merkle anchoring of report hashes (see backend/services/blockchain_hash.py) ---
+report_anchor = report_anchor_from_env()
+
+# --- Cached UV index lookups (see backend/services/uv_service.py) ---
+uv_service = uv_service_from_env()
+
+# --- Write-behind persistence of reports / predictions (see backend/services/firebase_service.py) ---
+persistence = persistence_from_env()
+
+# --- On-demand profiling (POST /debug/profile, see backend/services/profiler.py) ---
+profiler = profiler_from_env()
+
+# --- Chat latency metrics (served at /chat/stats) ---
+chat_timings = EndpointTimings()
+stream_timings = EndpointTimings()
+
 # --- NEW: Startup Event to Load Model ---
-# This runs once when you start the server
+# This runs once when you start the server.
+# backend/aio_server.py enters this same lifespan from its own.
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     print("Loading Google Gemini model...")
@@ -30,7 +78,12 @@ async def lifespan(app: FastAPI):
     
     # --- NEW: Configure Gemini API Key ---
     api_key = os.getenv("GOOGLE_API_KEY")
-    if not api_key:
+    fake_llm_url = os.getenv("FAKE_LLM_URL")
+    if fake_llm_url:
+        # Load tests / offline dev: talk to backend/services/fake_llm.py instead
+        gemini_model = FakeGeminiModel(fake_llm_url)
+        print(f"Using fake LLM at {fake_llm_url}. Server is ready.")
+    elif not api_key:
         print("ERROR: GOOGLE_API_KEY not found in .env file.")
         # You could raise an exception here to stop the server
     else:
@@ -40,9 +93,23 @@ async def lifespan(app: FastAPI):
         # Using 1.5-flash for speed, which is good for chat
         gemini_model = genai.GenerativeModel('models/gemini-pro-latest')
         print("Gemini model loaded. Server is ready.")
+
+    # Pre-warm the chat cache with vetted FAQ answers, if configured
+    warm_file = os.getenv("CHAT_CACHE_WARM_FILE")
+    if warm_file and os.path.exists(warm_file):
+        loaded = chat_cache.prewarm(warm_file, PROMPT_VERSION)
+        print(f"Chat cache pre-warmed with {loaded} answers from {warm_file}.")
+
+    persistence.start()
     
     yield
     # Code to run on shutdown (if any)
+    await report_anchor.flush()  # don't leave callers waiting on a half-filled batch
+    await persistence.close()  # commits whatever is still buffered
+    chat_cache.close()
+    await uv_service.aclose()
+    if isinstance(gemini_model, FakeGeminiModel):
+        await gemini_model.aclose()
     print("Server shutting down.")
 
 
@@ -62,19 +129,30 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+install_fastapi(app, profiler)
 
 # --- (Pydantic Models are unchanged) ---
 class ChatRequest(BaseModel):
     message: str
     context: str | None = None
+    session_id: str | None = None # Omit to start a new conversation
 
 class ChatResponse(BaseModel):
     reply: str
+    session_id: str | None = None
 
 class TriageResponse(BaseModel):
     condition: str
     confidence: float
 
+class ReportHashRequest(BaseModel):
+    report_id: str = "unknown"
+    diagnosis: dict = {}
+
+class ReportVerifyRequest(ReportHashRequest):
+    root: str
+    proof: list[tuple[str, str]]
+
 
 # --- (Root Endpoint is unchanged) ---
 @app.get("/")
@@ -100,100 +178,367 @@ async def quick_analysis(image: UploadFile = File(...)):
     return TriageResponse(**mock_data)
 
 
+# --- Prompt Engineering ---
+# This is how we make the bot smart and safe.
+# We give it a role, rules, and context.
+# Bump PROMPT_VERSION whenever the prompt text changes so cached answers
+# generated under the old instructions are never served.
+PROMPT_VERSION = "2"
+
+SYSTEM_PROMPT = (
+    "You are DermaAI, an AI assistant for a dermatology app. You are NOT a doctor. "
+    "Your purpose is to answer the user's *specific question* with general, educational information about skin conditions. "
+    "Always recommend consulting a healthcare professional for diagnosis and treatment."
+    "Keep answers concise and directly related to the user's question."
+    "**ABSOLUTELY DO NOT answer any questions unrelated to the skin condition context.** This includes math problems, general knowledge, creative writing, or any other topic. "
+    "If the user asks an off-topic question, politely state that you can only discuss the provided skin condition analysis and cannot answer unrelated questions. "
+)
+
+
+def build_prompt(context: str, user_message: str, history: str = "") -> str:
+    # SYSTEM_PROMPT always comes first and never changes, so every request
+    # shares the same prompt prefix; the per-session history follows it.
+    history_block = f"{history}\n\n" if history else ""
+    return (
+        f"{SYSTEM_PROMPT}\n\n"
+        f"{history_block}"
+        f"CONTEXT: The preliminary analysis result is '{context}'.\n"
+        f"USER'S SPECIFIC QUESTION: '{user_message}'\n\n"
+        f"INSTRUCTIONS: Answer *only* the user's specific question concisely, using the context '{context}' if relevant. "
+        f"Do NOT give a general overview of '{context}' unless explicitly asked (e.g., 'Tell me about Psoriasis'). "
+        f"If discussing treatments/remedies, mention only general categories (like moisturizers, OTC types if applicable, lifestyle) and strongly emphasize consulting a doctor. Do not suggest prescriptions or dosages. "
+        f"Use Markdown for formatting (headings `##`, bullets `- `) if needed for clarity on complex answers, but keep it minimal for simple questions."
+    )
+
+
+def simple_reply_for(user_message: str) -> str | None:
+    # Handle simple greetings/closings directly without context overload
+    if user_message.lower() in ['hi', 'hello', 'hey', 'greetings']:
+        return "Hello! How can I help you today regarding your analysis?"
+    if user_message.lower() in ['thanks', 'thank you', 'ok thanks', 'bye']:
+        return "You're welcome! Remember to consult a doctor for any medical concerns."
+    return None
+
+
+def local_reply_for(context: str, user_message: str, history: str = "") -> str | None:
+    """
+    Replies we can give without calling Gemini: greetings, vetted FAQ answers
+    and cached answers. Cached answers are only used for the first question of a
+    conversation, since later answers depend on what was said before.
+    """
+    local_replies["requests"] += 1
+    reply = simple_reply_for(user_message)
+    if reply:
+        print(f"Handling simple message directly: '{reply}'")
+        local_replies["greeting"] += 1
+        return reply
+
+    reply = faq_answerer.answer(user_message, context)
+    if reply is not None:
+        print("Answering from the local FAQ knowledge base.")
+        local_replies["faq"] += 1
+        return reply
+
+    if history:
+        return None
+    reply = chat_cache.get(context, user_message, PROMPT_VERSION)
+    if reply is not None:
+        print("Serving reply from chat cache.")
+        local_replies["cache"] += 1
+    return reply
+
+
+def prompt_for(context: str, user_message: str, history: str) -> str:
+    prompt = build_prompt(context, user_message, history)
+    prompt_tokens.record(estimate_tokens(prompt))
+    return prompt
+
+
+async def ask_gemini(context: str, user_message: str, history: str = "") -> str:
+    # --- Call the Gemini API ---
+    async with llm_admission.slot():
+        print("Sending focused prompt to Gemini...")
+        started = time.perf_counter()
+        try:
+            response = await gemini_model.generate_content_async(prompt_for(context, user_message, history))
+        except ResourceExhausted:
+            llm_admission.upstream_rate_limited()
+            raise AdmissionRejected(429, llm_admission.estimated_wait(), "Upstream LLM rate limit reached.")
+        reply = response.text
+    if not history:
+        chat_cache.put(context, user_message, PROMPT_VERSION, reply, time.perf_counter() - started)
+    print(f"Gemini reply received: '{reply[:50]}...'")
+    return reply
+
+
+def raise_rejected(e: AdmissionRejected):
+    print(f"Chat request rejected ({e.status_code}): {e.reason}")
+    raise HTTPException(status_code=e.status_code, detail=e.reason, headers={"Retry-After": str(e.retry_after)})
+
+
 @app.post("/chat", response_model=ChatResponse)
 async def handle_chat(request: ChatRequest):
     """
-    --- MODIFIED: This function now calls the Gemini API ---
+    Answers a chat message: greetings and common FAQ questions locally,
+    repeated questions from the answer cache, everything else through Gemini.
     """
-    global gemini_model
+    started = time.perf_counter()
     user_message = request.message
-    context = request.context or "an un-analyzed image" # Default context
+    context = request.context or DEFAULT_CONTEXT
 
     print(f"Chat message received: '{user_message}' with context: '{context}'")
 
     if not gemini_model:
         raise HTTPException(status_code=500, detail="Gemini model is not initialized. Check API key.")
 
-    # --- NEW: Prompt Engineering ---
-    # This is how we make the bot smart and safe.
-    # We give it a role, rules, and context.
-    # Inside the handle_chat function
-
-    # --- NEW: More Focused Prompt Engineering ---
-    system_prompt = (
-        "You are DermaAI, an AI assistant for a dermatology app. You are NOT a doctor. "
-        "Your purpose is to answer the user's *specific question* with general, educational information about skin conditions. "
-        "Always recommend consulting a healthcare professional for diagnosis and treatment."
-        "Keep answers concise and directly related to the user's question."
-        "**ABSOLUTELY DO NOT answer any questions unrelated to the skin condition context.** This includes math problems, general knowledge, creative writing, or any other topic. "
-        "If the user asks an off-topic question, politely state that you can only discuss the provided skin condition analysis and cannot answer unrelated questions. "
-    )
+    session = chat_sessions.get_or_create(request.session_id)
+    history = chat_sessions.history_text(session)
 
-    # Handle simple greetings/closings directly without context overload
-    simple_reply = None
-    if user_message.lower() in ['hi', 'hello', 'hey', 'greetings']:
-        simple_reply = "Hello! How can I help you today regarding your analysis?"
-    elif user_message.lower() in ['thanks', 'thank you', 'ok thanks', 'bye']:
-        simple_reply = "You're welcome! Remember to consult a doctor for any medical concerns."
+    reply = local_reply_for(context, user_message, history)
+    if reply is None:
+        try:
+            if history:
+                reply = await ask_gemini(context, user_message, history)
+            else:
+                # Identical first questions arriving together share one Gemini call
+                key = make_cache_key(context, user_message, PROMPT_VERSION)
+                reply = await chat_flights.do(key, lambda: ask_gemini(context, user_message))
+
+        except AdmissionRejected as e:
+            raise_rejected(e)
+        except Exception as e:
+            print(f"ERROR: Gemini API call failed: {e}")
+            raise HTTPException(status_code=500, detail="Error communicating with the AI model.")
+
+    session.add_turn(user_message, reply)
+
+    # The whole body goes out at once, so first byte == last byte here.
+    elapsed = time.perf_counter() - started
+    chat_timings.record(elapsed, elapsed)
+    return ChatResponse(reply=reply, session_id=session.id)
+
+
+def sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
 
-    if simple_reply:
-        reply = simple_reply
-        print(f"Handling simple message directly: '{reply}'")
-    else:
-        # If it's not a simple greeting, build the full prompt for Gemini
-        full_prompt = (
-            f"{system_prompt}\n\n"
-            f"CONTEXT: The preliminary analysis result is '{context}'.\n"
-            f"USER'S SPECIFIC QUESTION: '{user_message}'\n\n"
-            f"INSTRUCTIONS: Answer *only* the user's specific question concisely, using the context '{context}' if relevant. "
-            f"Do NOT give a general overview of '{context}' unless explicitly asked (e.g., 'Tell me about Psoriasis'). "
-            f"If discussing treatments/remedies, mention only general categories (like moisturizers, OTC types if applicable, lifestyle) and strongly emphasize consulting a doctor. Do not suggest prescriptions or dosages. "
-            f"Use Markdown for formatting (headings `##`, bullets `- `) if needed for clarity on complex answers, but keep it minimal for simple questions."
-        )
 
+async def stream_local_reply(session, user_message: str, reply: str, started: float):
+    yield sse_event("chunk", {"text": reply})
+    session.add_turn(user_message, reply)
+    elapsed = time.perf_counter() - started
+    stream_timings.record(elapsed, elapsed)
+    yield sse_event("done", {"reply": reply, "session_id": session.id})
+
+
+async def stream_gemini_reply(http_request: Request, session, context: str, user_message: str, history: str, started: float):
+    """
+    Forwards Gemini chunks as SSE events as they arrive. Stops pulling from the
+    upstream stream as soon as the client goes away; Starlette also cancels
+    this generator on disconnect, which lands in the `finally` below.
+    """
+    parts = []
+    first_chunk_at = None
+    completed = False
+    try:
+        # The admission slot was taken in handle_chat_stream; AdmittedStreamingResponse gives it back.
+        print("Streaming focused prompt to Gemini...")
+        response = await gemini_model.generate_content_async(prompt_for(context, user_message, history), stream=True)
+        async for chunk in response:
+            if await http_request.is_disconnected():
+                break
+            text = chunk.text
+            if not text:
+                continue
+            if first_chunk_at is None:
+                first_chunk_at = time.perf_counter()
+            parts.append(text)
+            yield sse_event("chunk", {"text": text})
+        else:
+            completed = True
+    except Exception as e:
+        completed = True  # finished, just not successfully
+        if isinstance(e, ResourceExhausted):
+            llm_admission.upstream_rate_limited()
+        print(f"ERROR: Gemini streaming call failed: {e}")
+        yield sse_event("error", {"detail": "Error communicating with the AI model."})
+        return
+    finally:
+        if not completed:
+            stream_timings.cancelled += 1
+            print("Client disconnected; Gemini stream cancelled.")
+    if not completed:
+        return  # partial reply: nothing to cache, record or send
+
+    reply = "".join(parts)
+    finished = time.perf_counter()
+    # Only a complete first answer is worth caching.
+    if not history:
+        chat_cache.put(context, user_message, PROMPT_VERSION, reply, finished - started)
+    session.add_turn(user_message, reply)
+    stream_timings.record((first_chunk_at or finished) - started, finished - started)
+    yield sse_event("done", {"reply": reply, "session_id": session.id})
+
+
+class AdmittedStreamingResponse(StreamingResponse):
+    """
+    Holds an LLM admission slot for the life of the response and releases it
+    however the response ends, including when the body never starts (client
+    gone before the first send, or the response failing to start).
+    """
+
+    def __init__(self, content, release, **kwargs):
+        super().__init__(content, **kwargs)
+        self._release = release
+
+    async def __call__(self, scope, receive, send):
         try:
-            # --- Call the Gemini API ---
-            print("Sending focused prompt to Gemini...")
-            # Make sure gemini_model is initialized before calling this
-            if not gemini_model:
-                 raise HTTPException(status_code=500, detail="Gemini model is not initialized.")
+            await super().__call__(scope, receive, send)
+        finally:
+            self._release()
 
-            response = await gemini_model.generate_content_async(full_prompt)
-            reply = response.text
-            print(f"Gemini reply received: '{reply[:50]}...'")
 
-        except Exception as e:
-            print(f"ERROR: Gemini API call failed: {e}")
-            raise HTTPException(status_code=500, detail="Error communicating with the AI model.")
+@app.post("/chat/stream")
+async def handle_chat_stream(request: ChatRequest, http_request: Request):
+    """
+    Streaming variant of /chat. Emits `chunk` events with partial text, then a
+    final `done` event carrying the full reply (or an `error` event).
+    """
+    started = time.perf_counter()
+    user_message = request.message
+    context = request.context or DEFAULT_CONTEXT
 
-    # --- Return the reply (either simple or from Gemini) ---
-    return ChatResponse(reply=reply)
+    print(f"Streaming chat message received: '{user_message}' with context: '{context}'")
 
-# Make sure this return is outside the try/except block if it was moved
-# This part below should NOT be inside the handle_chat function, it's the server run command
+    if not gemini_model:
+        raise HTTPException(status_code=500, detail="Gemini model is not initialized. Check API key.")
 
-# # --- Run the server ---
-# if __name__ == "__main__":
-#  print("Starting FastAPI server on http://localhost:8001...")
-#  uvicorn.run("main_server:app", host="0.0.0.0", port=8001, reload=True)
+    session = chat_sessions.get_or_create(request.session_id)
+    history = chat_sessions.history_text(session)
+
+    # Stop proxies (nginx, ngrok) from buffering the stream
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    reply = local_reply_for(context, user_message, history)
+    if reply is not None:
+        body = stream_local_reply(session, user_message, reply, started)
+        return StreamingResponse(body, media_type="text/event-stream", headers=headers)
 
     try:
-        # --- NEW: Call the Gemini API ---
-        print("Sending prompt to Gemini...")
-        response = await gemini_model.generate_content_async(full_prompt)
-        
-        reply = response.text
-        print(f"Gemini reply received: '{reply[:50]}...'")
-        
-        return ChatResponse(reply=reply)
+        await llm_admission.acquire()
+    except AdmissionRejected as e:
+        raise_rejected(e)
+    body = stream_gemini_reply(http_request, session, context, user_message, history, started)
+    return AdmittedStreamingResponse(body, llm_admission.release, media_type="text/event-stream", headers=headers)
+
+
+@app.get("/chat/stats")
+def chat_stats():
+    """Share served locally, FAQ/cache hit rates, coalesced calls, LLM queue, sessions, prompt size and latency."""
+    served_locally = local_replies["greeting"] + local_replies["faq"] + local_replies["cache"]
+    return {
+        "served_locally": dict(
+            local_replies,
+            fraction=served_locally / local_replies["requests"] if local_replies["requests"] else 0.0,
+        ),
+        "faq": faq_answerer.stats(),
+        "cache": chat_cache.stats(),
+        "single_flight": chat_flights.stats(),
+        "admission": llm_admission.stats(),
+        "sessions": chat_sessions.stats(),
+        "prompt_tokens": prompt_tokens.summary(),
+        "chat": chat_timings.summary(),
+        "chat_stream": stream_timings.summary(),
+    }
+
+
+@app.get("/uv")
+async def uv_index(lat: float, lon: float):
+    """UV index for a location, cached per grid cell."""
+    try:
+        return await uv_service.get(lat, lon)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except httpx.HTTPError as e:
+        raise HTTPException(status_code=502, detail=f"UV provider unavailable: {e}")
 
-    except Exception as e:
-        print(f"ERROR: Gemini API call failed: {e}")
-        raise HTTPException(status_code=500, detail="Error communicating with the AI model.")
+
+@app.get("/persistence/stats")
+def persistence_stats():
+    return persistence.stats()
+
+
+# --- Report history (see backend/services/report_history.py) ---
+def history_store() -> ReportHistoryStore:
+    if not isinstance(persistence.backend, ReportHistoryStore):
+        raise HTTPException(status_code=501, detail="Report history needs PERSISTENCE_BACKEND=history.")
+    return persistence.backend
+
+
+@app.get("/reports")
+def list_reports(user_id: str | None = None, stage1: str | None = None, stage2: str | None = None,
+                 severity: str | None = None, since: float | None = None, until: float | None = None,
+                 limit: int = 50, cursor: str | None = None):
+    """
+    Past reports and predictions, newest first, filtered by patient, class,
+    severity and time range (epoch seconds). Pass `next_cursor` as `cursor`
+    for the next page.
+    """
+    try:
+        return history_store().query(user_id=user_id, stage1=stage1, stage2=stage2, severity=severity,
+                                     since=since, until=until, limit=limit, cursor=cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.get("/reports/{record_id}")
+def get_report(record_id: str):
+    record = history_store().get(record_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail="Report not found.")
+    return record
+
+
+@app.get("/reports/{record_id}/heatmap")
+def get_report_heatmap(record_id: str):
+    image = history_store().heatmap(record_id)
+    if image is None:
+        raise HTTPException(status_code=404, detail="No heatmap for this report.")
+    return Response(content=image, media_type="image/jpeg")
+
+
+@app.get("/uv/stats")
+def uv_stats():
+    return uv_service.stats()
+
+
+@app.post("/hash_report")
+async def hash_report_endpoint(request: ReportHashRequest):
+    """
+    Hashes a finished report and anchors it on chain (simulated for now) as
+    part of the next Merkle batch. Keep the returned root + proof with the
+    report; /verify_report checks them later.
+    """
+    receipt = await report_anchor.submit(report_digest(request.report_id, request.diagnosis))
+    return {"report_id": request.report_id, **receipt}
+
+
+@app.post("/verify_report")
+def verify_report_endpoint(request: ReportVerifyRequest):
+    """Checks that a report is included under `root` and that the root was anchored."""
+    digest = report_digest(request.report_id, request.diagnosis)
+    included = verify_inclusion(digest, request.proof, request.root)
+    anchored = report_anchor.chain_client.is_anchored(request.root)
+    return {"report_id": request.report_id, "hash": digest, "included": included,
+            "anchored": anchored, "valid": included and anchored}
+
+
+@app.get("/hash_report/stats")
+def anchor_stats():
+    return report_anchor.stats()
 
 
 # --- Run the server ---
 if __name__ == "__main__":
     print("Starting FastAPI server on http://localhost:8001...")
     # reload=True is great for development. It auto-restarts the server when you save.
-    uvicorn.run("main_server:app", host="0.0.0.0", port=8001, reload=True)
\ No newline at end of file
+    # Run from the repo root (python -m backend.main_server) so `backend.services` resolves.
+    uvicorn.run("backend.main_server:app", host="0.0.0.0", port=8001, reload=True)
\ No newline at end of file
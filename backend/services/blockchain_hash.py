@@ -1,7 +1,205 @@
 
 # Placeholder: compute and (optionally) send hash to Polygon testnet using server-side key.
 # For the hackathon, we suggest only demonstrating the hash generation and showing a simulated tx id.
+#
+# One transaction per report does not scale in volume or gas cost, so reports
+# are anchored in batches: hashes collected over a short window (or until the
+# batch is full) become the leaves of a Merkle tree, only the root goes on
+# chain, and each report gets a compact inclusion proof (log2(batch) hashes)
+# that `verify_inclusion` checks against the anchored root.
+
+import asyncio
+import hashlib
+import itertools
+import os
+import time
+
+from backend.services.report_hash import canonical_digest
+
+# Domain separation so a leaf can never be passed off as an inner node
+_LEAF_PREFIX = b"\x00"
+_NODE_PREFIX = b"\x01"
+
 
 def submit_hash_to_chain(hash_hex):
     # Implement using web3 or etherscan APIs / Alchemy etc. Keep private key server-side.
     return {"tx": "SIMULATED_TX_ID", "hash": hash_hex}
+
+
+def report_digest(report_id, diagnosis):
+    """Canonical SHA-256 of the report id and diagnosis (see report_hash.py)."""
+    return canonical_digest({"report_id": report_id, "diagnosis": diagnosis})
+
+
+# --- Merkle tree ---
+def _leaf(hash_hex):
+    return hashlib.sha256(_LEAF_PREFIX + bytes.fromhex(hash_hex)).digest()
+
+
+def _node(left, right):
+    return hashlib.sha256(_NODE_PREFIX + left + right).digest()
+
+
+def build_merkle_levels(hashes_hex):
+    """
+    All tree levels, leaves first. An odd node at the end of a level is carried
+    up unchanged (rather than paired with a copy of itself), so two different
+    batches can never produce the same root.
+    """
+    if not hashes_hex:
+        raise ValueError("Cannot build a Merkle tree without leaves.")
+    levels = [[_leaf(h) for h in hashes_hex]]
+    while len(levels[-1]) > 1:
+        level = levels[-1]
+        parents = [_node(level[i], level[i + 1]) for i in range(0, len(level) - 1, 2)]
+        if len(level) % 2:
+            parents.append(level[-1])
+        levels.append(parents)
+    return levels
+
+
+def inclusion_proof(levels, index):
+    """Sibling hashes from leaf to root as [["L" | "R", hex], ...] (side of the sibling)."""
+    proof = []
+    for level in levels[:-1]:
+        sibling = index ^ 1
+        if sibling < len(level):
+            proof.append(["L" if sibling < index else "R", level[sibling].hex()])
+        index //= 2
+    return proof
+
+
+def verify_inclusion(hash_hex, proof, root_hex):
+    """True if `hash_hex` is a leaf of the tree with root `root_hex` according to `proof`."""
+    try:
+        node = _leaf(hash_hex)
+        for side, sibling_hex in proof:
+            sibling = bytes.fromhex(sibling_hex)
+            node = _node(sibling, node) if side == "L" else _node(node, sibling)
+    except (ValueError, TypeError):
+        return False
+    return node.hex() == root_hex
+
+
+# --- Chain clients ---
+class ChainClient:
+    """Where Merkle roots are anchored. Implement `submit_root` for a real chain (web3, Alchemy, ...)."""
+
+    def submit_root(self, root_hex, leaf_count):
+        raise NotImplementedError
+
+    def is_anchored(self, root_hex):
+        raise NotImplementedError
+
+
+class SimulatedChainClient(ChainClient):
+    """In-memory chain for local runs and tests; optional latency mimics block confirmation."""
+
+    def __init__(self, latency_seconds=0.0):
+        self.latency_seconds = latency_seconds
+        self.roots = {}
+        self._block_numbers = itertools.count(1)
+
+    def submit_root(self, root_hex, leaf_count):
+        if self.latency_seconds:
+            time.sleep(self.latency_seconds)
+        block = next(self._block_numbers)
+        record = {"tx": f"SIMULATED_TX_{block}", "block": block, "root": root_hex, "leaf_count": leaf_count}
+        self.roots[root_hex] = record
+        return record
+
+    def is_anchored(self, root_hex):
+        return root_hex in self.roots
+
+
+# --- Batching anchor service ---
+class MerkleAnchor:
+    """
+    `await anchor.submit(hash_hex)` returns once the batch containing the hash
+    has been anchored, with the root, the tx and the report's inclusion proof.
+    A batch closes after `max_wait_seconds` or at `max_batch_size` hashes,
+    whichever comes first.
+    """
+
+    def __init__(self, chain_client, max_batch_size=256, max_wait_seconds=2.0):
+        self.chain_client = chain_client
+        self.max_batch_size = max_batch_size
+        self.max_wait_seconds = max_wait_seconds
+        self._pending = []  # [(hash_hex, future)]
+        self._timer = None
+        self._flushes = set()  # full-batch flushes in flight (strong refs until done)
+        self.batches = 0
+        self.anchored_hashes = 0
+
+    async def submit(self, hash_hex):
+        bytes.fromhex(hash_hex)  # reject malformed hashes before they can poison a batch
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((hash_hex, future))
+        if len(self._pending) >= self.max_batch_size:
+            # Its own task, so cancelling this caller cannot strand the rest of the batch
+            task = asyncio.ensure_future(self.flush())
+            self._flushes.add(task)
+            task.add_done_callback(self._flushes.discard)
+        elif self._timer is None:
+            self._timer = asyncio.ensure_future(self._flush_later())
+        return await future
+
+    async def flush(self):
+        """Anchor whatever is pending now (also called on shutdown)."""
+        if self._timer is not None and self._timer is not asyncio.current_task():
+            self._timer.cancel()
+        self._timer = None
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+
+        hashes = [h for h, _ in batch]
+        try:
+            levels = build_merkle_levels(hashes)
+            root_hex = levels[-1][0].hex()
+            # Real chain clients block on network I/O; keep them off the event loop
+            tx = await asyncio.get_running_loop().run_in_executor(
+                None, self.chain_client.submit_root, root_hex, len(hashes)
+            )
+        except BaseException as e:
+            # Cancelled mid-anchor (e.g. at shutdown): nobody may be left waiting
+            error = e if isinstance(e, Exception) else RuntimeError("Anchoring was interrupted.")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(error)
+            if error is not e:
+                raise
+            return
+
+        self.batches += 1
+        self.anchored_hashes += len(hashes)
+        for index, (hash_hex, future) in enumerate(batch):
+            if not future.done():
+                future.set_result({
+                    "hash": hash_hex,
+                    "root": root_hex,
+                    "proof": inclusion_proof(levels, index),
+                    "tx": tx.get("tx"),
+                    "batch_size": len(hashes),
+                })
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.max_wait_seconds)
+        await self.flush()
+
+    def stats(self):
+        return {
+            "pending": len(self._pending),
+            "batches": self.batches,
+            "anchored_hashes": self.anchored_hashes,
+            "mean_batch_size": self.anchored_hashes / self.batches if self.batches else 0.0,
+        }
+
+
+def report_anchor_from_env():
+    """MerkleAnchor on the simulated chain, sized by ANCHOR_BATCH_SIZE / ANCHOR_BATCH_SECONDS."""
+    return MerkleAnchor(
+        SimulatedChainClient(),
+        max_batch_size=int(os.getenv("ANCHOR_BATCH_SIZE", "256")),
+        max_wait_seconds=float(os.getenv("ANCHOR_BATCH_SECONDS", "2.0")),
+    )
@@ -0,0 +1,240 @@
+# Answer cache for the /chat endpoint.
+# Most chat traffic is the same handful of questions per condition ("is psoriasis
+# contagious", "what is BCC"), so we keep Gemini replies keyed on
+# (prompt version, analysis context, normalized question).
+# Memory tier: LRU + TTL. Optional persistent tier: a small SQLite file, so a
+# restart does not throw away everything we already paid for. Writes to it
+# go through a bounded queue to a writer thread (batched commits, never on
+# the event loop); the table is capped at persist_max_entries, oldest first.
+
+import hashlib
+import json
+import os
+import queue
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+# What /chat answers about when the request carries no analysis result.
+# Cache keys include the context, so prewarmed context-less answers use it too.
+DEFAULT_CONTEXT = "an un-analyzed image"
+
+_PUNCTUATION = re.compile(r"[^\w\s]")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_question(text):
+    """Lower-case, strip punctuation and collapse whitespace ("What is BCC?" -> "what is bcc")."""
+    text = unicodedata.normalize("NFKC", text or "").lower()
+    text = _PUNCTUATION.sub(" ", text)
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+def make_cache_key(context, question, prompt_version):
+    raw = "\x1f".join([prompt_version, normalize_question(context), normalize_question(question)])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class ChatCache:
+    """
+    LRU + TTL cache of chat replies with an optional SQLite-backed second tier.
+
+    Every entry remembers how long the upstream call took, so each hit can be
+    credited with the latency it saved.
+    """
+
+    def __init__(self, max_entries=1024, ttl_seconds=24 * 3600, persist_path=None,
+                 persist_max_entries=10000, max_pending_writes=1000):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.persist_max_entries = persist_max_entries
+        self._entries = OrderedDict()  # key -> (reply, expires_at, upstream_seconds)
+        self._db = None  # read connection; the writer thread has its own
+        self._writes = queue.Queue(maxsize=max_pending_writes)
+        self._writer = None
+        if persist_path:
+            self._db = sqlite3.connect(persist_path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS chat_cache ("
+                " key TEXT PRIMARY KEY, reply TEXT NOT NULL,"
+                " upstream_seconds REAL, expires_at REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS chat_cache_expires ON chat_cache (expires_at)")
+            self._db.commit()
+            self._writer = threading.Thread(target=self._write_loop, args=(persist_path,),
+                                            name="chat-cache-writer", daemon=True)
+            self._writer.start()
+
+        self.hits = 0
+        self.persistent_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.persist_evictions = 0
+        self.dropped_writes = 0
+        self.saved_upstream_seconds = 0.0
+        self._upstream_total = 0.0
+        self._upstream_calls = 0
+
+    # --- Lookups ---
+    def get(self, context, question, prompt_version):
+        key = make_cache_key(context, question, prompt_version)
+        now = time.time()
+
+        entry = self._entries.get(key)
+        if entry is not None and entry[1] <= now:
+            del self._entries[key]
+            entry = None
+        if entry is None and self._db is not None:
+            entry = self._load_persistent(key, now)
+            if entry is not None:
+                self.persistent_hits += 1
+                self._store_memory(key, entry)
+
+        if entry is None:
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        self.saved_upstream_seconds += entry[2] if entry[2] is not None else self._mean_upstream()
+        return entry[0]
+
+    def put(self, context, question, prompt_version, reply, upstream_seconds=None):
+        key = make_cache_key(context, question, prompt_version)
+        entry = (reply, time.time() + self.ttl_seconds, upstream_seconds)
+        if upstream_seconds is not None:
+            self._upstream_total += upstream_seconds
+            self._upstream_calls += 1
+        self._store_memory(key, entry)
+        if self._db is not None:
+            self._enqueue((key, entry))
+
+    def prewarm(self, path, prompt_version):
+        """
+        Load vetted question/answer pairs from a JSON file:
+        [{"context": "Psoriasis", "question": "Is it contagious?", "reply": "..."}, ...]
+        Returns the number of entries loaded.
+        """
+        with open(path, "r", encoding="utf-8") as f:
+            pairs = json.load(f)
+        for pair in pairs:
+            self.put(pair.get("context") or DEFAULT_CONTEXT, pair["question"], prompt_version, pair["reply"])
+        return len(pairs)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "persistent_hits": self.persistent_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "persist_evictions": self.persist_evictions,
+            "pending_writes": self._writes.qsize(),
+            "dropped_writes": self.dropped_writes,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "saved_upstream_seconds": round(self.saved_upstream_seconds, 3),
+            "mean_upstream_seconds": round(self._mean_upstream(), 3),
+        }
+
+    def flush(self):
+        """Block until every queued write is committed."""
+        if self._writer is not None:
+            self._writes.join()
+
+    def close(self):
+        """Commit queued writes and stop the writer thread."""
+        if self._writer is not None:
+            self._writes.put(None)
+            self._writer.join()
+            self._writer = None
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    # --- Internals ---
+    def _store_memory(self, key, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _load_persistent(self, key, now):
+        row = self._db.execute(
+            "SELECT reply, expires_at, upstream_seconds FROM chat_cache WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        if row[1] <= now:
+            self._enqueue((key, None))
+            return None
+        return (row[0], row[1], row[2])
+
+    def _enqueue(self, write):
+        # The persistent tier is best effort: never make a request wait on the disk
+        try:
+            self._writes.put_nowait(write)
+        except queue.Full:
+            self.dropped_writes += 1
+
+    def _write_loop(self, path):
+        """Writer thread: commit whatever is queued as one transaction, then trim the table."""
+        conn = sqlite3.connect(path)
+        stop = False
+        while not stop:
+            batch = [self._writes.get()]
+            while True:
+                try:
+                    batch.append(self._writes.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                with conn:
+                    for write in batch:
+                        if write is None:
+                            stop = True
+                        elif write[1] is None:
+                            conn.execute("DELETE FROM chat_cache WHERE key = ?", (write[0],))
+                        else:
+                            key, (reply, expires_at, upstream_seconds) = write
+                            conn.execute(
+                                "INSERT OR REPLACE INTO chat_cache (key, reply, upstream_seconds, expires_at)"
+                                " VALUES (?, ?, ?, ?)",
+                                (key, reply, upstream_seconds, expires_at),
+                            )
+                    self._trim(conn)
+            except sqlite3.Error as e:
+                print(f"Chat cache write of {len(batch)} entries failed: {e}")
+            finally:
+                for _ in batch:
+                    self._writes.task_done()
+        conn.close()
+
+    def _trim(self, conn):
+        conn.execute("DELETE FROM chat_cache WHERE expires_at <= ?", (time.time(),))
+        excess = conn.execute("SELECT COUNT(*) FROM chat_cache").fetchone()[0] - self.persist_max_entries
+        if excess > 0:
+            conn.execute(
+                "DELETE FROM chat_cache WHERE key IN (SELECT key FROM chat_cache ORDER BY expires_at LIMIT ?)",
+                (excess,),
+            )
+            self.persist_evictions += excess
+
+    def _mean_upstream(self):
+        return self._upstream_total / self._upstream_calls if self._upstream_calls else 0.0
+
+
+def chat_cache_from_env():
+    """Build the cache from CHAT_CACHE_* environment variables (see backend/README.md)."""
+    cache = ChatCache(
+        max_entries=int(os.getenv("CHAT_CACHE_MAX_ENTRIES", "1024")),
+        ttl_seconds=float(os.getenv("CHAT_CACHE_TTL_SECONDS", str(24 * 3600))),
+        persist_path=os.getenv("CHAT_CACHE_DB") or None,
+        persist_max_entries=int(os.getenv("CHAT_CACHE_DB_MAX_ENTRIES", "10000")),
+    )
+    return cache
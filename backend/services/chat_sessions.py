@@ -0,0 +1,123 @@
+# Server-side chat sessions for /chat.
+# Each session keeps a short conversation history so follow-up questions
+# ("and is it contagious?") make sense, without letting prompts grow forever:
+#   - the store holds at most `max_sessions` sessions (LRU) and drops idle ones
+#   - each prompt gets the most recent turns that fit a token budget; older
+#     turns are folded into a one-line-per-turn summary that is itself capped
+
+import os
+import secrets
+import time
+from collections import OrderedDict
+
+
+def estimate_tokens(text):
+    """Rough token count (~4 characters per token for English); good enough for budgeting."""
+    return max(1, len(text) // 4)
+
+
+def _clip(text, limit):
+    text = " ".join(text.split())
+    return text if len(text) <= limit else text[: limit - 3] + "..."
+
+
+class ChatSession:
+    def __init__(self, session_id, max_summary_lines=8):
+        self.id = session_id
+        self.turns = []  # [(user message, reply)], oldest first
+        self.summary = []  # one short line per folded turn
+        self.max_summary_lines = max_summary_lines
+        self.last_used = time.monotonic()
+
+    def add_turn(self, user_message, reply):
+        self.turns.append((user_message, reply))
+        self.last_used = time.monotonic()
+
+    def history_text(self, token_budget):
+        """
+        Conversation so far, newest turns verbatim while they fit `token_budget`.
+        Turns that no longer fit are folded into the summary for good, so the
+        session's memory stays bounded too.
+        """
+        kept = []
+        used = 0
+        for user_message, reply in reversed(self.turns):
+            cost = estimate_tokens(user_message) + estimate_tokens(reply)
+            if used + cost > token_budget:
+                break
+            kept.append((user_message, reply))
+            used += cost
+        kept.reverse()
+
+        for user_message, reply in self.turns[: len(self.turns) - len(kept)]:
+            self.summary.append(f"- User asked: \"{_clip(user_message, 80)}\"; you answered: \"{_clip(reply, 100)}\"")
+        self.summary = self.summary[-self.max_summary_lines:]
+        self.turns = kept
+
+        lines = []
+        if self.summary:
+            lines.append("EARLIER IN THIS CONVERSATION (summary):")
+            lines.extend(self.summary)
+        if kept:
+            lines.append("RECENT MESSAGES:")
+            for user_message, reply in kept:
+                lines.append(f"User: {user_message}")
+                lines.append(f"DermaAI: {reply}")
+        return "\n".join(lines)
+
+
+class SessionStore:
+    def __init__(self, max_sessions=1000, idle_ttl_seconds=1800, history_token_budget=600):
+        self.max_sessions = max_sessions
+        self.idle_ttl_seconds = idle_ttl_seconds
+        self.history_token_budget = history_token_budget
+        self._sessions = OrderedDict()
+        self.created = 0
+        self.evicted = 0
+        self.expired = 0
+
+    def get_or_create(self, session_id=None):
+        """Return the live session for `session_id`, or a new one if it is unknown or expired."""
+        self._expire_idle()
+        session = self._sessions.get(session_id) if session_id else None
+        if session is None:
+            session = ChatSession(secrets.token_urlsafe(16))
+            self._sessions[session.id] = session
+            self.created += 1
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+                self.evicted += 1
+        session.last_used = time.monotonic()
+        self._sessions.move_to_end(session.id)
+        return session
+
+    def history_text(self, session):
+        return session.history_text(self.history_token_budget)
+
+    def stats(self):
+        return {
+            "active": len(self._sessions),
+            "max_sessions": self.max_sessions,
+            "created": self.created,
+            "evicted": self.evicted,
+            "expired": self.expired,
+        }
+
+    def _expire_idle(self):
+        # Sessions are kept in last-used order, so expired ones are at the front
+        cutoff = time.monotonic() - self.idle_ttl_seconds
+        while self._sessions:
+            oldest = next(iter(self._sessions.values()))
+            if oldest.last_used > cutoff:
+                break
+            self._sessions.popitem(last=False)
+            self.expired += 1
+
+
+def session_store_from_env():
+    """Build the store from CHAT_SESSION_* environment variables (see backend/README.md)."""
+    return SessionStore(
+        max_sessions=int(os.getenv("CHAT_SESSION_MAX", "1000")),
+        idle_ttl_seconds=float(os.getenv("CHAT_SESSION_IDLE_SECONDS", "1800")),
+        history_token_budget=int(os.getenv("CHAT_SESSION_HISTORY_TOKENS", "600")),
+    )
@@ -1,4 +1,3 @@
-
 # Minimal chatbot placeholder - this could be a small rule-based symptom assistant,
 # or a wrapper to a hosted LLM.
 def simple_chatbot(symptoms_text):
@@ -6,3 +5,147 @@ def simple_chatbot(symptoms_text):
     if "itch" in symptoms_text.lower():
         return "It might be dermatitis or eczema — please take clear photos and consult a doctor."
     return "Please provide more symptoms or upload an image for better diagnosis."
+
+
+# --- Local FAQ answerer ---
+# Answers the common per-condition questions ("is psoriasis contagious", "what is
+# BCC") from a vetted knowledge base (backend/data/faq_kb.json) without calling
+# the LLM. The condition comes from the question itself or from the analysis
+# context; the intent ("contagious", "treatment", ...) is matched with a small
+# in-memory TF-IDF index over example phrasings. Anything below the similarity
+# threshold falls through to Gemini.
+
+import json
+import math
+import os
+import time
+from collections import defaultdict
+
+from backend.services.chat_cache import normalize_question
+from backend.services.metrics import LatencyRecorder
+
+DEFAULT_KB_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "faq_kb.json")
+
+_STOPWORDS = {
+    "a", "an", "the", "it", "its", "this", "that", "these", "my", "i", "im", "me", "is", "are",
+    "am", "be", "of", "to", "for", "and", "or", "with", "about", "do", "does", "did", "have",
+    "has", "please", "you", "your", "can", "could", "would", "on", "in", "so", "there",
+}
+_SUFFIXES = ("ments", "ment", "ing", "able", "ed", "es", "s", "e")
+
+
+def _stem(word):
+    for suffix in _SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 4:
+            return word[: -len(suffix)]
+    return word
+
+
+def _terms(tokens):
+    return [_stem(t) for t in tokens if t not in _STOPWORDS]
+
+
+class FAQAnswerer:
+    def __init__(self, kb_path=DEFAULT_KB_PATH, min_similarity=0.7):
+        with open(kb_path, "r", encoding="utf-8") as f:
+            kb = json.load(f)
+        self.min_similarity = min_similarity
+        self.conditions = kb["conditions"]
+
+        # Condition aliases as token tuples, longest first, so "atopic dermatitis"
+        # wins over "dermatitis" and "basal cell carcinoma" over "basal cell".
+        self._aliases = sorted(
+            (
+                (tuple(normalize_question(alias).split()), key)
+                for key, condition in self.conditions.items()
+                for alias in condition["aliases"] + [condition["name"]]
+            ),
+            key=lambda item: -len(item[0]),
+        )
+
+        # TF-IDF over the example phrasings of each intent
+        phrasings = [(intent, _terms(normalize_question(text).split()))
+                     for intent, texts in kb["intents"].items() for text in texts]
+        doc_freq = defaultdict(int)
+        for _, terms in phrasings:
+            for term in set(terms):
+                doc_freq[term] += 1
+        self._idf = {term: math.log((1 + len(phrasings)) / (1 + df)) + 1 for term, df in doc_freq.items()}
+        # Words we have never seen ("diet", "2+2") weigh as much as the rarest known
+        # word, so a question that is mostly about something else scores low.
+        self._unknown_idf = math.log(1 + len(phrasings)) + 1
+        self._intents = []
+        self._postings = defaultdict(list)  # term -> [(phrasing index, weight)]
+        for index, (intent, terms) in enumerate(phrasings):
+            self._intents.append(intent)
+            for term, weight in self._vector(terms).items():
+                self._postings[term].append((index, weight))
+
+        self.lookups = 0
+        self.answered = 0
+        self.latency = LatencyRecorder()
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            kb_path=os.getenv("FAQ_KB_PATH", DEFAULT_KB_PATH),
+            min_similarity=float(os.getenv("FAQ_MIN_SIMILARITY", "0.7")),
+        )
+
+    def answer(self, question, context=None):
+        """Return a vetted answer, or None when the LLM should handle the question."""
+        started = time.perf_counter()
+        self.lookups += 1
+        reply = self._answer(question, context)
+        if reply is not None:
+            self.answered += 1
+        self.latency.record(time.perf_counter() - started)
+        return reply
+
+    def stats(self):
+        return {
+            "lookups": self.lookups,
+            "answered": self.answered,
+            "answered_fraction": self.answered / self.lookups if self.lookups else 0.0,
+            "latency": self.latency.summary(),
+        }
+
+    # --- Internals ---
+    def _answer(self, question, context):
+        tokens = normalize_question(question).split()
+        condition, tokens = self._find_condition(tokens)
+        if condition is None and context:
+            condition, _ = self._find_condition(normalize_question(context).split())
+        if condition is None:
+            return None
+
+        query = self._vector(_terms(tokens))
+        if not query:
+            return None
+        scores = defaultdict(float)
+        for term, weight in query.items():
+            for index, doc_weight in self._postings.get(term, ()):
+                scores[index] += weight * doc_weight
+        if not scores:
+            return None
+        best = max(scores, key=scores.get)
+        if scores[best] < self.min_similarity:
+            return None
+        return self.conditions[condition]["answers"].get(self._intents[best])
+
+    def _find_condition(self, tokens):
+        """First (longest) alias found in `tokens`; returns (condition, tokens without it)."""
+        for alias, condition in self._aliases:
+            size = len(alias)
+            for start in range(len(tokens) - size + 1):
+                if tuple(tokens[start:start + size]) == alias:
+                    return condition, tokens[:start] + tokens[start + size:]
+        return None, tokens
+
+    def _vector(self, terms):
+        counts = defaultdict(int)
+        for term in terms:
+            counts[term] += 1
+        vector = {term: (1 + math.log(n)) * self._idf.get(term, self._unknown_idf) for term, n in counts.items()}
+        norm = math.sqrt(sum(w * w for w in vector.values()))
+        return {term: w / norm for term, w in vector.items() if w} if norm else {}
@@ -0,0 +1,123 @@
+# Local stand-in for the Gemini API, for load tests and offline development.
+#
+# Run the fake upstream:
+#   FAKE_LLM_LATENCY_SECONDS=1.5 FAKE_LLM_REQUESTS_PER_MINUTE=60 \
+#     uvicorn backend.services.fake_llm:app --port 8090
+# and point the app server at it instead of Gemini:
+#   FAKE_LLM_URL=http://localhost:8090 uvicorn backend.main_server:app --port 8001
+#
+# The fake sleeps for a configurable latency, streams its answer in a few
+# chunks, and answers 429 once its per-minute quota is used up, like Gemini.
+
+import asyncio
+import os
+import time
+from collections import deque
+
+import httpx
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse, StreamingResponse
+from google.api_core.exceptions import GoogleAPICallError, ResourceExhausted
+from pydantic import BaseModel
+
+LATENCY_SECONDS = float(os.getenv("FAKE_LLM_LATENCY_SECONDS", "1.0"))
+REQUESTS_PER_MINUTE = int(os.getenv("FAKE_LLM_REQUESTS_PER_MINUTE", "60"))
+CHUNKS = 5
+
+app = FastAPI(title="Fake LLM upstream")
+_recent_calls = deque()
+_stats = {"requests": 0, "rate_limited": 0, "max_concurrent": 0, "concurrent": 0}
+
+
+class GenerateRequest(BaseModel):
+    prompt: str
+    stream: bool = False
+
+
+def _over_quota():
+    now = time.monotonic()
+    while _recent_calls and now - _recent_calls[0] > 60:
+        _recent_calls.popleft()
+    if len(_recent_calls) >= REQUESTS_PER_MINUTE:
+        return True
+    _recent_calls.append(now)
+    return False
+
+
+def _answer_for(prompt):
+    return f"This is a canned answer for a {len(prompt)}-character prompt. Please consult a dermatologist."
+
+
+@app.post("/generate")
+async def generate(request: GenerateRequest):
+    _stats["requests"] += 1
+    if _over_quota():
+        _stats["rate_limited"] += 1
+        return JSONResponse({"error": "quota exceeded"}, status_code=429, headers={"Retry-After": "60"})
+
+    words = _answer_for(request.prompt).split(" ")
+    step = max(1, len(words) // CHUNKS)
+    chunks = [" ".join(words[i:i + step]) + " " for i in range(0, len(words), step)]
+
+    async def body():
+        _stats["concurrent"] += 1
+        _stats["max_concurrent"] = max(_stats["max_concurrent"], _stats["concurrent"])
+        try:
+            for chunk in chunks:
+                await asyncio.sleep(LATENCY_SECONDS / len(chunks))
+                yield chunk
+        finally:
+            _stats["concurrent"] -= 1
+
+    if request.stream:
+        return StreamingResponse(body(), media_type="text/plain")
+    return {"text": "".join([chunk async for chunk in body()])}
+
+
+@app.get("/stats")
+def stats():
+    return _stats
+
+
+# --- Client side: a drop-in for genai.GenerativeModel ---
+class _FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class _FakeStream:
+    def __init__(self, client, url, prompt):
+        self._client = client
+        self._url = url
+        self._prompt = prompt
+
+    async def __aiter__(self):
+        async with self._client.stream("POST", self._url, json={"prompt": self._prompt, "stream": True}) as resp:
+            _raise_for_status(resp)
+            async for text in resp.aiter_text():
+                yield _FakeResponse(text)
+
+
+def _raise_for_status(resp):
+    if resp.status_code == 429:
+        raise ResourceExhausted("Fake LLM quota exceeded.")
+    if resp.status_code >= 400:
+        raise GoogleAPICallError(f"Fake LLM returned HTTP {resp.status_code}.")
+
+
+class FakeGeminiModel:
+    """Implements the slice of `genai.GenerativeModel` that main_server uses."""
+
+    def __init__(self, base_url):
+        self._url = base_url.rstrip("/") + "/generate"
+        self._client = httpx.AsyncClient(timeout=60.0, limits=httpx.Limits(max_connections=256))
+
+    async def generate_content_async(self, prompt, stream=False):
+        if stream:
+            return _FakeStream(self._client, self._url, prompt)
+        resp = await self._client.post(self._url, json={"prompt": prompt})
+        _raise_for_status(resp)
+        return _FakeResponse(resp.json()["text"])
+
+    async def aclose(self):
+        await self._client.aclose()
@@ -0,0 +1,267 @@
+# Report / prediction persistence with write-behind batching.
+#
+# Request handlers call `await persistence.write(collection, doc_id, data)`,
+# which only appends to an in-memory queue. A background writer drains the
+# queue and commits documents in batches (up to max_batch_size, or whatever
+# arrived within flush_interval_seconds), so saving a report costs the
+# request a few microseconds instead of a database round trip.
+#   - the queue is bounded: when it is full, write() waits for space
+#     (backpressure) and raises PersistenceOverloaded after put_timeout_seconds
+#   - a failed commit is retried with backoff, then counted and dropped
+#   - close() flushes everything still queued (call it on shutdown)
+# Every server that serves reports or predictions persists them (the AIO
+# server and, in the split deployment, ml/main.py, ml/api_two_stage.py and
+# backend/ai_server.py); main_server's /reports reads the same store.
+# Synchronous servers (Flask) use ThreadedWriteBehind.
+# Backends: the queryable report history store (report_history.py, default),
+# Firestore through firebase_admin, or a plain SQLite document table.
+
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from backend.services.metrics import LatencyRecorder
+from backend.services.report_history import ReportHistoryStore
+
+FIRESTORE_MAX_BATCH = 500  # Firestore rejects larger write batches
+
+
+class PersistenceOverloaded(Exception):
+    """The write-behind buffer stayed full for longer than put_timeout_seconds."""
+
+
+# --- Backends (blocking; always called from the writer's own thread) ---
+class SQLiteBackend:
+    """Documents as JSON rows keyed by (collection, doc_id)."""
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = None
+
+    def _connect(self):
+        if self._conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._conn = sqlite3.connect(self.path)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS documents ("
+                " collection TEXT NOT NULL, doc_id TEXT NOT NULL, data TEXT NOT NULL, updated_at REAL NOT NULL,"
+                " PRIMARY KEY (collection, doc_id))"
+            )
+        return self._conn
+
+    def write_batch(self, records):
+        conn = self._connect()
+        now = time.time()
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO documents (collection, doc_id, data, updated_at) VALUES (?, ?, ?, ?)",
+                [(collection, doc_id, json.dumps(data, separators=(",", ":")), now)
+                 for collection, doc_id, data in records],
+            )
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+class FirestoreBackend:
+    """Firestore via firebase_admin; credentials from a service-account file or the default environment."""
+
+    def __init__(self, credentials_path=None):
+        import firebase_admin
+        from firebase_admin import credentials, firestore
+
+        if not firebase_admin._apps:
+            cred = credentials.Certificate(credentials_path) if credentials_path else None
+            firebase_admin.initialize_app(cred)
+        self._db = firestore.client()
+
+    def write_batch(self, records):
+        for start in range(0, len(records), FIRESTORE_MAX_BATCH):
+            batch = self._db.batch()
+            for collection, doc_id, data in records[start:start + FIRESTORE_MAX_BATCH]:
+                batch.set(self._db.collection(collection).document(doc_id), data)
+            batch.commit()
+
+    def close(self):
+        pass
+
+
+# --- Write-behind queue ---
+class WriteBehindQueue:
+    def __init__(self, backend, max_batch_size=100, flush_interval_seconds=0.5, max_buffer=10000,
+                 put_timeout_seconds=2.0, max_retries=3):
+        self.backend = backend
+        self.max_batch_size = max_batch_size
+        self.flush_interval_seconds = flush_interval_seconds
+        self.max_buffer = max_buffer
+        self.put_timeout_seconds = put_timeout_seconds
+        self.max_retries = max_retries
+        # One thread, so backends never see concurrent commits (and SQLite stays on its own thread)
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="persistence")
+        self._queue = None
+        self._writer = None
+        self.enqueued = 0
+        self.committed = 0
+        self.failed = 0
+        self.batches = 0
+        self.backpressure_waits = 0
+        self.overloaded = 0
+        self.commit_timings = LatencyRecorder()
+
+    def start(self):
+        if self._writer is None:
+            self._queue = asyncio.Queue(maxsize=self.max_buffer)
+            self._writer = asyncio.ensure_future(self._run())
+
+    async def write(self, collection, doc_id, data):
+        """Queues a document for the next batch; waits only when the buffer is full."""
+        if self._writer is None:
+            self.start()
+        record = (collection, doc_id, data)
+        try:
+            self._queue.put_nowait(record)
+        except asyncio.QueueFull:
+            self.backpressure_waits += 1
+            try:
+                await asyncio.wait_for(self._queue.put(record), self.put_timeout_seconds)
+            except asyncio.TimeoutError:
+                self.overloaded += 1
+                raise PersistenceOverloaded(f"Persistence buffer full ({self.max_buffer} documents).")
+        self.enqueued += 1
+
+    async def record(self, collection, user_id, result):
+        """Queues a served result under a new record id; returns the id (None if the buffer stayed full)."""
+        record_id = uuid.uuid4().hex
+        try:
+            await self.write(collection, record_id, dict(result, user_id=user_id, created_at=time.time()))
+        except PersistenceOverloaded as e:
+            # Serving the result matters more than storing it
+            print(f"Persistence skipped for {collection}: {e}")
+            return None
+        return record_id
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.flush_interval_seconds
+            while len(batch) < self.max_batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except asyncio.QueueEmpty:
+                    remaining = deadline - loop.time()
+                    if remaining <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                    except asyncio.TimeoutError:
+                        break
+            try:
+                await self._commit(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _commit(self, batch):
+        loop = asyncio.get_running_loop()
+        for attempt in range(self.max_retries + 1):
+            started = time.perf_counter()
+            try:
+                await loop.run_in_executor(self._executor, self.backend.write_batch, batch)
+            except Exception as e:
+                if attempt == self.max_retries:
+                    self.failed += len(batch)
+                    print(f"Persistence: dropping batch of {len(batch)} after {attempt + 1} attempts: {e}")
+                    return
+                await asyncio.sleep(0.1 * 2 ** attempt)
+                continue
+            self.commit_timings.record(time.perf_counter() - started)
+            self.batches += 1
+            self.committed += len(batch)
+            return
+
+    async def flush(self):
+        """Waits until everything queued so far is committed (or dropped)."""
+        if self._queue is not None:
+            await self._queue.join()
+
+    async def close(self):
+        await self.flush()
+        if self._writer is not None:
+            self._writer.cancel()
+            self._writer = None
+        await asyncio.get_running_loop().run_in_executor(self._executor, self.backend.close)
+        self._executor.shutdown(wait=True)
+
+    def stats(self):
+        return {
+            "buffered": self._queue.qsize() if self._queue is not None else 0,
+            "enqueued": self.enqueued,
+            "committed": self.committed,
+            "failed": self.failed,
+            "batches": self.batches,
+            "mean_batch_size": self.committed / self.batches if self.batches else 0.0,
+            "backpressure_waits": self.backpressure_waits,
+            "overloaded": self.overloaded,
+            "commit": self.commit_timings.summary(),
+        }
+
+
+class ThreadedWriteBehind:
+    """A WriteBehindQueue for synchronous servers (Flask): the queue runs on its own event-loop thread."""
+
+    def __init__(self, queue):
+        self.queue = queue
+        self._loop = asyncio.new_event_loop()
+        threading.Thread(target=self._loop.run_forever, name="persistence-loop", daemon=True).start()
+        self._call(self._start())
+
+    def _call(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    async def _start(self):
+        self.queue.start()
+
+    def record(self, collection, user_id, result):
+        """Blocks only while the buffer is full (up to put_timeout_seconds), like WriteBehindQueue.write."""
+        return self._call(self.queue.record(collection, user_id, result))
+
+    def stats(self):
+        return self.queue.stats()
+
+    def close(self):
+        self._call(self.queue.close())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
+
+def persistence_from_env():
+    """
+    PERSISTENCE_BACKEND=history (default, REPORT_HISTORY_DB), sqlite (PERSISTENCE_DB)
+    or firestore (FIREBASE_CREDENTIALS, else application default credentials).
+    Batching: PERSIST_BATCH_SIZE, PERSIST_FLUSH_SECONDS, PERSIST_MAX_BUFFER.
+    """
+    kind = os.getenv("PERSISTENCE_BACKEND", "history")
+    data_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data")
+    if kind == "firestore":
+        backend = FirestoreBackend(os.getenv("FIREBASE_CREDENTIALS"))
+    elif kind == "sqlite":
+        backend = SQLiteBackend(os.getenv("PERSISTENCE_DB", os.path.join(data_dir, "persistence.db")))
+    elif kind == "history":
+        backend = ReportHistoryStore(os.getenv("REPORT_HISTORY_DB", os.path.join(data_dir, "report_history.db")))
+    else:
+        raise ValueError(f"Unknown PERSISTENCE_BACKEND '{kind}' (choose from history, sqlite, firestore)")
+    return WriteBehindQueue(
+        backend,
+        max_batch_size=int(os.getenv("PERSIST_BATCH_SIZE", "100")),
+        flush_interval_seconds=float(os.getenv("PERSIST_FLUSH_SECONDS", "0.5")),
+        max_buffer=int(os.getenv("PERSIST_MAX_BUFFER", "10000")),
+    )
@@ -0,0 +1,197 @@
+# Admission control in front of the upstream LLM (Gemini).
+# Without it every /chat request opens its own upstream call; under load we
+# blow through the provider's quota and the resulting errors surface as 500s.
+#
+# A request is admitted when (a) fewer than `max_in_flight` calls are running
+# and (b) the token bucket (sized to our quota) has a token. Otherwise it waits
+# in a short FIFO queue with a deadline. When that cannot work out we fail fast:
+#   - 429 + Retry-After when the quota will not refill within the deadline
+#   - 503 + Retry-After when the queue is full or the deadline passes
+
+import asyncio
+import math
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+
+from backend.services.metrics import LatencyRecorder
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, status_code, retry_after, reason):
+        super().__init__(reason)
+        self.status_code = status_code
+        self.retry_after = max(1, int(math.ceil(retry_after)))
+        self.reason = reason
+
+
+class TokenBucket:
+    """Classic token bucket: `rate` tokens per second, at most `capacity` banked."""
+
+    def __init__(self, rate, capacity):
+        if rate <= 0:
+            raise ValueError(f"Token bucket rate must be positive, got {rate}.")
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self):
+        """Seconds until a token is available (0 if one is available now)."""
+        self._refill()
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self):
+        """Take a token if one is available; return the seconds to wait otherwise."""
+        wait = self.wait_time()
+        if wait == 0.0:
+            self.tokens -= 1
+        return wait
+
+    def drain(self):
+        """Upstream told us we are over quota: stop handing out tokens for a while."""
+        self._refill()
+        self.tokens = min(self.tokens, 0)
+
+
+class LLMAdmission:
+    def __init__(self, max_in_flight=4, requests_per_minute=60, burst=None, max_queue=16, max_wait_seconds=5.0):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.max_wait_seconds = max_wait_seconds
+        self.bucket = TokenBucket(requests_per_minute / 60.0, burst or max_in_flight)
+
+        self.in_flight = 0
+        self._queue = deque()  # FIFO of futures, resolved when the waiter is admitted
+        self._timer = None
+
+        self.admitted = 0
+        self.rejected_rate_limited = 0
+        self.rejected_saturated = 0
+        self.timed_out = 0
+        self.wait = LatencyRecorder()
+
+    @asynccontextmanager
+    async def slot(self):
+        await self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    async def acquire(self):
+        started = time.monotonic()
+
+        # Fast path: nothing queued ahead of us and capacity available
+        if not self._queue and self.in_flight < self.max_in_flight and self.bucket.take() == 0.0:
+            self._admit(started)
+            return
+
+        if len(self._queue) >= self.max_queue:
+            self.rejected_saturated += 1
+            raise AdmissionRejected(503, self.estimated_wait(), "LLM queue is full.")
+
+        quota_wait = self.bucket.wait_time() + len(self._queue) / self.bucket.rate
+        if quota_wait > self.max_wait_seconds:
+            self.rejected_rate_limited += 1
+            raise AdmissionRejected(429, quota_wait, "LLM rate limit reached.")
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._queue.append(waiter)
+        self._dispatch()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), timeout=self.max_wait_seconds)
+        except asyncio.TimeoutError:
+            if waiter.done() and not waiter.cancelled():
+                # Admitted just as the deadline fired; keep the slot.
+                self._admit(started, counted=True)
+                return
+            self._abandon(waiter)
+            self.timed_out += 1
+            raise AdmissionRejected(503, self.estimated_wait(), "Timed out waiting for the LLM.")
+        except asyncio.CancelledError:
+            # The caller went away. If we were already admitted, give the slot back.
+            if waiter.done() and not waiter.cancelled():
+                self.in_flight -= 1
+                self._dispatch()
+            else:
+                self._abandon(waiter)
+            raise
+        self._admit(started, counted=True)
+
+    def release(self):
+        self.in_flight -= 1
+        self._dispatch()
+
+    def upstream_rate_limited(self):
+        """Called when the provider itself returns 429; back off locally as well."""
+        self.bucket.drain()
+
+    def stats(self):
+        return {
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "queue_depth": len(self._queue),
+            "max_queue": self.max_queue,
+            "tokens_available": round(self.bucket.tokens, 2),
+            "admitted": self.admitted,
+            "rejected_rate_limited": self.rejected_rate_limited,
+            "rejected_saturated": self.rejected_saturated,
+            "timed_out": self.timed_out,
+            "wait": self.wait.summary(),
+        }
+
+    # --- Internals ---
+    def _admit(self, started, counted=False):
+        if not counted:
+            self.in_flight += 1
+        self.admitted += 1
+        self.wait.record(time.monotonic() - started)
+
+    def _dispatch(self):
+        """Hand free slots to queued waiters in FIFO order, as tokens allow."""
+        while self._queue and self.in_flight < self.max_in_flight:
+            if self._queue[0].done():  # cancelled or timed out while queued
+                self._queue.popleft()
+                continue
+            wait = self.bucket.take()
+            if wait > 0:
+                if self._timer is None:
+                    self._timer = asyncio.get_running_loop().call_later(wait, self._on_timer)
+                return
+            self.in_flight += 1
+            self._queue.popleft().set_result(None)
+
+    def _abandon(self, waiter):
+        waiter.cancel()
+        try:
+            self._queue.remove(waiter)
+        except ValueError:
+            pass
+
+    def _on_timer(self):
+        self._timer = None
+        self._dispatch()
+
+    def estimated_wait(self):
+        return max(self.bucket.wait_time(), len(self._queue) / self.bucket.rate)
+
+
+def llm_admission_from_env():
+    """Build the limiter from LLM_* environment variables (see backend/README.md)."""
+    burst = os.getenv("LLM_BURST")
+    return LLMAdmission(
+        max_in_flight=int(os.getenv("LLM_MAX_IN_FLIGHT", "4")),
+        requests_per_minute=float(os.getenv("LLM_REQUESTS_PER_MINUTE", "60")),
+        burst=int(burst) if burst else None,
+        max_queue=int(os.getenv("LLM_MAX_QUEUE", "16")),
+        max_wait_seconds=float(os.getenv("LLM_MAX_WAIT_SECONDS", "5")),
+    )
@@ -0,0 +1,92 @@
+# Tiny in-process latency metrics for the FastAPI servers.
+# Keeps a bounded window of recent samples so percentiles reflect current
+# behaviour without growing memory over the lifetime of the process.
+
+from collections import deque
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(pct / 100.0 * (len(sorted_values) - 1)))))
+    return sorted_values[index]
+
+
+class LatencyRecorder:
+    """Rolling window of latency samples (seconds) summarised in milliseconds."""
+
+    def __init__(self, max_samples=2048):
+        self._samples = deque(maxlen=max_samples)
+        self.count = 0
+
+    def record(self, seconds):
+        self._samples.append(seconds)
+        self.count += 1
+
+    def summary(self):
+        values = sorted(self._samples)
+        mean = sum(values) / len(values) if values else 0.0
+        return {
+            "count": self.count,
+            "mean_ms": round(mean * 1000, 3),
+            "p50_ms": round(percentile(values, 50) * 1000, 3),
+            "p95_ms": round(percentile(values, 95) * 1000, 3),
+            "p99_ms": round(percentile(values, 99) * 1000, 3),
+        }
+
+
+class EndpointTimings:
+    """Time-to-first-byte and total time for one endpoint, plus cancelled requests."""
+
+    def __init__(self, max_samples=2048):
+        self.ttfb = LatencyRecorder(max_samples)
+        self.total = LatencyRecorder(max_samples)
+        self.cancelled = 0
+
+    def record(self, ttfb_seconds, total_seconds):
+        self.ttfb.record(ttfb_seconds)
+        self.total.record(total_seconds)
+
+    def summary(self):
+        return {
+            "ttfb": self.ttfb.summary(),
+            "total": self.total.summary(),
+            "cancelled": self.cancelled,
+        }
+
+
+class ValueRecorder:
+    """Rolling window of plain numeric samples (e.g. prompt sizes)."""
+
+    def __init__(self, max_samples=2048):
+        self._samples = deque(maxlen=max_samples)
+        self.count = 0
+        self.total = 0
+
+    def record(self, value):
+        self._samples.append(value)
+        self.count += 1
+        self.total += value
+
+    def summary(self):
+        values = sorted(self._samples)
+        return {
+            "count": self.count,
+            "total": self.total,
+            "mean": round(sum(values) / len(values), 1) if values else 0,
+            "p50": percentile(values, 50),
+            "p95": percentile(values, 95),
+            "max": values[-1] if values else 0,
+        }
+
+
+def resident_memory_mb(pid="self"):
+    """Current resident set size of a process (Linux /proc), in MB; None where unavailable."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
@@ -0,0 +1,249 @@
+# On-demand profiling of a live server, behind a token.
+#
+#   curl -X POST -H "X-Profiler-Token: $PROFILER_TOKEN" -o profile.folded \
+#     "http://localhost:8000/debug/profile?kind=python&seconds=10"
+#   curl -X POST -H "X-Profiler-Token: $PROFILER_TOKEN" -o trace.zip \
+#     "http://localhost:8000/debug/profile?kind=tensorflow&requests=20"
+#
+# kind=python: a sampling profiler. A background thread reads every thread's
+# Python stack (sys._current_frames) every PROFILER_SAMPLE_INTERVAL_MS and
+# returns collapsed stacks ("thread;outer;...;inner count" per line), ready
+# for flamegraph.pl or speedscope.app. Inference threads show up with their
+# thread name, so time in generate_report / TwoStagePredictor.predict is
+# visible frame by frame.
+# kind=tensorflow: a TensorFlow profiler trace (op-level, host side), returned
+# as a zip of the log directory. Unzip it and open it with TensorBoard's
+# Profile tab.
+#
+# The capture lasts `seconds`, or until `requests` more requests have finished,
+# capped at PROFILER_MAX_SECONDS. The call blocks and returns the artifact.
+# One capture at a time.
+#
+# Idle cost: no sampler thread and no tracer exist until a capture starts. The
+# request counter checks one attribute per request and does nothing else.
+# Without PROFILER_TOKEN the endpoint answers 404.
+
+import asyncio
+import hmac
+import io
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import zipfile
+from collections import Counter
+
+PROFILE_PATH = "/debug/profile"
+TOKEN_HEADER = "X-Profiler-Token"
+KINDS = ("python", "tensorflow")
+
+
+class ProfilerError(Exception):
+    def __init__(self, status_code, reason):
+        super().__init__(reason)
+        self.status_code = status_code
+        self.reason = reason
+
+
+# --- Capture backends ---
+class PythonSampler:
+    """Samples the Python stacks of every thread into collapsed-stack counts."""
+
+    def __init__(self, interval_seconds, exclude_threads=()):
+        self.interval = interval_seconds
+        self.exclude = set(exclude_threads)
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="profiler-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        own = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.interval):
+            if self.samples % 100 == 0:
+                names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident != own and ident not in self.exclude:
+                    self.stacks[self._collapse(names.get(ident, str(ident)), frame)] += 1
+            self.samples += 1
+
+    @staticmethod
+    def _collapse(thread_name, frame):
+        frames = []
+        while frame is not None:
+            code = frame.f_code
+            frames.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+            frame = frame.f_back
+        frames.append(f"thread {thread_name}")
+        return ";".join(name.replace(";", ":") for name in reversed(frames))
+
+    def artifact(self):
+        body = "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+        return "profile-python.folded", "text/plain", body.encode()
+
+
+class TensorFlowTrace:
+    """tf.profiler trace of everything TensorFlow runs while it is active."""
+
+    def __init__(self):
+        try:
+            import tensorflow as tf
+        except ImportError:
+            raise ProfilerError(400, "TensorFlow is not available in this server.")
+        self._tf = tf
+        self.logdir = tempfile.mkdtemp(prefix="tf_profile_")
+        self.samples = None
+
+    def start(self):
+        try:
+            self._tf.profiler.experimental.start(self.logdir)
+        except Exception as e:  # another trace (e.g. TensorBoard) is already running
+            shutil.rmtree(self.logdir, ignore_errors=True)
+            raise ProfilerError(409, f"Could not start the TensorFlow profiler: {e}")
+
+    def stop(self):
+        self._tf.profiler.experimental.stop()
+
+    def artifact(self):
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+            for folder, _, files in os.walk(self.logdir):
+                for name in files:
+                    path = os.path.join(folder, name)
+                    archive.write(path, os.path.relpath(path, self.logdir))
+        shutil.rmtree(self.logdir, ignore_errors=True)
+        return "profile-tensorflow.zip", "application/zip", buffer.getvalue()
+
+
+# --- Controller ---
+class Profiler:
+    def __init__(self, token=None, max_seconds=60.0, sample_interval_seconds=0.005):
+        self.token = token
+        self.max_seconds = max_seconds
+        self.sample_interval = sample_interval_seconds
+        self.active = False  # the only thing checked per request while idle
+        self._busy = threading.Lock()
+        self._count_lock = threading.Lock()
+        self._requests_left = None
+        self._done = threading.Event()
+        self.captures = 0
+
+    @property
+    def enabled(self):
+        return bool(self.token)
+
+    def check_token(self, supplied):
+        if not self.enabled:
+            raise ProfilerError(404, "Not Found")
+        if not supplied or not hmac.compare_digest(supplied.encode(), self.token.encode()):
+            raise ProfilerError(401, "Missing or wrong profiler token.")
+
+    def request_done(self):
+        """Called after every request; counts down a requests=N capture."""
+        if not self.active or self._requests_left is None:
+            return
+        with self._count_lock:
+            self._requests_left -= 1
+            if self._requests_left <= 0:
+                self._done.set()
+
+    def capture(self, kind="python", seconds=None, requests=None):
+        """Blocks for the capture, then returns (filename, media type, bytes, metadata)."""
+        if kind not in KINDS:
+            raise ProfilerError(400, f"kind must be one of {', '.join(KINDS)}.")
+        if seconds is not None and requests is not None:
+            raise ProfilerError(400, "Give either seconds or requests, not both.")
+        if (seconds is not None and seconds <= 0) or (requests is not None and requests <= 0):
+            raise ProfilerError(400, "seconds and requests must be positive.")
+        if not self._busy.acquire(blocking=False):
+            raise ProfilerError(409, "A capture is already running.")
+        try:
+            if kind == "python":
+                session = PythonSampler(self.sample_interval, exclude_threads=[threading.get_ident()])
+            else:
+                session = TensorFlowTrace()
+            limit = min(seconds if seconds is not None else (self.max_seconds if requests else 10.0),
+                        self.max_seconds)
+            self._done.clear()
+            self._requests_left = requests
+            session.start()
+            started = time.perf_counter()
+            self.active = True
+            try:
+                self._done.wait(limit)
+            finally:
+                self.active = False
+                self._requests_left = None
+                session.stop()
+            elapsed = time.perf_counter() - started
+            self.captures += 1
+            filename, media_type, body = session.artifact()
+            metadata = {"seconds": round(elapsed, 3)}
+            if session.samples is not None:
+                metadata["samples"] = session.samples
+            if requests is not None:
+                metadata["requests_completed"] = self._done.is_set()
+            return filename, media_type, body, metadata
+        finally:
+            self._busy.release()
+
+
+def profiler_from_env():
+    """Build the profiler from PROFILER_* environment variables (see backend/README.md)."""
+    return Profiler(
+        token=os.getenv("PROFILER_TOKEN") or None,
+        max_seconds=float(os.getenv("PROFILER_MAX_SECONDS", "60")),
+        sample_interval_seconds=float(os.getenv("PROFILER_SAMPLE_INTERVAL_MS", "5")) / 1000,
+    )
+
+
+def artifact_headers(filename, metadata):
+    headers = {"Content-Disposition": f'attachment; filename="{filename}"'}
+    headers.update({f"X-Profile-{key.replace('_', '-').title()}": str(value) for key, value in metadata.items()})
+    return headers
+
+
+# --- FastAPI wiring ---
+class RequestCounter:
+    """Pure ASGI middleware: tells the profiler when a request finishes (one attribute check while idle)."""
+
+    def __init__(self, app, profiler):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        if not self.profiler.active or scope["type"] != "http" or scope["path"] == PROFILE_PATH:
+            return await self.app(scope, receive, send)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.profiler.request_done()
+
+
+def install_fastapi(app, profiler):
+    """Adds POST /debug/profile and the request counter to a FastAPI app."""
+    from fastapi import Header, HTTPException, Response
+
+    app.add_middleware(RequestCounter, profiler=profiler)
+
+    async def profile(kind: str = "python", seconds: float | None = None, requests: int | None = None,
+                      x_profiler_token: str | None = Header(None)):
+        try:
+            profiler.check_token(x_profiler_token)
+            filename, media_type, body, metadata = await asyncio.to_thread(profiler.capture, kind, seconds, requests)
+        except ProfilerError as e:
+            raise HTTPException(status_code=e.status_code, detail=e.reason)
+        return Response(body, media_type=media_type, headers=artifact_headers(filename, metadata))
+
+    app.add_api_route(PROFILE_PATH, profile, methods=["POST"], include_in_schema=False)
@@ -0,0 +1,135 @@
+# Canonical, incremental report hashing.
+#
+# Identical reports must always hash the same, whatever the dict insertion
+# order, float type (float, numpy scalar) or process, and hashing a report with
+# a few hundred KB of base64 heatmap should not build a second serialized copy
+# of it. The report is walked once and fed to SHA-256 in bounded chunks:
+#   - dict keys are sorted, containers use JSON punctuation
+#   - floats use the shortest round-trip repr; integral floats are written as
+#     ints (1.0 -> 1) so a report that went through JSON/JS hashes the same
+#   - bytes and base64 data URLs ("data:image/jpeg;base64,...") are hashed by
+#     reference: the SHA-256 of the raw decoded bytes, written as a
+#     `#sha256:<hex>:<length>` token that no JSON value can collide with
+
+import hashlib
+import math
+from binascii import Error as BinasciiError
+from base64 import b64decode
+from json.encoder import encode_basestring
+
+CHUNK_SIZE = 64 * 1024
+_B64_CHUNK = CHUNK_SIZE - CHUNK_SIZE % 4  # decoded slices must stay 4-char aligned
+_MAX_SAFE_INT = 2 ** 53
+
+
+class _ChunkedHasher:
+    """Buffers small tokens and feeds the digest in CHUNK_SIZE pieces."""
+
+    def __init__(self):
+        self.digest = hashlib.sha256()
+        self.parts = []
+        self.buffered = 0
+
+    def write(self, data: bytes):
+        self.parts.append(data)
+        self.buffered += len(data)
+        if self.buffered >= CHUNK_SIZE:
+            self.flush()
+
+    def flush(self):
+        if self.parts:
+            self.digest.update(b"".join(self.parts))
+            self.parts, self.buffered = [], 0
+
+    def hexdigest(self):
+        self.flush()
+        return self.digest.hexdigest()
+
+
+def _bytes_reference(data) -> bytes:
+    return f"#sha256:{hashlib.sha256(data).hexdigest()}:{len(data)}".encode("ascii")
+
+
+def _data_url_reference(text: str):
+    """`#sha256` token for a base64 data URL, decoded slice by slice; None if it is not valid base64."""
+    comma = text.find(",")
+    if comma < 0 or not text[:comma].endswith(";base64"):
+        return None
+    digest, length = hashlib.sha256(), 0
+    try:
+        for start in range(comma + 1, len(text), _B64_CHUNK):
+            raw = b64decode(text[start:start + _B64_CHUNK], validate=True)
+            digest.update(raw)
+            length += len(raw)
+    except (BinasciiError, ValueError):
+        return None
+    # The media type is part of the value: the same pixels as PNG vs JPEG are different reports
+    return f"#{text[5:comma]}#sha256:{digest.hexdigest()}:{length}".encode("ascii")
+
+
+def _write_string(out: _ChunkedHasher, text: str):
+    if text.startswith("data:"):
+        reference = _data_url_reference(text)
+        if reference is not None:
+            out.write(reference)
+            return
+    if len(text) <= CHUNK_SIZE:
+        out.write(encode_basestring(text).encode("utf-8"))
+        return
+    # JSON escaping is per character, so long strings can be escaped slice by slice
+    out.write(b'"')
+    for start in range(0, len(text), CHUNK_SIZE):
+        out.write(encode_basestring(text[start:start + CHUNK_SIZE])[1:-1].encode("utf-8"))
+    out.write(b'"')
+
+
+def _format_float(value: float) -> bytes:
+    if not math.isfinite(value):
+        raise ValueError(f"Cannot hash non-finite float {value!r}.")
+    if value.is_integer() and abs(value) < _MAX_SAFE_INT:
+        return str(int(value)).encode("ascii")  # also folds -0.0 into 0
+    return repr(value).encode("ascii")
+
+
+def _write_value(out: _ChunkedHasher, value):
+    if hasattr(value, "item") and not isinstance(value, (bytes, bytearray, memoryview)):
+        value = value.item()  # numpy scalars (e.g. a float32 confidence)
+    if value is None:
+        out.write(b"null")
+    elif value is True:
+        out.write(b"true")
+    elif value is False:
+        out.write(b"false")
+    elif isinstance(value, int):
+        out.write(str(value).encode("ascii"))
+    elif isinstance(value, float):
+        out.write(_format_float(value))
+    elif isinstance(value, str):
+        _write_string(out, value)
+    elif isinstance(value, (bytes, bytearray, memoryview)):
+        out.write(_bytes_reference(value))
+    elif isinstance(value, dict):
+        out.write(b"{")
+        for i, key in enumerate(sorted(value, key=str)):
+            if i:
+                out.write(b",")
+            out.write(encode_basestring(str(key)).encode("utf-8"))
+            out.write(b":")
+            _write_value(out, value[key])
+        out.write(b"}")
+    elif isinstance(value, (list, tuple)):
+        out.write(b"[")
+        for i, item in enumerate(value):
+            if i:
+                out.write(b",")
+            _write_value(out, item)
+        out.write(b"]")
+    else:
+        raise TypeError(f"Cannot hash value of type {type(value).__name__}.")
+
+
+def canonical_digest(value) -> str:
+    """Hex SHA-256 of the canonical serialization of `value`."""
+    out = _ChunkedHasher()
+    _write_value(out, value)
+    return out.hexdigest()
@@ -0,0 +1,253 @@
+# Report history: persisted reports and predictions, queryable by patient,
+# date, condition and severity.
+#
+# SQLite in WAL mode (readers never block the writer). Rows stay small so
+# indexes and pages stay hot at millions of reports:
+#   - class names are interned in a `labels` table and stored as integers
+#   - severity is stored as its rank (0 = LOW ... 4 = HIGH)
+#   - the full result is zlib-compressed compact JSON
+#   - heatmaps are decoded from base64 and stored once per distinct image in
+#     a separate `heatmaps` table, referenced by SHA-256
+# Every filter has an index ending in (created_at, id), and listing uses keyset
+# pagination on (created_at, id), so a page costs the same at any depth.
+#
+# The store is a persistence backend (write_batch/close), fed by the
+# write-behind queue in firebase_service.py.
+
+import base64
+import binascii
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import zlib
+
+SEVERITIES = ["LOW", "LOW-MEDIUM", "MEDIUM", "MEDIUM-HIGH", "HIGH"]
+MAX_PAGE_SIZE = 200
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS labels (id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE);
+CREATE TABLE IF NOT EXISTS heatmaps (sha256 TEXT PRIMARY KEY, image BLOB NOT NULL);
+CREATE TABLE IF NOT EXISTS reports (
+    id INTEGER PRIMARY KEY,
+    record_id TEXT NOT NULL UNIQUE,
+    kind TEXT NOT NULL,
+    user_id TEXT,
+    created_at REAL NOT NULL,
+    stage1 INTEGER REFERENCES labels(id),
+    stage2 INTEGER REFERENCES labels(id),
+    severity INTEGER,
+    confidence REAL,
+    heatmap TEXT REFERENCES heatmaps(sha256),
+    body BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS reports_time ON reports (created_at, id);
+CREATE INDEX IF NOT EXISTS reports_user ON reports (user_id, created_at, id);
+CREATE INDEX IF NOT EXISTS reports_stage1 ON reports (stage1, created_at, id);
+CREATE INDEX IF NOT EXISTS reports_stage2 ON reports (stage2, created_at, id);
+CREATE INDEX IF NOT EXISTS reports_severity ON reports (severity, created_at, id);
+"""
+
+_SUMMARY_COLUMNS = (
+    "r.id, r.record_id, r.kind, r.user_id, r.created_at, l1.name, l2.name, r.severity, r.confidence, r.heatmap"
+)
+_FROM = "reports r LEFT JOIN labels l1 ON l1.id = r.stage1 LEFT JOIN labels l2 ON l2.id = r.stage2"
+
+
+def _split_heatmap(result):
+    """(result without the heatmap, raw image bytes or None)."""
+    heatmap = result.get("heatmap_image")
+    if not isinstance(heatmap, str) or ";base64," not in heatmap:
+        return result, None
+    payload = heatmap.split(",", 1)[1]
+    if payload == "None":  # build_report's placeholder when Grad-CAM failed
+        return result, None
+    try:
+        image = base64.b64decode(payload, validate=True)
+    except (binascii.Error, ValueError):
+        return result, None
+    return {k: v for k, v in result.items() if k != "heatmap_image"}, image
+
+
+def _index_fields(collection, result):
+    """(stage1 class, stage2 class, severity rank, confidence) for the indexed columns."""
+    if collection == "reports":
+        # The Grad-CAM report model is the 7-class cancer model, i.e. a stage 2 prediction
+        return None, result.get("prediction"), None, result.get("confidence")
+    stage1 = result.get("stage1") or {}
+    stage2 = result.get("stage2") or {}
+    severity = (result.get("recommendation") or {}).get("severity")
+    rank = SEVERITIES.index(severity) if severity in SEVERITIES else None
+    confidence = stage2.get("confidence", stage1.get("confidence"))
+    return stage1.get("class"), stage2.get("class"), rank, confidence
+
+
+def encode_cursor(created_at, row_id):
+    return f"{created_at!r}_{row_id}"
+
+
+def decode_cursor(cursor):
+    try:
+        created_at, row_id = cursor.rsplit("_", 1)
+        return float(created_at), int(row_id)
+    except ValueError:
+        raise ValueError(f"Invalid cursor {cursor!r}.")
+
+
+class ReportHistoryStore:
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+        self._label_ids = {}
+
+    def _conn(self):
+        """One connection per thread: the persistence writer and each request thread read/write independently."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            with self._lock:
+                first = not self._connections
+                if first:
+                    # Nothing touches the disk until the store is first used
+                    os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+                conn = sqlite3.connect(self.path, check_same_thread=False)
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("PRAGMA synchronous=NORMAL")
+                if first:
+                    with conn:
+                        conn.executescript(_SCHEMA)
+                self._connections.append(conn)
+            self._local.conn = conn
+        return conn
+
+    def _label_id(self, conn, name, new_labels):
+        """Id of a label, inserting it if needed. New ids go to `new_labels` until the transaction commits."""
+        if name is None:
+            return None
+        label_id = self._label_ids.get(name) or new_labels.get(name)
+        if label_id is None:
+            conn.execute("INSERT OR IGNORE INTO labels (name) VALUES (?)", (name,))
+            label_id = conn.execute("SELECT id FROM labels WHERE name = ?", (name,)).fetchone()[0]
+            new_labels[name] = label_id
+        return label_id
+
+    def _existing_label_id(self, conn, name):
+        row = conn.execute("SELECT id FROM labels WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    # --- Persistence backend interface ---
+    def write_batch(self, records):
+        conn = self._conn()
+        # A rolled-back batch also undoes its label inserts, so their ids are only cached after the commit
+        new_labels = {}
+        with conn:
+            for collection, record_id, data in records:
+                result, image = _split_heatmap(data)
+                heatmap_ref = None
+                if image is not None:
+                    heatmap_ref = hashlib.sha256(image).hexdigest()
+                    conn.execute("INSERT OR IGNORE INTO heatmaps (sha256, image) VALUES (?, ?)", (heatmap_ref, image))
+                stage1, stage2, severity, confidence = _index_fields(collection, result)
+                body = zlib.compress(json.dumps(result, separators=(",", ":")).encode("utf-8"))
+                conn.execute(
+                    "INSERT OR REPLACE INTO reports (record_id, kind, user_id, created_at, stage1, stage2,"
+                    " severity, confidence, heatmap, body) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (record_id, collection, result.get("user_id"), result.get("created_at", 0.0),
+                     self._label_id(conn, stage1, new_labels), self._label_id(conn, stage2, new_labels),
+                     severity, confidence, heatmap_ref, body),
+                )
+        self._label_ids.update(new_labels)
+
+    def close(self):
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+        self._local = threading.local()
+
+    # --- Queries ---
+    def query(self, user_id=None, stage1=None, stage2=None, severity=None, since=None, until=None,
+              limit=50, cursor=None):
+        """
+        Newest first. Returns {"items": [...], "next_cursor": str | None};
+        pass next_cursor back to get the following page.
+        """
+        conn = self._conn()
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+        where, params = [], []
+        if user_id is not None:
+            where.append("r.user_id = ?")
+            params.append(user_id)
+        for column, name in (("r.stage1", stage1), ("r.stage2", stage2)):
+            if name is not None:
+                label_id = self._existing_label_id(conn, name)
+                if label_id is None:
+                    return {"items": [], "next_cursor": None}
+                where.append(f"{column} = ?")
+                params.append(label_id)
+        if severity is not None:
+            if severity not in SEVERITIES:
+                raise ValueError(f"severity must be one of {SEVERITIES}.")
+            where.append("r.severity = ?")
+            params.append(SEVERITIES.index(severity))
+        if since is not None:
+            where.append("r.created_at >= ?")
+            params.append(since)
+        if until is not None:
+            where.append("r.created_at < ?")
+            params.append(until)
+        if cursor is not None:
+            where.append("(r.created_at, r.id) < (?, ?)")
+            params.extend(decode_cursor(cursor))
+
+        sql = f"SELECT {_SUMMARY_COLUMNS} FROM {_FROM}"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY r.created_at DESC, r.id DESC LIMIT ?"
+        rows = conn.execute(sql, (*params, limit + 1)).fetchall()
+
+        items = [self._summary(row) for row in rows[:limit]]
+        next_cursor = encode_cursor(rows[limit - 1][4], rows[limit - 1][0]) if len(rows) > limit else None
+        return {"items": items, "next_cursor": next_cursor}
+
+    def get(self, record_id):
+        """Full stored result (without the heatmap image), or None."""
+        row = self._conn().execute(
+            f"SELECT {_SUMMARY_COLUMNS}, r.body FROM {_FROM} WHERE r.record_id = ?", (record_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        return dict(self._summary(row[:-1]), result=json.loads(zlib.decompress(row[-1])))
+
+    def heatmap(self, record_id):
+        """Raw heatmap image bytes, or None."""
+        row = self._conn().execute(
+            "SELECT h.image FROM reports r JOIN heatmaps h ON h.sha256 = r.heatmap WHERE r.record_id = ?",
+            (record_id,),
+        ).fetchone()
+        return row[0] if row else None
+
+    def stats(self):
+        conn = self._conn()
+        return {
+            "reports": conn.execute("SELECT COUNT(*) FROM reports").fetchone()[0],
+            "heatmaps": conn.execute("SELECT COUNT(*) FROM heatmaps").fetchone()[0],
+            "labels": conn.execute("SELECT COUNT(*) FROM labels").fetchone()[0],
+        }
+
+    @staticmethod
+    def _summary(row):
+        _, record_id, kind, user_id, created_at, stage1, stage2, severity, confidence, heatmap = row
+        return {
+            "record_id": record_id,
+            "kind": kind,
+            "user_id": user_id,
+            "created_at": created_at,
+            "stage1": stage1,
+            "stage2": stage2,
+            "severity": SEVERITIES[severity] if severity is not None else None,
+            "confidence": confidence,
+            "has_heatmap": heatmap is not None,
+        }
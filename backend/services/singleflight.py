@@ -0,0 +1,50 @@
+# In-process single-flight: concurrent callers asking for the same key share
+# one in-flight call instead of each hitting the upstream service.
+
+import asyncio
+
+
+class SingleFlight:
+    """
+    `await flight.do(key, fn)` runs `fn()` once per key at a time. Callers that
+    arrive while the call is in flight wait for the same result, and if the call
+    raises, every one of them sees the same exception.
+
+    The shared call runs in its own task, so one caller being cancelled (e.g. a
+    client disconnecting) does not cancel it for the others.
+    """
+
+    def __init__(self):
+        self._in_flight = {}
+        self.calls = 0
+        self.coalesced = 0
+        self.errors = 0
+
+    async def do(self, key, fn):
+        task = self._in_flight.get(key)
+        if task is None:
+            self.calls += 1
+            task = asyncio.ensure_future(fn())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda t: self._finish(key, t))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def _finish(self, key, task):
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+        # Retrieve the exception so it is never reported as "never retrieved"
+        # when every waiter has already gone away.
+        if not task.cancelled() and task.exception() is not None:
+            self.errors += 1
+
+    def stats(self):
+        requests = self.calls + self.coalesced
+        return {
+            "upstream_calls": self.calls,
+            "coalesced": self.coalesced,
+            "errors": self.errors,
+            "in_flight": len(self._in_flight),
+            "coalesced_fraction": self.coalesced / requests if requests else 0.0,
+        }
@@ -1,5 +1,181 @@
 
-# Placeholder for UV Index API integration
-def get_uv_index(lat, lon):
-    # Call a UV index provider (e.g., OpenWeatherMap) in production
-    return {"uv_index": 5.2}
+# UV index lookups for the sun-exposure advice.
+#
+# Nearby users see the same UV index, so lookups are bucketed to a coarse
+# lat/lon grid and cached per cell:
+#   - fresh entry (younger than ttl_seconds): served straight from memory
+#   - stale entry (up to max_stale_seconds): served immediately while one
+#     background refresh runs, so a slow provider never blocks a request
+#   - missing / too old: fetched, with concurrent lookups for the same cell
+#     sharing one provider call (SingleFlight)
+# Providers share one pooled httpx.AsyncClient. FakeUVProvider needs no network.
+
+import asyncio
+import math
+import os
+import time
+from collections import OrderedDict
+
+import httpx
+
+from backend.services.singleflight import SingleFlight
+
+
+# --- Providers ---
+class OpenWeatherMapProvider:
+    """UV index from the OpenWeatherMap One Call API (current.uvi)."""
+
+    URL = "https://api.openweathermap.org/data/3.0/onecall"
+
+    def __init__(self, client: httpx.AsyncClient, api_key: str):
+        self.client = client
+        self.api_key = api_key
+
+    async def fetch(self, lat, lon):
+        resp = await self.client.get(self.URL, params={
+            "lat": lat, "lon": lon, "exclude": "minutely,hourly,daily,alerts", "appid": self.api_key,
+        })
+        resp.raise_for_status()
+        return {"uv_index": float(resp.json()["current"]["uvi"])}
+
+
+class FakeUVProvider:
+    """Deterministic offline provider for local runs, tests and benchmarks."""
+
+    def __init__(self, latency_seconds=0.0, fail=False):
+        self.latency_seconds = latency_seconds
+        self.fail = fail
+        self.calls = 0
+
+    async def fetch(self, lat, lon):
+        self.calls += 1
+        if self.latency_seconds:
+            await asyncio.sleep(self.latency_seconds)
+        if self.fail:
+            raise httpx.ConnectError("fake UV provider is down")
+        # Higher near the equator, like the real thing
+        return {"uv_index": round(11.0 * math.cos(math.radians(lat)), 1)}
+
+
+# --- Cached service ---
+class UVService:
+    def __init__(self, provider, grid_degrees=0.25, ttl_seconds=1800, max_stale_seconds=6 * 3600,
+                 max_entries=10000, client: httpx.AsyncClient | None = None):
+        self.provider = provider
+        self.grid_degrees = grid_degrees
+        self.ttl_seconds = ttl_seconds
+        self.max_stale_seconds = max_stale_seconds
+        self.max_entries = max_entries
+        self.client = client  # closed by aclose(); None for the fake provider
+        self._entries = OrderedDict()  # cell -> (value, fetched_at)
+        self._flights = SingleFlight()
+        self._refreshing = set()
+        self._refresh_tasks = set()  # strong refs: the loop only keeps weak ones
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.refresh_errors = 0
+
+    def cell(self, lat, lon):
+        # lat=90 / lon=180 fold into the last cell instead of opening one past the edge
+        g = self.grid_degrees
+        return (min(math.floor(lat / g), math.ceil(90 / g) - 1),
+                min(math.floor(lon / g), math.ceil(180 / g) - 1))
+
+    def centre(self, cell):
+        """Where the provider is asked for a cell: its centre, kept inside the valid range."""
+        lat = (cell[0] + 0.5) * self.grid_degrees
+        lon = (cell[1] + 0.5) * self.grid_degrees
+        return min(max(lat, -90.0), 90.0), min(max(lon, -180.0), 180.0)
+
+    async def get(self, lat, lon):
+        if not (-90.0 <= lat <= 90.0 and -180.0 <= lon <= 180.0):
+            raise ValueError("lat must be in [-90, 90] and lon in [-180, 180].")
+        cell = self.cell(lat, lon)
+        entry = self._entries.get(cell)
+        if entry is not None:
+            age = time.monotonic() - entry[1]
+            if age < self.ttl_seconds:
+                self._entries.move_to_end(cell)
+                self.hits += 1
+                return entry[0]
+            if age < self.max_stale_seconds:
+                self._entries.move_to_end(cell)
+                self.stale_hits += 1
+                self._refresh_in_background(cell)
+                return entry[0]
+        self.misses += 1
+        return await self._flights.do(cell, lambda: self._fetch(cell))
+
+    async def _fetch(self, cell):
+        # Query the cell centre so every lookup in the cell asks the same thing
+        lat, lon = self.centre(cell)
+        value = dict(await self.provider.fetch(lat, lon), cell=[lat, lon])
+        self._entries[cell] = (value, time.monotonic())
+        self._entries.move_to_end(cell)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return value
+
+    def _refresh_in_background(self, cell):
+        if cell in self._refreshing:
+            return
+        self._refreshing.add(cell)
+
+        async def refresh():
+            try:
+                await self._flights.do(cell, lambda: self._fetch(cell))
+            except Exception as e:
+                # Keep serving the stale value; the next stale hit retries
+                self.refresh_errors += 1
+                print(f"UV refresh failed for cell {cell}: {e}")
+            finally:
+                self._refreshing.discard(cell)
+
+        task = asyncio.ensure_future(refresh())
+        self._refresh_tasks.add(task)
+        task.add_done_callback(self._refresh_tasks.discard)
+
+    async def aclose(self):
+        for task in list(self._refresh_tasks):
+            task.cancel()
+        await asyncio.gather(*self._refresh_tasks, return_exceptions=True)
+        if self.client is not None:
+            await self.client.aclose()
+
+    def stats(self):
+        lookups = self.hits + self.stale_hits + self.misses
+        return {
+            "cells": len(self._entries),
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.stale_hits) / lookups if lookups else 0.0,
+            "refresh_errors": self.refresh_errors,
+            "provider": self._flights.stats(),
+        }
+
+
+def uv_service_from_env():
+    """
+    OpenWeatherMap when OPENWEATHER_API_KEY is set, otherwise the fake provider.
+    Tuned by UV_GRID_DEGREES, UV_TTL_SECONDS, UV_MAX_STALE_SECONDS, UV_MAX_CELLS.
+    """
+    api_key = os.getenv("OPENWEATHER_API_KEY")
+    client = None
+    if api_key:
+        client = httpx.AsyncClient(
+            timeout=float(os.getenv("UV_PROVIDER_TIMEOUT_SECONDS", "5.0")),
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=10),
+        )
+        provider = OpenWeatherMapProvider(client, api_key)
+    else:
+        provider = FakeUVProvider()
+    return UVService(
+        provider,
+        grid_degrees=float(os.getenv("UV_GRID_DEGREES", "0.25")),
+        ttl_seconds=float(os.getenv("UV_TTL_SECONDS", "1800")),
+        max_stale_seconds=float(os.getenv("UV_MAX_STALE_SECONDS", str(6 * 3600))),
+        max_entries=int(os.getenv("UV_MAX_CELLS", "10000")),
+        client=client,
+    )
@@ -0,0 +1,50 @@
+import asyncio
+import hashlib
+
+import pytest
+
+from backend.services.blockchain_hash import MerkleAnchor, SimulatedChainClient, verify_inclusion
+
+
+def hashes(n):
+    return [hashlib.sha256(str(i).encode()).hexdigest() for i in range(n)]
+
+
+def test_cancelling_the_submitter_that_fills_a_batch_does_not_strand_the_others():
+    anchor = MerkleAnchor(SimulatedChainClient(latency_seconds=0.2), max_batch_size=4, max_wait_seconds=60)
+
+    async def main():
+        first = [asyncio.create_task(anchor.submit(h)) for h in hashes(3)]
+        await asyncio.sleep(0)
+        last = asyncio.create_task(anchor.submit(hashes(4)[3]))  # fills the batch
+        await asyncio.sleep(0.05)
+        last.cancel()
+        return await asyncio.wait_for(asyncio.gather(*first), timeout=2)
+
+    results = asyncio.run(main())
+    assert anchor.batches == 1
+    assert all(r["batch_size"] == 4 for r in results)
+    assert all(verify_inclusion(r["hash"], r["proof"], r["root"]) for r in results)
+
+
+def test_an_interrupted_flush_fails_its_waiters():
+    anchor = MerkleAnchor(SimulatedChainClient(latency_seconds=0.2), max_batch_size=100, max_wait_seconds=60)
+
+    async def main():
+        waiters = [asyncio.create_task(anchor.submit(h)) for h in hashes(3)]
+        await asyncio.sleep(0)
+        flush = asyncio.create_task(anchor.flush())
+        await asyncio.sleep(0.05)
+        flush.cancel()
+        return await asyncio.wait_for(asyncio.gather(*waiters, return_exceptions=True), timeout=2)
+
+    results = asyncio.run(main())
+    assert all(isinstance(r, RuntimeError) for r in results)
+    assert anchor.stats()["pending"] == 0
+
+
+def test_malformed_hash_is_rejected_before_batching():
+    anchor = MerkleAnchor(SimulatedChainClient())
+    with pytest.raises(ValueError):
+        asyncio.run(anchor.submit("not-hex"))
+    assert anchor.stats()["pending"] == 0
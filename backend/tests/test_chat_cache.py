@@ -0,0 +1,45 @@
+import json
+import sqlite3
+
+from backend.services.chat_cache import DEFAULT_CONTEXT, ChatCache
+
+
+def test_prewarmed_answers_without_context_match_requests_without_context(tmp_path):
+    warm_file = tmp_path / "faq.json"
+    warm_file.write_text(json.dumps([{"question": "What is BCC?", "reply": "Basal cell carcinoma."}]))
+    cache = ChatCache()
+    assert cache.prewarm(str(warm_file), "v1") == 1
+
+    # handle_chat answers context-less requests about DEFAULT_CONTEXT
+    assert cache.get(DEFAULT_CONTEXT, "what is bcc", "v1") == "Basal cell carcinoma."
+
+
+def test_persistent_tier_is_written_in_the_background_and_capped(tmp_path):
+    path = str(tmp_path / "chat_cache.db")
+    cache = ChatCache(persist_path=path, persist_max_entries=3)
+    for i in range(5):
+        cache.put("Psoriasis", f"question {i}", "v1", f"reply {i}")
+    cache.flush()
+    assert cache.stats()["persist_evictions"] == 2
+    cache.close()
+
+    with sqlite3.connect(path) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM chat_cache").fetchone()[0] == 3
+
+    # A fresh process finds the newest entries on disk
+    reopened = ChatCache(persist_path=path)
+    assert reopened.get("Psoriasis", "question 4", "v1") == "reply 4"
+    assert reopened.get("Psoriasis", "question 0", "v1") is None
+    assert reopened.persistent_hits == 1
+    reopened.close()
+
+
+def test_close_commits_queued_writes(tmp_path):
+    path = str(tmp_path / "chat_cache.db")
+    cache = ChatCache(persist_path=path)
+    cache.put("Eczema", "is it contagious", "v1", "No.")
+    cache.close()
+
+    reopened = ChatCache(persist_path=path)
+    assert reopened.get("Eczema", "Is it contagious?", "v1") == "No."
+    reopened.close()
@@ -0,0 +1,36 @@
+import pytest
+
+from backend.services.firebase_service import (
+    SQLiteBackend, ThreadedWriteBehind, WriteBehindQueue, persistence_from_env,
+)
+from backend.services.report_history import ReportHistoryStore
+
+
+def test_persistence_backend_is_chosen_from_env(monkeypatch, tmp_path):
+    monkeypatch.setenv("PERSISTENCE_DB", str(tmp_path / "persistence.db"))
+    monkeypatch.setenv("REPORT_HISTORY_DB", str(tmp_path / "report_history.db"))
+    monkeypatch.delenv("PERSISTENCE_BACKEND", raising=False)
+    assert isinstance(persistence_from_env().backend, ReportHistoryStore)
+    monkeypatch.setenv("PERSISTENCE_BACKEND", "sqlite")
+    assert isinstance(persistence_from_env().backend, SQLiteBackend)
+
+
+def test_unknown_persistence_backend_is_rejected(monkeypatch):
+    monkeypatch.setenv("PERSISTENCE_BACKEND", "firebase")  # a typo for firestore
+    with pytest.raises(ValueError, match="PERSISTENCE_BACKEND"):
+        persistence_from_env()
+
+
+def test_sync_server_predictions_reach_the_shared_history_store(tmp_path):
+    # A Flask server (ThreadedWriteBehind) writes; main_server's /reports reads the same file
+    path = str(tmp_path / "report_history.db")
+    persistence = ThreadedWriteBehind(WriteBehindQueue(ReportHistoryStore(path), flush_interval_seconds=0.01))
+    result = {"stage1": {"class": "Psoriasis", "confidence": 0.8}}
+    record_id = persistence.record("predictions", "u1", result)
+    persistence.close()
+
+    assert persistence.stats()["committed"] == 1
+    reader = ReportHistoryStore(path)
+    items = reader.query(user_id="u1", stage1="Psoriasis")["items"]
+    assert [item["record_id"] for item in items] == [record_id]
+    reader.close()
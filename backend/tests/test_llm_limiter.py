@@ -0,0 +1,137 @@
+# LLMAdmission against the fake upstream (backend/services/fake_llm.py),
+# served in-process over httpx's ASGI transport. Run from the repo root:
+#   python -m pytest backend/tests
+
+import asyncio
+
+import pytest
+
+from backend.services.llm_limiter import AdmissionRejected, LLMAdmission, TokenBucket
+
+
+@pytest.fixture
+def fake_llm(monkeypatch):
+    pytest.importorskip("httpx")
+    pytest.importorskip("fastapi")
+    pytest.importorskip("google.api_core")
+    from backend.services import fake_llm
+
+    monkeypatch.setattr(fake_llm, "LATENCY_SECONDS", 0.2)
+    monkeypatch.setattr(fake_llm, "REQUESTS_PER_MINUTE", 1000)
+    monkeypatch.setattr(fake_llm, "_stats", {"requests": 0, "rate_limited": 0, "max_concurrent": 0, "concurrent": 0})
+    fake_llm._recent_calls.clear()
+    return fake_llm
+
+
+async def connect(fake_llm):
+    import httpx
+
+    model = fake_llm.FakeGeminiModel("http://fake-llm")
+    await model._client.aclose()
+    model._client = httpx.AsyncClient(transport=httpx.ASGITransport(app=fake_llm.app), timeout=10.0)
+    return model
+
+
+async def ask(admission, model):
+    async with admission.slot():
+        return await model.generate_content_async("Is eczema contagious?")
+
+
+def run_concurrently(admission, fake_llm, calls):
+    async def main():
+        model = await connect(fake_llm)
+        try:
+            return await asyncio.gather(*(ask(admission, model) for _ in range(calls)), return_exceptions=True)
+        finally:
+            await model.aclose()
+
+    results = asyncio.run(main())
+    rejected = [r for r in results if isinstance(r, AdmissionRejected)]
+    answered = [r for r in results if not isinstance(r, BaseException)]
+    assert len(rejected) + len(answered) == calls, results
+    return answered, rejected
+
+
+def test_full_queue_is_rejected_with_503_and_retry_after(fake_llm):
+    admission = LLMAdmission(max_in_flight=2, requests_per_minute=6000, max_queue=2, max_wait_seconds=5)
+
+    answered, rejected = run_concurrently(admission, fake_llm, calls=8)
+
+    assert len(answered) == 4  # two in flight, two queued
+    assert [r.status_code for r in rejected] == [503] * 4
+    assert all(r.retry_after >= 1 for r in rejected)
+    assert fake_llm._stats["max_concurrent"] <= 2
+    assert fake_llm._stats["rate_limited"] == 0
+    assert admission.in_flight == 0
+
+
+def test_quota_exhaustion_is_rejected_with_429_before_the_upstream(fake_llm):
+    # Two tokens banked, then one per second: more than max_wait away
+    admission = LLMAdmission(max_in_flight=4, requests_per_minute=60, burst=2, max_wait_seconds=0.5)
+
+    answered, rejected = run_concurrently(admission, fake_llm, calls=4)
+
+    assert len(answered) == 2
+    assert [r.status_code for r in rejected] == [429, 429]
+    assert all(r.retry_after >= 1 for r in rejected)
+    assert fake_llm._stats["requests"] == 2  # the upstream never saw the rejected calls
+    assert admission.rejected_rate_limited == 2
+
+
+def test_upstream_429_drains_the_bucket(fake_llm, monkeypatch):
+    from google.api_core.exceptions import ResourceExhausted
+
+    monkeypatch.setattr(fake_llm, "REQUESTS_PER_MINUTE", 1)
+    admission = LLMAdmission(max_in_flight=4, requests_per_minute=6000, burst=4)
+
+    async def main():
+        model = await connect(fake_llm)
+        try:
+            await ask(admission, model)
+            with pytest.raises(ResourceExhausted):
+                await ask(admission, model)
+            admission.upstream_rate_limited()
+        finally:
+            await model.aclose()
+
+    asyncio.run(main())
+    assert admission.bucket.tokens < 1
+    assert admission.in_flight == 0
+
+
+def test_cancelled_callers_give_their_slots_back(fake_llm, monkeypatch):
+    monkeypatch.setattr(fake_llm, "LATENCY_SECONDS", 1.0)
+    admission = LLMAdmission(max_in_flight=1, requests_per_minute=6000, max_queue=4, max_wait_seconds=5)
+
+    async def main():
+        model = await connect(fake_llm)
+        try:
+            holder = asyncio.create_task(ask(admission, model))
+            await asyncio.sleep(0.05)
+            queued = asyncio.create_task(ask(admission, model))
+            await asyncio.sleep(0.05)
+            assert admission.stats()["in_flight"] == 1
+            assert admission.stats()["queue_depth"] == 1
+
+            queued.cancel()
+            holder.cancel()
+            await asyncio.gather(holder, queued, return_exceptions=True)
+            assert admission.in_flight == 0
+            assert admission.stats()["queue_depth"] == 0
+
+            # The freed slot goes straight to the next caller
+            monkeypatch.setattr(fake_llm, "LATENCY_SECONDS", 0.05)
+            return await asyncio.wait_for(ask(admission, model), timeout=2)
+        finally:
+            await model.aclose()
+
+    assert asyncio.run(main()).text
+    assert admission.in_flight == 0
+
+
+@pytest.mark.parametrize("rate", [0, -1.0])
+def test_token_bucket_rejects_non_positive_rate(rate):
+    with pytest.raises(ValueError):
+        TokenBucket(rate, 1)
+    with pytest.raises(ValueError):
+        LLMAdmission(requests_per_minute=rate)
@@ -0,0 +1,34 @@
+import os
+
+import pytest
+
+from backend.services.report_history import ReportHistoryStore
+
+
+def test_store_touches_the_disk_only_when_first_used(tmp_path):
+    path = tmp_path / "data" / "report_history.db"
+    store = ReportHistoryStore(str(path))
+    assert not (tmp_path / "data").exists()
+
+    store.write_batch([("predictions", "r1", {"user_id": "u1", "created_at": 1.0})])
+    assert os.path.exists(path)
+    assert [item["record_id"] for item in store.query(user_id="u1")["items"]] == ["r1"]
+
+    # Reopening after close() still finds the schema and the data
+    store.close()
+    assert store.get("r1") is not None
+    store.close()
+
+
+def test_rolled_back_batch_does_not_leave_dangling_label_ids(tmp_path):
+    store = ReportHistoryStore(str(tmp_path / "report_history.db"))
+    report = {"user_id": "u1", "created_at": 1.0, "stage1": {"class": "Eczema", "confidence": 0.9}}
+    # The second record is not JSON-serialisable, so the whole batch rolls back
+    with pytest.raises(TypeError):
+        store.write_batch([("predictions", "r1", report), ("predictions", "bad", {"created_at": object()})])
+    assert store.query(stage1="Eczema")["items"] == []
+
+    # WriteBehindQueue retries the good record; its label must exist for filters to find it
+    store.write_batch([("predictions", "r1", report)])
+    assert [item["record_id"] for item in store.query(stage1="Eczema")["items"]] == ["r1"]
+    store.close()
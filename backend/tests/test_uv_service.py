@@ -0,0 +1,109 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("httpx")
+
+from backend.services.uv_service import FakeUVProvider, UVService  # noqa: E402
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_lookups_in_the_same_cell_hit_the_cache():
+    provider = FakeUVProvider()
+    service = UVService(provider, grid_degrees=0.25)
+
+    async def main():
+        first = await service.get(12.01, 77.51)
+        second = await service.get(12.2, 77.7)  # same 0.25 degree cell
+        return first, second
+
+    first, second = run(main())
+    assert first is second
+    assert provider.calls == 1
+    assert (service.hits, service.misses) == (1, 1)
+
+
+def test_stale_entry_is_served_while_one_refresh_runs():
+    provider = FakeUVProvider(latency_seconds=0.1)
+    service = UVService(provider, ttl_seconds=0.15, max_stale_seconds=60)
+
+    async def main():
+        original = await service.get(12.0, 77.5)
+        await asyncio.sleep(0.16)
+        started = asyncio.get_running_loop().time()
+        stale = await asyncio.gather(*(service.get(12.0, 77.5) for _ in range(5)))
+        served_in = asyncio.get_running_loop().time() - started
+        await asyncio.sleep(0.12)  # let the refresh land
+        fresh = await service.get(12.0, 77.5)
+        return original, stale, served_in, fresh
+
+    original, stale, served_in, fresh = run(main())
+    assert all(value is original for value in stale)
+    assert served_in < 0.05  # never waited for the provider
+    assert service.stale_hits == 5
+    assert provider.calls == 2  # one initial fetch, one refresh for all five stale hits
+    assert fresh is not original and fresh == original
+    assert service.hits == 1
+    assert not service._refresh_tasks
+
+
+def test_failed_refresh_keeps_serving_the_stale_value():
+    provider = FakeUVProvider()
+    service = UVService(provider, ttl_seconds=0.05, max_stale_seconds=60)
+
+    async def main():
+        original = await service.get(12.0, 77.5)
+        provider.fail = True
+        await asyncio.sleep(0.06)
+        stale = await service.get(12.0, 77.5)
+        await asyncio.sleep(0.01)
+        return original, stale, await service.get(12.0, 77.5)
+
+    original, stale, again = run(main())
+    assert stale is original and again is original
+    assert service.refresh_errors >= 1
+
+
+def test_expired_entry_is_fetched_again():
+    provider = FakeUVProvider()
+    service = UVService(provider, ttl_seconds=0.01, max_stale_seconds=0.02)
+
+    async def main():
+        await service.get(12.0, 77.5)
+        await asyncio.sleep(0.03)
+        await service.get(12.0, 77.5)
+
+    run(main())
+    assert provider.calls == 2
+    assert (service.misses, service.stale_hits) == (2, 0)
+
+
+def test_concurrent_misses_share_one_provider_call():
+    provider = FakeUVProvider(latency_seconds=0.05)
+    service = UVService(provider)
+
+    async def main():
+        return await asyncio.gather(*(service.get(12.0 + i * 0.01, 77.5) for i in range(20)))
+
+    values = run(main())
+    assert provider.calls == 1
+    assert all(value == values[0] for value in values)
+    assert service.misses == 20
+
+
+def test_edges_stay_inside_the_valid_range():
+    service = UVService(FakeUVProvider(), grid_degrees=0.25)
+    assert service.cell(90.0, 180.0) == service.cell(89.9, 179.9)
+    for grid in (0.25, 0.7, 40):
+        service = UVService(FakeUVProvider(), grid_degrees=grid)
+        for lat, lon in ((90.0, 180.0), (-90.0, -180.0)):
+            centre_lat, centre_lon = service.centre(service.cell(lat, lon))
+            assert -90.0 <= centre_lat <= 90.0 and -180.0 <= centre_lon <= 180.0
+
+    value = run(service.get(90.0, 180.0))
+    assert -90.0 <= value["cell"][0] <= 90.0 and -180.0 <= value["cell"][1] <= 180.0
+    with pytest.raises(ValueError):
+        run(service.get(90.5, 0.0))
@@ -2,10 +2,12 @@
 Flask API for Two-Stage Skin Disease Prediction
 """
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 from flask_cors import CORS
 from two_stage_predictor import TwoStagePredictor
+import atexit
 import os
+import sys
 from werkzeug.utils import secure_filename
 import json
 from datetime import datetime
@@ -13,6 +15,20 @@ from datetime import datetime
 app = Flask(__name__)
 CORS(app)  # Enable CORS for frontend integration
 
+# On-demand profiler (shared with the backend servers; repo root on the path)
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.append(ROOT)
+from backend.services.profiler import (
+    PROFILE_PATH, TOKEN_HEADER, ProfilerError, artifact_headers, profiler_from_env,
+)
+from backend.services.firebase_service import ThreadedWriteBehind, persistence_from_env
+profiler = profiler_from_env()
+
+# Predictions are saved write-behind to the store main_server's /reports reads
+persistence = ThreadedWriteBehind(persistence_from_env())
+atexit.register(persistence.close)  # commits whatever is still buffered
+
 # Configuration
 UPLOAD_FOLDER = 'uploads'
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg'}
@@ -104,6 +120,7 @@ def predict():
             'timestamp': datetime.now().isoformat(),
             'confidence_threshold': confidence_threshold
         }
+        result['record_id'] = persistence.record('predictions', request.form.get('user_id'), result)
         
         # Optionally delete uploaded file after prediction
         # os.remove(filepath)
@@ -156,6 +173,7 @@ def predict_batch():
                     'filename': filename,
                     'timestamp': datetime.now().isoformat()
                 }
+                result['record_id'] = persistence.record('predictions', request.form.get('user_id'), result)
                 results.append(result)
                 
                 # Optionally delete file
@@ -202,11 +220,44 @@ def info():
             '/health': 'Health check',
             '/predict': 'Single image prediction (POST)',
             '/predict/batch': 'Batch image prediction (POST)',
-            '/info': 'API information (GET)'
+            '/info': 'API information (GET)',
+            '/persistence/stats': 'Saved-prediction queue stats (GET)'
         }
     })
 
 
+@app.route('/persistence/stats', methods=['GET'])
+def persistence_stats():
+    """Write-behind queue stats for this server's saved predictions"""
+    return jsonify(persistence.stats())
+
+
+@app.after_request
+def count_profiled_request(response):
+    """Counts requests for a requests=N profile capture (one attribute check when idle)"""
+    if profiler.active and request.path != PROFILE_PATH:
+        profiler.request_done()
+    return response
+
+
+@app.route(PROFILE_PATH, methods=['POST'])
+def debug_profile():
+    """
+    Python sampling profile or TensorFlow trace (needs PROFILER_TOKEN)
+    Query: kind=python|tensorflow, seconds=N or requests=N
+    """
+    try:
+        profiler.check_token(request.headers.get(TOKEN_HEADER))
+        filename, media_type, body, metadata = profiler.capture(
+            request.args.get('kind', 'python'),
+            request.args.get('seconds', type=float),
+            request.args.get('requests', type=int),
+        )
+    except ProfilerError as e:
+        return jsonify({'error': e.reason}), e.status_code
+    return Response(body, mimetype=media_type, headers=artifact_headers(filename, metadata))
+
+
 if __name__ == '__main__':
     print("\n" + "="*70)
     print("🚀 Starting Two-Stage Skin Disease Prediction API")
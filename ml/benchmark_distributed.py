@@ -0,0 +1,126 @@
+"""
+Multi-worker scaling: global training images/sec with 1..N workers.
+
+    python benchmark_distributed.py --workers 1,2,4
+    python benchmark_distributed.py --workers 1,2 --data-dir split_dataset_shards/train
+
+Each configuration starts N local worker processes (distributed.launch_local)
+that train a full MobileNetV2 data-parallel with the same setup as
+model1train.py (DistributedContext, per-worker batch, sharded input). Inputs
+are synthetic unless --data-dir is given. On one machine the workers share
+its cores (--threads per worker, default cores / N), so this measures the
+overhead of the data-parallel machinery; on separate boxes, run model1train.py
+with --workers to get the real speed-up.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+RESULT_PREFIX = "RESULT "
+
+
+def run_worker(args):
+    import tensorflow as tf
+
+    if args.threads:
+        tf.config.threading.set_intra_op_parallelism_threads(args.threads)
+        tf.config.threading.set_inter_op_parallelism_threads(2)
+
+    from keras.applications import MobileNetV2
+    from keras.callbacks import Callback
+    from keras.optimizers import Adam
+
+    from data_pipeline import IMG_SIZE, ImageFolder, make_train_dataset
+    from distributed import DistributedContext
+    from shard_cache import ShardCache
+
+    dist = DistributedContext.from_env()
+    global_batch = dist.global_batch_size(args.batch_size)
+
+    if args.data_dir:
+        is_shards = os.path.exists(os.path.join(args.data_dir, 'index.json'))
+        source = ShardCache(args.data_dir) if is_shards else ImageFolder(args.data_dir)
+        num_classes = source.num_classes
+
+        def dataset_fn(batch, shard):
+            return make_train_dataset(source, batch, 42, 0, 1000, shard=shard)
+    else:
+        num_classes = 10
+
+        def dataset_fn(batch, shard):
+            images = tf.random.uniform((batch, *IMG_SIZE, 3))
+            labels = tf.one_hot(tf.random.uniform((batch,), maxval=num_classes, dtype=tf.int32), num_classes)
+            return tf.data.Dataset.from_tensors((images, labels)).repeat()
+
+    with dist.strategy.scope():
+        model = MobileNetV2(weights=None, input_shape=IMG_SIZE + (3,), classes=num_classes)
+        model.compile(optimizer=Adam(dist.scaled_learning_rate(1e-4)), loss='categorical_crossentropy')
+
+    class StepTimer(Callback):
+        def on_train_batch_end(self, batch, logs=None):
+            float(logs['loss'])  # wait for the step to finish
+            if batch + 1 == args.warmup:
+                self.started = time.perf_counter()
+            self.ended = time.perf_counter()
+
+    timer = StepTimer()
+    model.fit(dist.distribute(dataset_fn, global_batch), epochs=1,
+              steps_per_epoch=args.warmup + args.steps, callbacks=[timer], verbose=0)
+    if dist.is_chief:
+        elapsed = timer.ended - timer.started
+        print(RESULT_PREFIX + json.dumps({
+            'workers': dist.num_workers,
+            'global_batch': global_batch,
+            'images_per_sec': global_batch * args.steps / elapsed,
+            'step_ms': elapsed / args.steps * 1000,
+        }), flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Training throughput with 1..N data-parallel workers.")
+    parser.add_argument('--workers', default='1,2,4', help="Worker counts to measure, comma-separated")
+    parser.add_argument('--batch-size', type=int, default=32, help="Per-worker batch")
+    parser.add_argument('--steps', type=int, default=20)
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--threads', type=int, default=None, help="Intra-op threads per worker (default: cores / N)")
+    parser.add_argument('--data-dir', default=None, help="Class folder or shard directory instead of synthetic input")
+    parser.add_argument('--verbose', action='store_true', help="Show the workers' output")
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args)
+        return
+
+    from distributed import launch_local
+
+    results = []
+    for n in [int(w) for w in args.workers.split(',')]:
+        threads = args.threads or max(1, (os.cpu_count() or 1) // n)
+        command = [sys.executable, os.path.abspath(__file__), '--worker', '--batch-size', str(args.batch_size),
+                   '--steps', str(args.steps), '--warmup', str(args.warmup), '--threads', str(threads)]
+        if args.data_dir:
+            command += ['--data-dir', args.data_dir]
+        print(f"🚀 {n} worker(s), {threads} thread(s) each...")
+        outcome = launch_local(n, command, echo=args.verbose)
+        if any(code != 0 for code, _ in outcome):
+            print(f"❌ Run with {n} worker(s) failed:")
+            print('\n'.join(outcome[0][1][-20:]))
+            sys.exit(1)
+        line = next(l for l in outcome[0][1] if l.startswith(RESULT_PREFIX))
+        results.append(json.loads(line[len(RESULT_PREFIX):]))
+
+    baseline = results[0]['images_per_sec'] / results[0]['workers']
+    print(f"\n{'workers':>7} {'global batch':>12} {'images/sec':>11} {'step ms':>8} {'speed-up':>8} {'efficiency':>10}")
+    for r in results:
+        speedup = r['images_per_sec'] / results[0]['images_per_sec']
+        efficiency = r['images_per_sec'] / (baseline * r['workers'])
+        print(f"{r['workers']:>7} {r['global_batch']:>12} {r['images_per_sec']:>11.1f} {r['step_ms']:>8.0f} "
+              f"{speedup:>7.2f}x {efficiency:>9.0%}")
+
+
+if __name__ == '__main__':
+    main()
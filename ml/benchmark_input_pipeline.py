@@ -0,0 +1,84 @@
+"""
+Images/sec of the training input pipelines: legacy ImageDataGenerator vs tf.data.
+
+    python benchmark_input_pipeline.py --data-dir split_dataset/train
+    python benchmark_input_pipeline.py --data-dir split_dataset/train --batches 100 --with-model
+    python benchmark_input_pipeline.py --data-dir split_dataset/train --shard-dir split_dataset_shards/train
+
+Both pipelines use the training augmentation. With --with-model each batch
+also goes through the frozen MobileNetV2 forward pass, so the number shows
+how much the input side holds the training step back.
+"""
+
+import argparse
+import time
+
+import tensorflow as tf
+from keras.src.legacy.preprocessing.image import ImageDataGenerator
+
+from data_pipeline import AUGMENTATION, IMG_SIZE, ImageFolder, make_train_dataset
+from shard_cache import ensure_shards
+
+SEED = 42
+
+
+def legacy_generator(data_dir, batch_size):
+    datagen = ImageDataGenerator(rescale=1./255, fill_mode='nearest', **AUGMENTATION)
+    return datagen.flow_from_directory(
+        data_dir, target_size=IMG_SIZE, batch_size=batch_size,
+        class_mode='categorical', shuffle=True, seed=SEED,
+    )
+
+
+def tfdata_iterator(source, batch_size, cache=None):
+    return iter(make_train_dataset(source, batch_size, SEED, 0, 1000, cache=cache))
+
+
+def measure(batches, warmup, n, step):
+    for _ in range(warmup):
+        step(next(batches)[0])
+    images = 0
+    started = time.perf_counter()
+    for _ in range(n):
+        x, _ = next(batches)
+        step(x)
+        images += int(x.shape[0])
+    elapsed = time.perf_counter() - started
+    return images / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare input pipeline throughput (images/sec).")
+    parser.add_argument('--data-dir', required=True, help="Class-per-subdirectory training folder")
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--batches', type=int, default=50)
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--cache', default=None, help="tf.data cache: 'memory' or a file path")
+    parser.add_argument('--shard-dir', default=None, help="Also measure tf.data from shards (built if stale)")
+    parser.add_argument('--with-model', action='store_true', help="Include a frozen MobileNetV2 forward pass")
+    args = parser.parse_args()
+
+    step = lambda x: None
+    if args.with_model:
+        from keras.applications import MobileNetV2
+        backbone = MobileNetV2(weights='imagenet', include_top=False, input_shape=IMG_SIZE + (3,), pooling='avg')
+        forward = tf.function(lambda x: backbone(x, training=False))
+        step = lambda x: forward(tf.convert_to_tensor(x)).numpy()
+
+    print(f"📂 {args.data_dir} | batch {args.batch_size} | {args.batches} batches"
+          f"{' | with MobileNetV2 forward' if args.with_model else ''}")
+    results = {
+        'ImageDataGenerator': measure(legacy_generator(args.data_dir, args.batch_size), args.warmup, args.batches, step),
+        'tf.data': measure(tfdata_iterator(ImageFolder(args.data_dir), args.batch_size, args.cache),
+                           args.warmup, args.batches, step),
+    }
+    if args.shard_dir:
+        shards = ensure_shards(args.data_dir, args.shard_dir)
+        results['tf.data (shards)'] = measure(tfdata_iterator(shards, args.batch_size), args.warmup, args.batches, step)
+    baseline = results['ImageDataGenerator']
+    for name, rate in results.items():
+        print(f"  {name:<20} {rate:8.1f} images/sec  ({rate / baseline:.2f}x)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""
+Preprocessing speed per backend and input size: which backend should serve?
+
+    python benchmark_preprocessing.py
+    python benchmark_preprocessing.py --sizes 640x480,3024x4032 --repeats 50 --format png
+
+For every input size a synthetic photo is encoded once (JPEG by default) and
+preprocessing.preprocess_image(bytes) is timed with each backend, end to end
+(decode, resize, float32 scaling), single-threaded in this process. Prints
+mean and p95 ms per image and marks the fastest backend for each size; set
+PREPROCESS_BACKEND on the servers accordingly.
+"""
+
+import argparse
+import io
+import json
+import time
+
+import numpy as np
+
+import preprocessing
+from test_preprocessing import backend_available, synthetic_image
+
+
+def encode(width, height, fmt):
+    buffer = io.BytesIO()
+    synthetic_image(width, height).save(buffer, format=fmt, quality=90)
+    return buffer.getvalue()
+
+
+def time_backend(data, backend, repeats, warmup):
+    for _ in range(warmup):
+        preprocessing.preprocess_image(data, backend=backend)
+    times = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        preprocessing.preprocess_image(data, backend=backend)
+        times.append((time.perf_counter() - started) * 1000)
+    return {'mean_ms': float(np.mean(times)), 'p95_ms': float(np.percentile(times, 95))}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time each preprocessing backend per input size.")
+    parser.add_argument('--sizes', default='224x224,640x480,1280x960,2048x1536,3024x4032')
+    parser.add_argument('--format', default='jpeg', choices=['jpeg', 'png'])
+    parser.add_argument('--repeats', type=int, default=30)
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--output', default=None, help="Also write the results as JSON")
+    args = parser.parse_args()
+
+    backends = [b for b in preprocessing.BACKENDS if backend_available(b)]
+    results = []
+    print(f"{'input':>10} {'KiB':>6} " + " ".join(f"{b + ' ms':>13}" for b in backends) + "  fastest")
+    for size in args.sizes.split(','):
+        width, height = (int(v) for v in size.lower().split('x'))
+        data = encode(width, height, args.format.upper())
+        timings = {b: time_backend(data, b, args.repeats, args.warmup) for b in backends}
+        fastest = min(timings, key=lambda b: timings[b]['mean_ms'])
+        results.append({'size': size, 'bytes': len(data), 'timings': timings, 'fastest': fastest})
+        cells = " ".join(f"{timings[b]['mean_ms']:>6.2f} ({timings[b]['p95_ms']:>4.1f})" for b in backends)
+        print(f"{size:>10} {len(data) // 1024:>6} {cells}  🏆 {fastest}")
+    print("\n(mean ms per image, p95 in brackets)")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'format': args.format, 'results': results}, f, indent=2)
+        print(f"✅ Results saved to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
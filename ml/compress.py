@@ -0,0 +1,324 @@
+"""
+Model compression: channel pruning, magnitude pruning and weight clustering,
+each followed by a short recovery fine-tune, with a trade-off table to pick
+the CPU serving operating point.
+
+    python compress.py --data split_dataset
+    python compress.py --model models/finetuned_model.h5 --data split_dataset \\
+        --channels 0,0.25,0.5 --sparsity 0,0.5,0.75 --clusters 0,16 --epochs 2
+
+Every combination of --channels x --sparsity x --clusters is one operating
+point, applied to a fresh copy of each --model (Stage 1 and Stage 2 by default):
+  - channels:  fraction of the expanded channels removed from every
+               MobileNetV2 inverted-residual block (lowest L1 norm first,
+               multiples of 8 kept). The layers really shrink, so this is
+               the one that lowers FLOPs and latency.
+  - sparsity:  fraction of each Conv2D/Dense kernel zeroed by magnitude.
+  - clusters:  each kernel keeps only K distinct values (1-D k-means).
+Sparsity and clustering leave the dense kernels the same shape, so they do not
+speed up TensorFlow's convolutions; they make the file compress much better
+(the gzip column), which is what matters for shipping and loading.
+
+Recovery fine-tune: the compressed model learns to match the original
+model's predictions on the --data images (no labels needed, so it works for
+Stage 2 too). After every step, pruned weights are put back to zero and
+clustered weights back to their cluster mean.
+
+Output per model: <out-dir>/<model>_c<channels>_s<sparsity>_k<clusters>.h5
+(load it like the original), and a table of params, sparsity, accuracy
+(true labels, when the dataset has the model's classes), agreement with the
+original, p50 latency, load time and raw/gzip size, also saved as
+<out-dir>/compression_report.json.
+"""
+
+import argparse
+import gzip
+import itertools
+import json
+import os
+import time
+
+import numpy as np
+import tensorflow as tf
+from keras import layers
+from keras.models import clone_model, load_model
+from keras.optimizers import Adam
+
+from data_pipeline import ImageFolder, make_eval_dataset, make_train_dataset
+from distill import latency_ms
+
+SEED = 42
+BATCH_SIZE = 32
+PRUNABLE = (layers.Conv2D, layers.Dense)  # DepthwiseConv2D kernels are tiny and sensitive: left dense
+
+
+def all_layers(model):
+    """Every layer, including those inside nested models (e.g. a Sequential around MobileNetV2)."""
+    for layer in model.layers:
+        if hasattr(layer, 'layers'):
+            yield from all_layers(layer)
+        else:
+            yield layer
+
+
+# ==========================
+# CHANNEL PRUNING
+# ==========================
+def inverted_residual_blocks(model):
+    """{block prefix: (expand, expand BN, depthwise, depthwise BN, project)} for MobileNetV2-style blocks."""
+    by_name = {layer.name: layer for layer in all_layers(model)}
+    blocks = {}
+    for name, layer in by_name.items():
+        if not name.endswith('_expand') or not isinstance(layer, layers.Conv2D):
+            continue
+        prefix = name[:-len('_expand')]
+        names = [f'{prefix}_expand', f'{prefix}_expand_BN', f'{prefix}_depthwise',
+                 f'{prefix}_depthwise_BN', f'{prefix}_project']
+        if all(n in by_name for n in names):
+            blocks[prefix] = names
+    return blocks
+
+
+def prune_channels(model, fraction):
+    """
+    Copy of `model` with `fraction` of the expanded channels of every inverted
+    residual block removed. Returns (model, number of blocks pruned).
+    """
+    blocks = inverted_residual_blocks(model)
+    if fraction <= 0 or not blocks:
+        return model, 0
+    by_name = {layer.name: layer for layer in all_layers(model)}
+
+    keep = {}  # block prefix -> sorted channel indices to keep
+    for prefix, names in blocks.items():
+        kernel = by_name[names[0]].get_weights()[0]  # (1, 1, in, expanded)
+        channels = kernel.shape[-1]
+        n_keep = min(channels, max(8, int(round(channels * (1 - fraction) / 8)) * 8))
+        importance = np.abs(kernel).sum(axis=(0, 1, 2))
+        keep[prefix] = np.sort(np.argsort(importance)[-n_keep:])
+
+    expand_filters = {names[0]: len(keep[prefix]) for prefix, names in blocks.items()}
+
+    def clone_layer(layer):
+        config = layer.get_config()
+        if layer.name in expand_filters:
+            config['filters'] = expand_filters[layer.name]
+        return layer.__class__.from_config(config)
+
+    pruned = clone_model(model, clone_function=clone_layer, recursive=True)
+
+    sliced = {}  # layer name -> new weights
+    for prefix, names in blocks.items():
+        idx = keep[prefix]
+        expand, expand_bn, depthwise, depthwise_bn, project = (by_name[n].get_weights() for n in names)
+        sliced[names[0]] = [expand[0][..., idx]] + [b[idx] for b in expand[1:]]
+        sliced[names[1]] = [w[idx] for w in expand_bn]
+        sliced[names[2]] = [depthwise[0][:, :, idx, :]] + [b[idx] for b in depthwise[1:]]
+        sliced[names[3]] = [w[idx] for w in depthwise_bn]
+        sliced[names[4]] = [project[0][:, :, idx, :]] + project[1:]
+    for layer in all_layers(pruned):
+        layer.set_weights(sliced.get(layer.name, by_name[layer.name].get_weights()))
+    return pruned, len(blocks)
+
+
+# ==========================
+# MAGNITUDE PRUNING + CLUSTERING
+# ==========================
+def kmeans_1d(values, k, iterations=15):
+    """Cluster ids and centroids of a 1-D array; centroids start evenly spaced (linear init)."""
+    centroids = np.linspace(values.min(), values.max(), k)
+    for _ in range(iterations):
+        ids = np.searchsorted((centroids[1:] + centroids[:-1]) / 2, values)
+        counts = np.bincount(ids, minlength=k)
+        sums = np.bincount(ids, weights=values, minlength=k)
+        centroids = np.where(counts > 0, sums / np.maximum(counts, 1), centroids)
+    ids = np.searchsorted((centroids[1:] + centroids[:-1]) / 2, values)
+    return ids, centroids
+
+
+class KernelConstraints:
+    """
+    Per kernel: a mask (pruned weights stay zero) and cluster ids (weights in
+    a cluster share one value). `project()` restores both after an update.
+    """
+
+    def __init__(self, model, sparsity, clusters):
+        self.kernels = []  # (variable, mask, segment ids, segments)
+        for layer in all_layers(model):
+            if not isinstance(layer, PRUNABLE) or getattr(layer, 'kernel', None) is None:
+                continue
+            w = layer.kernel.numpy()
+            mask = np.ones_like(w)
+            if sparsity > 0:
+                threshold = np.quantile(np.abs(w), sparsity)
+                mask = (np.abs(w) > threshold).astype(w.dtype)
+            w = w * mask
+            ids, segments = None, None
+            if clusters > 0:
+                flat, kept = w.reshape(-1), mask.reshape(-1) > 0
+                kept_ids, centroids = kmeans_1d(flat[kept], clusters)
+                ids = np.full(flat.shape, clusters, dtype=np.int32)  # pruned weights: their own segment
+                ids[kept] = kept_ids
+                flat = np.where(kept, centroids[np.minimum(ids, clusters - 1)], 0.0)
+                w, segments = flat.reshape(w.shape).astype(w.dtype), clusters + 1
+            layer.kernel.assign(w)
+            self.kernels.append((layer.kernel, tf.constant(mask),
+                                 None if ids is None else tf.constant(ids), segments))
+
+    @tf.function
+    def project(self):
+        for variable, mask, ids, segments in self.kernels:
+            w = variable
+            if ids is not None:
+                flat = tf.reshape(w, [-1])
+                w = tf.reshape(tf.gather(tf.math.unsorted_segment_mean(flat, ids, segments), ids), tf.shape(w))
+            variable.assign(w * mask)
+
+
+# ==========================
+# RECOVERY + MEASUREMENT
+# ==========================
+def recover(model, original, source, epochs, steps_per_epoch, learning_rate, constraints):
+    """Fine-tune `model` to match `original`'s predictions, re-applying the constraints after every step."""
+    if epochs <= 0:
+        return
+    optimizer = Adam(learning_rate)
+    kl = tf.keras.losses.KLDivergence()
+
+    @tf.function
+    def train_step(x):
+        target = original(x, training=False)
+        with tf.GradientTape() as tape:
+            loss = kl(target, model(x, training=True))
+        grads = tape.gradient(loss, model.trainable_variables)
+        optimizer.apply_gradients(zip(grads, model.trainable_variables))
+        return loss
+
+    steps = min(source.steps(BATCH_SIZE), steps_per_epoch or source.steps(BATCH_SIZE))
+    dataset = make_train_dataset(source, BATCH_SIZE, SEED, 0, epochs)
+    for step, (x, _) in enumerate(dataset.take(steps * epochs), 1):
+        loss = train_step(x)
+        constraints.project()
+        if step % steps == 0:
+            print(f"   🔁 Recovery epoch {step // steps}/{epochs}: KL {float(loss):.4f}")
+
+
+def reference_predictions(original, source):
+    return [original.predict_on_batch(x).argmax(axis=1) for x, _ in make_eval_dataset(source, BATCH_SIZE)]
+
+
+def accuracy_and_agreement(model, source, reference):
+    """(accuracy vs true labels or None if the classes differ, agreement with the original model)."""
+    with_labels = model.output_shape[-1] == source.num_classes
+    correct = agree = total = 0
+    for (x, y), ref in zip(make_eval_dataset(source, BATCH_SIZE), reference):
+        predicted = model.predict_on_batch(x).argmax(axis=1)
+        if with_labels:
+            correct += int((predicted == y.numpy().argmax(axis=1)).sum())
+        agree += int((predicted == ref).sum())
+        total += len(ref)
+    return (correct / total if with_labels else None), agree / total
+
+
+def kernel_sparsity(model):
+    zeros = total = 0
+    for layer in all_layers(model):
+        if isinstance(layer, PRUNABLE) and getattr(layer, 'kernel', None) is not None:
+            w = layer.kernel.numpy()
+            zeros += int((w == 0).sum())
+            total += w.size
+    return zeros / max(total, 1)
+
+
+def measure(model, path, eval_source, reference):
+    model.save(path)
+    with open(path, 'rb') as f:
+        raw = f.read()
+    started = time.perf_counter()
+    load_model(path, compile=False)
+    load_ms = (time.perf_counter() - started) * 1000
+    accuracy, agreement = accuracy_and_agreement(model, eval_source, reference)
+    forward = tf.function(lambda x: model(x, training=False))
+    return {
+        'params': int(model.count_params()),
+        'sparsity': kernel_sparsity(model),
+        'accuracy': accuracy,
+        'agreement': agreement,
+        'latency_p50_ms': latency_ms(forward)['p50_ms'],
+        'load_ms': load_ms,
+        'size_mb': len(raw) / 1e6,
+        'gzip_mb': len(gzip.compress(raw, 6)) / 1e6,
+    }
+
+
+def print_table(model_path, rows):
+    print(f"\n📊 {model_path}")
+    print(f"{'point':<18} {'params':>10} {'sparsity':>8} {'accuracy':>8} {'agree':>6} "
+          f"{'p50 ms':>7} {'load ms':>7} {'MB':>6} {'gzip MB':>7}")
+    for row in rows:
+        accuracy = f"{row['accuracy']:.4f}" if row['accuracy'] is not None else '-'
+        print(f"{row['point']:<18} {row['params']:>10,} {row['sparsity']:>8.1%} {accuracy:>8} "
+              f"{row['agreement']:>6.3f} {row['latency_p50_ms']:>7.1f} {row['load_ms']:>7.0f} "
+              f"{row['size_mb']:>6.1f} {row['gzip_mb']:>7.1f}")
+
+
+def floats(text):
+    return [float(v) for v in text.split(',')]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prune and cluster models; print the size/accuracy/latency trade-off.")
+    parser.add_argument('--model', action='append', default=None,
+                        help="Model to compress (repeatable; default: the Stage 1 and Stage 2 models)")
+    parser.add_argument('--data', required=True, help="Dataset root with train/ and val/ (or test/) class folders")
+    parser.add_argument('--channels', type=floats, default=[0.0, 0.25], help="Channel pruning fractions")
+    parser.add_argument('--sparsity', type=floats, default=[0.0, 0.5], help="Magnitude pruning fractions")
+    parser.add_argument('--clusters', default='0,16', help="Clusters per kernel (0 = off)")
+    parser.add_argument('--epochs', type=int, default=1, help="Recovery fine-tune epochs per point")
+    parser.add_argument('--steps-per-epoch', type=int, default=None)
+    parser.add_argument('--learning-rate', type=float, default=1e-4)
+    parser.add_argument('--out-dir', default=os.path.join("models", "compressed"))
+    args = parser.parse_args()
+
+    models = args.model or [os.path.join("models", "finetuned_model.h5"), os.path.join("models", "skin_cancer_model.h5")]
+    clusters = [int(c) for c in args.clusters.split(',')]
+    train_source = ImageFolder(os.path.join(args.data, 'train'))
+    split = 'test' if os.path.isdir(os.path.join(args.data, 'test')) else 'val'
+    eval_source = ImageFolder(os.path.join(args.data, split))
+    os.makedirs(args.out_dir, exist_ok=True)
+
+    report = {}
+    for model_path in models:
+        original = load_model(model_path, compile=False)
+        name = os.path.splitext(os.path.basename(model_path))[0]
+        reference = reference_predictions(original, eval_source)
+        rows = [dict(point='original', **measure(original, os.path.join(args.out_dir, f"{name}_original.h5"),
+                                                 eval_source, reference))]
+        for channels, sparsity, k in itertools.product(args.channels, args.sparsity, clusters):
+            if channels == 0 and sparsity == 0 and k == 0:
+                continue
+            point = f"c{channels:g}_s{sparsity:g}_k{k}"
+            print(f"\n✂️  {name}: {point}")
+            model, blocks = prune_channels(original, channels)
+            if model is original:
+                model = clone_model(original)
+                model.set_weights(original.get_weights())
+            elif blocks:
+                print(f"   {blocks} inverted residual blocks narrowed")
+            if channels > 0 and not blocks:
+                print("   ⚠️  No MobileNetV2 blocks found: channel pruning skipped")
+            constraints = KernelConstraints(model, sparsity, k)
+            recover(model, original, train_source, args.epochs, args.steps_per_epoch, args.learning_rate, constraints)
+            row = measure(model, os.path.join(args.out_dir, f"{name}_{point}.h5"), eval_source, reference)
+            rows.append(dict(point=point, **row))
+        print_table(model_path, rows)
+        report[model_path] = rows
+
+    report_path = os.path.join(args.out_dir, "compression_report.json")
+    with open(report_path, 'w') as f:
+        json.dump({'split': split, 'models': report}, f, indent=2)
+    print(f"\n✅ Compressed models and report saved in {args.out_dir}")
+
+
+if __name__ == '__main__':
+    main()
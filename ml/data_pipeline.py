@@ -0,0 +1,273 @@
+"""
+tf.data input pipeline for model1train.py (replaces ImageDataGenerator.flow_from_directory).
+
+- Same files, class order and class indices as flow_from_directory
+  (sorted sub-directories, same extensions, same file order).
+- Decode + resize run in parallel (preprocessing.tf_decode, nearest neighbour);
+  augmentation runs vectorised on whole batches; AUTOTUNE prefetch.
+- Same augmentation as the old train_datagen: rotation, shifts, shear, zoom
+  (one affine warp, bilinear, 'nearest' fill), flips, then brightness.
+- Deterministic: epoch e is shuffled with seed (SEED, e) and batch b of that
+  epoch is augmented with seed (SEED + e, b), so a run is reproducible and
+  any epoch can be regenerated on its own (e.g. when resuming).
+- Optional caching of decoded 224x224 uint8 images (in memory or in a file),
+  or streaming from pre-resized shards (shard_cache.py) with no decoding at all.
+- Optional per-worker sharding for multi-worker training (distributed.py):
+  every worker computes the same epoch order and keeps a disjoint slice.
+
+Labels are one-hot float32, so model.fit(..., class_weight=...) works as before.
+"""
+
+import math
+import os
+
+import numpy as np
+import tensorflow as tf
+
+from preprocessing import IMG_SIZE, tf_decode
+
+AUTOTUNE = tf.data.AUTOTUNE
+# flow_from_directory's white list
+IMAGE_EXTENSIONS = ('png', 'jpg', 'jpeg', 'bmp', 'ppm', 'tif', 'tiff')
+
+# Same settings as the ImageDataGenerator in model1train.py
+AUGMENTATION = {
+    'rotation_range': 30,
+    'width_shift_range': 0.15,
+    'height_shift_range': 0.15,
+    'horizontal_flip': True,
+    'vertical_flip': True,
+    'zoom_range': 0.15,
+    'brightness_range': (0.7, 1.3),
+    'shear_range': 0.1,
+}
+# Shuffle buffer (images) for epochs read from the decode cache; ~150 MB at 224x224
+CACHE_SHUFFLE_BUFFER = 1024
+
+
+class ImageFolder:
+    """File list of a class-per-subdirectory dataset, in flow_from_directory order."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        class_names = sorted(
+            d for d in os.listdir(directory) if os.path.isdir(os.path.join(directory, d))
+        )
+        self.class_indices = {name: i for i, name in enumerate(class_names)}
+        self.filenames = []
+        classes = []
+        for name in class_names:
+            class_dir = os.path.join(directory, name)
+            for root, _, files in sorted(os.walk(class_dir), key=lambda entry: entry[0]):
+                for fname in sorted(files):
+                    if fname.lower().endswith(IMAGE_EXTENSIONS):
+                        self.filenames.append(os.path.join(root, fname))
+                        classes.append(self.class_indices[name])
+        self.classes = np.array(classes, dtype=np.int32)
+
+    @property
+    def samples(self):
+        return len(self.filenames)
+
+    @property
+    def num_classes(self):
+        return len(self.class_indices)
+
+    def steps(self, batch_size):
+        return math.ceil(self.samples / batch_size)
+
+
+def shard_steps(source, batch_size, num_shards):
+    """steps_per_epoch for one worker of make_train_dataset(..., shard=(num_shards, i))."""
+    return math.ceil(source.samples // num_shards / batch_size)
+
+
+# ==========================
+# DECODE
+# ==========================
+def decode_image(path, img_size=IMG_SIZE):
+    """File -> uint8 (h, w, 3), resized with nearest neighbour exactly like serving (preprocessing.tf_decode)."""
+    return tf_decode(tf.io.read_file(path), img_size)
+
+
+def _files(folder):
+    return tf.data.Dataset.from_tensor_slices((folder.filenames, folder.classes))
+
+
+def _decode(ds, folder, img_size):
+    """(path, class) -> (uint8 image, one-hot float32 label)."""
+    return ds.map(
+        lambda path, label: (decode_image(path, img_size), tf.one_hot(label, folder.num_classes)),
+        num_parallel_calls=AUTOTUNE,
+    )
+
+
+def _cached(ds, cache):
+    if cache == 'memory':
+        return ds.cache()
+    return ds.cache(cache) if cache else ds
+
+
+# ==========================
+# AUGMENTATION (batched)
+# ==========================
+def _affine_transforms(seed, batch, height, width, aug):
+    """
+    Per-image output->input affine maps in ImageProjectiveTransformV3 layout.
+    Built as rotation @ shift @ shear @ zoom around the image centre, the
+    same composition ImageDataGenerator.apply_affine_transform uses.
+    """
+    seeds = tf.random.experimental.stateless_split(seed, num=6)
+
+    def uniform(i, low, high, n=batch):
+        return tf.random.stateless_uniform([n], seeds[i], low, high)
+
+    theta = uniform(0, -aug['rotation_range'], aug['rotation_range']) * (math.pi / 180)
+    tx = uniform(1, -aug['width_shift_range'], aug['width_shift_range']) * width
+    ty = uniform(2, -aug['height_shift_range'], aug['height_shift_range']) * height
+    shear = uniform(3, -aug['shear_range'], aug['shear_range']) * (math.pi / 180)
+    zx = uniform(4, 1 - aug['zoom_range'], 1 + aug['zoom_range'])
+    zy = uniform(5, 1 - aug['zoom_range'], 1 + aug['zoom_range'])
+
+    zeros, ones = tf.zeros([batch]), tf.ones([batch])
+
+    def matrix(rows):
+        return tf.stack([tf.stack(row, axis=-1) for row in rows], axis=-2)  # (batch, 3, 3)
+
+    rotation = matrix([[tf.cos(theta), -tf.sin(theta), zeros], [tf.sin(theta), tf.cos(theta), zeros], [zeros, zeros, ones]])
+    shift = matrix([[ones, zeros, tx], [zeros, ones, ty], [zeros, zeros, ones]])
+    shear_m = matrix([[ones, -tf.sin(shear), zeros], [zeros, tf.cos(shear), zeros], [zeros, zeros, ones]])
+    zoom = matrix([[zx, zeros, zeros], [zeros, zy, zeros], [zeros, zeros, ones]])
+
+    cx, cy = width / 2 - 0.5, height / 2 - 0.5
+    offset = tf.convert_to_tensor([[1.0, 0.0, cx], [0.0, 1.0, cy], [0.0, 0.0, 1.0]])
+    reset = tf.convert_to_tensor([[1.0, 0.0, -cx], [0.0, 1.0, -cy], [0.0, 0.0, 1.0]])
+    m = offset @ rotation @ shift @ shear_m @ zoom @ reset
+    return tf.concat([tf.reshape(m[:, :2, :], [batch, 6]), tf.zeros([batch, 2])], axis=1)
+
+
+def augment_batch(images, seed, aug=AUGMENTATION):
+    """uint8 batch -> augmented float32 batch in [0, 1]."""
+    shape = tf.shape(images)
+    batch, height, width = shape[0], shape[1], shape[2]
+    x = tf.cast(images, tf.float32)
+    seeds = tf.random.experimental.stateless_split(seed, num=4)
+
+    transforms = _affine_transforms(
+        seeds[0], batch, tf.cast(height, tf.float32), tf.cast(width, tf.float32), aug
+    )
+    x = tf.raw_ops.ImageProjectiveTransformV3(
+        images=x, transforms=transforms, output_shape=shape[1:3], fill_value=0.0,
+        interpolation='BILINEAR', fill_mode='NEAREST',
+    )
+
+    if aug['horizontal_flip']:
+        flip = tf.random.stateless_uniform([batch, 1, 1, 1], seeds[1]) < 0.5
+        x = tf.where(flip, tf.reverse(x, axis=[2]), x)
+    if aug['vertical_flip']:
+        flip = tf.random.stateless_uniform([batch, 1, 1, 1], seeds[2]) < 0.5
+        x = tf.where(flip, tf.reverse(x, axis=[1]), x)
+
+    if aug['brightness_range']:
+        # Mirrors the legacy brightness shift: the image is min/max stretched to
+        # 0..255 (array_to_img(scale=True)), truncated to uint8, then PIL's
+        # Brightness enhancer scales it and clips to 0..255.
+        low = tf.reduce_min(x, axis=[1, 2, 3], keepdims=True)
+        x = x - low
+        high = tf.reduce_max(x, axis=[1, 2, 3], keepdims=True)
+        x = tf.floor(tf.math.divide_no_nan(x, high) * 255.0)
+        factor = tf.random.stateless_uniform([batch, 1, 1, 1], seeds[3], *aug['brightness_range'])
+        x = tf.clip_by_value(tf.round(x * factor), 0.0, 255.0)
+
+    return x * (1.0 / 255)
+
+
+# ==========================
+# DATASETS
+# ==========================
+# `source` is an ImageFolder (decode JPEGs on the fly) or an indexed source of
+# already-decoded uint8 images such as shard_cache.ShardCache (same
+# attributes plus read(indices) -> (n, h, w, 3)).
+def _shard(ds, shard, shard_samples):
+    if shard is None or shard[0] == 1:
+        return ds
+    return ds.shard(*shard).take(shard_samples)
+
+
+def _read_indexed(source, indices):
+    """Image indices -> (uint8 batch, one-hot labels) from an indexed source."""
+    images = tf.numpy_function(source.read, [indices], tf.uint8, stateful=False)
+    images.set_shape([None, *source.img_size, 3])
+    labels = tf.one_hot(tf.gather(source.classes, indices), source.num_classes)
+    return images, labels
+
+
+def make_train_dataset(source, batch_size, seed, start_epoch, end_epoch, cache=None,
+                       augmentation=AUGMENTATION, img_size=IMG_SIZE, shard=None):
+    """
+    Batches for epochs [start_epoch, end_epoch), back to back. Pass
+    steps_per_epoch=source.steps(batch_size) to model.fit so Keras keeps one
+    iterator across epochs. `cache` only applies to an ImageFolder.
+
+    shard=(count, index): this worker's slice of every epoch, count workers
+    together covering the epoch. Every slice has samples // count images, so
+    all workers run the same number of steps (see shard_steps).
+    """
+    samples = source.samples
+    num_shards, shard_index = shard or (1, 0)
+    shard_samples = samples // num_shards
+    indexed = not isinstance(source, ImageFolder)
+    if not indexed:
+        files = _files(source)
+        # With a cache, decode once in a seeded random order (so the cache is not
+        # sorted by class); each epoch then shuffles it with a bounded buffer
+        decoded = None
+        if cache:
+            mixed = files.shuffle(samples, seed=seed, reshuffle_each_iteration=False)
+            decoded = _cached(_decode(mixed, source, img_size), cache)
+
+    def one_epoch(epoch):
+        if indexed:
+            # Exact shuffle by index; shards are random access
+            order = tf.argsort(tf.random.stateless_uniform([samples], tf.stack([tf.constant(seed, tf.int64), epoch])))
+            if num_shards > 1:
+                order = order[shard_index::num_shards][:shard_samples]
+            ds = tf.data.Dataset.from_tensor_slices(order).batch(batch_size)
+            ds = ds.map(lambda idx: _read_indexed(source, idx), num_parallel_calls=AUTOTUNE)
+        else:
+            if cache:
+                buffer = min(samples, CACHE_SHUFFLE_BUFFER)
+                ds = _shard(decoded.shuffle(buffer, seed=seed + epoch, reshuffle_each_iteration=False),
+                            shard, shard_samples)
+            else:
+                # Shuffle paths, not pixels: the buffer stays a few MB
+                paths = _shard(files.shuffle(samples, seed=seed + epoch, reshuffle_each_iteration=False),
+                               shard, shard_samples)
+                ds = _decode(paths, source, img_size)
+            ds = ds.batch(batch_size)
+        return ds.enumerate().map(
+            lambda b, item: (augment_batch(item[0], tf.stack([seed + epoch, b]), augmentation), item[1]),
+            num_parallel_calls=AUTOTUNE,
+        )
+
+    epochs = tf.data.Dataset.range(start_epoch, end_epoch)
+    ds = epochs.flat_map(one_epoch)
+    options = tf.data.Options()
+    options.deterministic = True
+    return ds.with_options(options).prefetch(AUTOTUNE)
+
+
+def make_eval_dataset(source, batch_size, cache=None, img_size=IMG_SIZE, shard=None):
+    """
+    Unshuffled, unaugmented batches in source order (labels match
+    source.classes). shard=(count, index) keeps every count-th image.
+    """
+    if isinstance(source, ImageFolder):
+        files = _files(source).shard(*shard) if shard else _files(source)
+        ds = _cached(_decode(files, source, img_size), cache).batch(batch_size)
+    else:
+        ds = tf.data.Dataset.range(source.samples)
+        ds = (ds.shard(*shard) if shard else ds).batch(batch_size)
+        ds = ds.map(lambda idx: _read_indexed(source, idx), num_parallel_calls=AUTOTUNE)
+    ds = ds.map(lambda x, y: (tf.cast(x, tf.float32) * (1.0 / 255), y), num_parallel_calls=AUTOTUNE)
+    return ds.prefetch(AUTOTUNE)
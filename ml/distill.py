@@ -0,0 +1,218 @@
+"""
+Knowledge distillation of the two-stage system into one compact CPU student.
+
+    python distill.py --data split_dataset --epochs 15
+    python distill.py --data split_dataset --evaluate-only --student models/student_two_head.h5
+
+Teachers: the Stage 1 (general, 10 classes) and Stage 2 (cancer, 8 classes)
+models used by TwoStagePredictor. Student: MobileNetV3-Small with two softmax
+heads, `stage1` and `stage2`, mirroring the teachers' outputs, so one forward
+pass replaces two full models. TwoStagePredictor(student_model_path=...) loads
+it as a drop-in.
+
+Training runs on the Stage 1 images (data_pipeline, augmented, teachers
+queried on the fly):
+  - stage1 head: KL to the Stage 1 teacher at temperature T (x T^2) plus
+    cross-entropy to the true label (weight --alpha)
+  - stage2 head: KL to the Stage 2 teacher, weighted per image by the Stage 1
+    teacher's probability of a cancer-related class (where Stage 2 matters)
+
+The report (JSON next to the student) compares student and teachers:
+Stage 1 accuracy and per-class recall on the labelled split, Stage 2
+agreement with the teacher on the images the teacher pair would send to
+Stage 2, and p50/p99 single-image CPU latency.
+"""
+
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+import tensorflow as tf
+from keras import layers
+from keras.applications import MobileNetV3Small
+from keras.models import Model, load_model
+from keras.optimizers import Adam
+
+from data_pipeline import IMG_SIZE, ImageFolder, make_eval_dataset, make_train_dataset
+from evaluation import StreamingEvaluator
+from two_stage_predictor import CANCER_CLASSES, STAGE1_CLASSES, STAGE2_CLASSES
+
+SEED = 42
+BATCH_SIZE = 32
+STUDENT_PATH = os.path.join("models", "student_two_head.h5")
+
+
+def build_student(num_stage1, num_stage2, img_size=IMG_SIZE):
+    """
+    (student, logits model). The student takes [0, 1] images like the
+    teachers and outputs [stage1 probabilities, stage2 probabilities]; the
+    logits model shares its layers and is what training differentiates.
+    """
+    inputs = layers.Input(shape=img_size + (3,))
+    x = layers.Rescaling(2.0, offset=-1.0)(inputs)  # [0, 1] -> [-1, 1], what MobileNetV3 expects
+    backbone = MobileNetV3Small(input_shape=img_size + (3,), include_top=False, weights='imagenet',
+                                pooling='avg', include_preprocessing=False)
+    features = layers.Dropout(0.2)(backbone(x))
+    logits1 = layers.Dense(num_stage1, name='stage1_logits')(features)
+    logits2 = layers.Dense(num_stage2, name='stage2_logits')(features)
+    stage1 = layers.Softmax(name='stage1')(logits1)
+    stage2 = layers.Softmax(name='stage2')(logits2)
+    return Model(inputs, [stage1, stage2], name='student_two_head'), Model(inputs, [logits1, logits2])
+
+
+def soften(probs, temperature):
+    """Teacher probabilities at a temperature: softmax(log p / T)."""
+    return tf.nn.softmax(tf.math.log(tf.maximum(probs, 1e-8)) / temperature)
+
+
+def distillation_loss(teacher_probs, student_logits, temperature):
+    """Per-sample KL(teacher_T || student_T) * T^2."""
+    target = soften(teacher_probs, temperature)
+    log_student = tf.nn.log_softmax(student_logits / temperature)
+    return tf.reduce_sum(target * (tf.math.log(tf.maximum(target, 1e-8)) - log_student), axis=-1) * temperature ** 2
+
+
+def train(student_logits, teacher1, teacher2, source, epochs, learning_rate, temperature, alpha):
+    cancer_mask = tf.constant([1.0 if i in CANCER_CLASSES else 0.0 for i in range(len(STAGE1_CLASSES))])
+    optimizer = Adam(learning_rate)
+
+    @tf.function
+    def train_step(x, y):
+        t1 = teacher1(x, training=False)
+        t2 = teacher2(x, training=False)
+        stage2_weight = tf.maximum(tf.reduce_sum(t1 * cancer_mask, axis=-1), 0.1)
+        with tf.GradientTape() as tape:
+            s1, s2 = student_logits(x, training=True)
+            hard = tf.keras.losses.categorical_crossentropy(y, s1, from_logits=True)
+            loss1 = (1 - alpha) * distillation_loss(t1, s1, temperature) + alpha * hard
+            loss2 = stage2_weight * distillation_loss(t2, s2, temperature)
+            loss = tf.reduce_mean(loss1 + loss2)
+        grads = tape.gradient(loss, student_logits.trainable_variables)
+        optimizer.apply_gradients(zip(grads, student_logits.trainable_variables))
+        return loss
+
+    steps = source.steps(BATCH_SIZE)
+    dataset = make_train_dataset(source, BATCH_SIZE, SEED, 0, epochs)
+    started, total = time.perf_counter(), 0.0
+    for step, (x, y) in enumerate(dataset, 1):
+        total += float(train_step(x, y))
+        if step % steps == 0:
+            print(f"📘 Epoch {step // steps}/{epochs}: distillation loss {total / steps:.4f} "
+                  f"({time.perf_counter() - started:.0f}s)")
+            total = 0.0
+
+
+def latency_ms(fn, runs=100, warmup=10):
+    """p50/p99 of one single-image call."""
+    x = tf.random.uniform((1,) + IMG_SIZE + (3,))
+    for _ in range(warmup):
+        fn(x)
+    times = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        fn(x)
+        times.append((time.perf_counter() - started) * 1000)
+    return {'p50_ms': float(np.percentile(times, 50)), 'p99_ms': float(np.percentile(times, 99))}
+
+
+def compare(student, teacher1, teacher2, source):
+    """Accuracy / recall / Stage 2 agreement and latency of the student vs the teacher pair."""
+    names1 = [STAGE1_CLASSES[i] for i in range(len(STAGE1_CLASSES))]
+    names2 = [STAGE2_CLASSES[i] for i in range(len(STAGE2_CLASSES))]
+    teacher_eval = StreamingEvaluator(len(names1), names1)
+    student_eval = StreamingEvaluator(len(names1), names1)
+    # Stage 2 has no labels here: the teacher's answer is the reference
+    agreement = StreamingEvaluator(len(names2), names2)
+
+    student_fn = tf.function(lambda x: student(x, training=False))
+    teacher_fn = tf.function(lambda x: (teacher1(x, training=False), teacher2(x, training=False)))
+    cancer = np.array(CANCER_CLASSES)
+    for x, y in make_eval_dataset(source, BATCH_SIZE):
+        t1, t2 = (t.numpy() for t in teacher_fn(x))
+        s1, s2 = (s.numpy() for s in student_fn(x))
+        teacher_eval.update(y.numpy(), t1)
+        student_eval.update(y.numpy(), s1)
+        gated = np.isin(t1.argmax(axis=1), cancer)
+        if gated.any():
+            agreement.update(t2[gated].argmax(axis=1), s2[gated])
+
+    teacher_result, student_result, agreement_result = teacher_eval.result(), student_eval.result(), agreement.result()
+    forward1 = tf.function(lambda x: teacher1(x, training=False))
+    forward2 = tf.function(lambda x: teacher2(x, training=False))
+    return {
+        'images': teacher_result.samples,
+        'teacher': {
+            'stage1_accuracy': teacher_result.accuracy,
+            'stage1_recall': dict(zip(names1, teacher_result.recall.tolist())),
+            'latency_stage1_only': latency_ms(forward1),
+            'latency_both_stages': latency_ms(lambda x: (forward1(x), forward2(x))),
+        },
+        'student': {
+            'stage1_accuracy': student_result.accuracy,
+            'stage1_recall': dict(zip(names1, student_result.recall.tolist())),
+            'stage2_agreement_with_teacher': agreement_result.accuracy,
+            'stage2_images_compared': agreement_result.samples,
+            'latency': latency_ms(student_fn),
+            'parameters': int(student.count_params()),
+        },
+    }
+
+
+def print_report(report):
+    teacher, student = report['teacher'], report['student']
+    print(f"\n📊 Distillation report ({report['images']} images)")
+    print(f"{'':<24} {'teacher pair':>14} {'student':>10}")
+    print(f"{'Stage 1 accuracy':<24} {teacher['stage1_accuracy']:>14.4f} {student['stage1_accuracy']:>10.4f}")
+    print(f"{'Stage 2 agreement':<24} {'(reference)':>14} {student['stage2_agreement_with_teacher']:>10.4f}")
+    print(f"{'p50 latency (ms)':<24} {teacher['latency_both_stages']['p50_ms']:>14.1f} {student['latency']['p50_ms']:>10.1f}")
+    print(f"{'p99 latency (ms)':<24} {teacher['latency_both_stages']['p99_ms']:>14.1f} {student['latency']['p99_ms']:>10.1f}")
+    print("\nStage 1 recall per class (teacher / student):")
+    for name, recall in teacher['stage1_recall'].items():
+        print(f"  {name[:60]:<60} {recall:.3f} / {student['stage1_recall'][name]:.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Distil the two-stage teachers into one two-head student.")
+    parser.add_argument('--data', required=True, help="Stage 1 dataset root with train/ val/ (test/) class folders")
+    parser.add_argument('--stage1', default=os.path.join("models", "finetuned_model.h5"))
+    parser.add_argument('--stage2', default=os.path.join("models", "skin_cancer_model.h5"))
+    parser.add_argument('--student', default=STUDENT_PATH, help="Where the student is saved (or read with --evaluate-only)")
+    parser.add_argument('--epochs', type=int, default=15)
+    parser.add_argument('--learning-rate', type=float, default=1e-3)
+    parser.add_argument('--temperature', type=float, default=4.0)
+    parser.add_argument('--alpha', type=float, default=0.3, help="Weight of the true-label loss on the stage1 head")
+    parser.add_argument('--evaluate-only', action='store_true')
+    args = parser.parse_args()
+
+    teacher1 = load_model(args.stage1, compile=False)
+    teacher2 = load_model(args.stage2, compile=False)
+    train_source = ImageFolder(os.path.join(args.data, 'train'))
+    if train_source.num_classes != len(STAGE1_CLASSES):
+        raise SystemExit(f"❌ {args.data} has {train_source.num_classes} classes, Stage 1 has {len(STAGE1_CLASSES)}")
+
+    if args.evaluate_only:
+        student = load_model(args.student, compile=False)
+    else:
+        student, student_logits = build_student(len(STAGE1_CLASSES), teacher2.output_shape[-1])
+        print(f"🎓 Student: {student.count_params():,} parameters "
+              f"(teachers: {teacher1.count_params() + teacher2.count_params():,})")
+        train(student_logits, teacher1, teacher2, train_source, args.epochs, args.learning_rate,
+              args.temperature, args.alpha)
+        os.makedirs(os.path.dirname(args.student) or '.', exist_ok=True)
+        student.save(args.student)
+        print(f"✅ Student saved at {args.student}")
+
+    split = 'test' if os.path.isdir(os.path.join(args.data, 'test')) else 'val'
+    report = compare(student, teacher1, teacher2, ImageFolder(os.path.join(args.data, split)))
+    report['split'] = split
+    print_report(report)
+    report_path = os.path.splitext(args.student)[0] + "_report.json"
+    with open(report_path, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\n✅ Report saved at {report_path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,225 @@
+"""
+Multi-worker data-parallel training on CPU boxes (tf.distribute.MultiWorkerMirroredStrategy).
+
+Every worker runs the same training script. The cluster comes from TF_CONFIG,
+or from --workers/--worker-index which build it:
+
+    python model1train.py --workers a:12345,b:12345 --worker-index 0   # on box a
+    python model1train.py --workers a:12345,b:12345 --worker-index 1   # on box b
+
+or, to try it as several local processes on one machine:
+
+    python distributed.py --num-workers 2 -- python model1train.py --input-pipeline shards
+
+- Input: each worker builds only its own shard of every epoch
+  (data_pipeline shard=(workers, index)), fed through
+  strategy.distribute_datasets_from_function, so no worker decodes images it
+  does not train on.
+- Batch / LR: BATCH_SIZE stays the per-worker batch; the global batch is
+  BATCH_SIZE x workers and the learning rate is scaled linearly with it.
+- Checkpoints: every worker must take part in saving, but only the chief
+  writes to the real paths; the others write models and logs to a private
+  scratch directory (write_path). Run state is different: a worker that
+  resumes at another epoch than the chief would hang in the first
+  collective, so every worker keeps its own under --run-dir/worker{i}
+  (run_path), next to the chief's, and training checks that all workers
+  resume from the same point (check_agreement) before it starts.
+"""
+
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+
+import numpy as np
+import tensorflow as tf
+
+
+def tf_config(workers, index):
+    """TF_CONFIG for worker `index` of a cluster of host:port addresses."""
+    return {'cluster': {'worker': list(workers)}, 'task': {'type': 'worker', 'index': index}}
+
+
+class DistributedContext:
+    """The strategy plus who this process is in the cluster."""
+
+    def __init__(self, strategy, num_workers=1, worker_index=0, is_chief=True):
+        self.strategy = strategy
+        self.num_workers = num_workers
+        self.worker_index = worker_index
+        self.is_chief = is_chief
+        self.scratch_dir = os.path.join(tempfile.gettempdir(), f"distributed_worker{worker_index}")
+
+    @classmethod
+    def from_env(cls, workers=None, worker_index=None):
+        """
+        Multi-worker when TF_CONFIG (or workers/worker_index, which set it)
+        describes more than one worker; otherwise the default single-process
+        strategy. Create it before any other TensorFlow op runs.
+        """
+        if workers:
+            os.environ['TF_CONFIG'] = json.dumps(tf_config(workers.split(','), worker_index or 0))
+        config = json.loads(os.environ.get('TF_CONFIG') or '{}')
+        cluster = config.get('cluster', {})
+        num_workers = len(cluster.get('worker', [])) + len(cluster.get('chief', []))
+        if num_workers <= 1:
+            return cls(tf.distribute.get_strategy())
+
+        strategy = tf.distribute.MultiWorkerMirroredStrategy(
+            communication_options=tf.distribute.experimental.CommunicationOptions(
+                implementation=tf.distribute.experimental.CommunicationImplementation.RING
+            )
+        )
+        task = config['task']
+        # The chief is the 'chief' task if there is one, else worker 0
+        is_chief = task['type'] == 'chief' or (task['type'] == 'worker' and task['index'] == 0 and 'chief' not in cluster)
+        index = task['index'] + (1 if 'chief' in cluster and task['type'] == 'worker' else 0)
+        print(f"🌐 Worker {index}/{num_workers}{' (chief)' if is_chief else ''}, "
+              f"{strategy.num_replicas_in_sync} replica(s) in sync")
+        return cls(strategy, num_workers, index, is_chief)
+
+    @property
+    def distributed(self):
+        return self.num_workers > 1
+
+    def global_batch_size(self, per_worker_batch):
+        return per_worker_batch * self.strategy.num_replicas_in_sync
+
+    def scaled_learning_rate(self, learning_rate):
+        """Linear scaling rule: the learning rate grows with the global batch."""
+        return learning_rate * self.strategy.num_replicas_in_sync
+
+    def write_path(self, path):
+        """path on the chief; a private scratch copy of it on the other workers."""
+        if self.is_chief:
+            return path
+        scratch = os.path.join(self.scratch_dir, os.path.abspath(path).lstrip(os.sep))
+        os.makedirs(os.path.dirname(scratch), exist_ok=True)
+        return scratch
+
+    def run_path(self, run_dir):
+        """run_dir on the chief; run_dir/worker{i} on the others (kept, unlike write_path's scratch)."""
+        if self.is_chief:
+            return run_dir
+        return os.path.join(run_dir, f"worker{self.worker_index}")
+
+    def check_agreement(self, what, values):
+        """
+        Raises on every worker unless all of them pass the same numbers. A
+        collective: every worker must call it. Each replica contributes v and
+        v^2; the values are all equal exactly when n * sum(v^2) == sum(v)^2.
+        """
+        if not self.distributed:
+            return
+        local = tf.constant([float(v) for v in values], tf.float64)
+        sums = self.strategy.reduce(
+            tf.distribute.ReduceOp.SUM, self.strategy.run(lambda: tf.stack([local, local * local])), axis=None
+        ).numpy()
+        n = self.strategy.num_replicas_in_sync
+        if not np.array_equal(n * sums[1], sums[0] ** 2):
+            raise RuntimeError(f"Workers disagree on {what} (this worker: {list(values)}); "
+                               f"resume all of them from the same run state")
+
+    def distribute(self, dataset_fn, global_batch):
+        """
+        dataset_fn(per_replica_batch, shard) -> this worker's tf.data.Dataset,
+        shard being (num_input_pipelines, input_pipeline_id) for data_pipeline.
+        """
+        if not self.distributed:
+            return dataset_fn(global_batch, None)
+
+        def per_worker(context):
+            batch = context.get_per_replica_batch_size(global_batch)
+            dataset = dataset_fn(batch, (context.num_input_pipelines, context.input_pipeline_id))
+            options = tf.data.Options()
+            options.experimental_distribute.auto_shard_policy = tf.data.experimental.AutoShardPolicy.OFF
+            return dataset.with_options(options)
+
+        return self.strategy.distribute_datasets_from_function(per_worker)
+
+
+def with_class_weights(dataset, class_weights):
+    """
+    (x, one-hot y) -> (x, y, per-sample weight). Keras cannot apply
+    fit(class_weight=...) to a distributed dataset, so each worker applies it
+    to its own dataset instead.
+    """
+    weights = tf.constant([class_weights[i] for i in range(len(class_weights))], tf.float32)
+    return dataset.map(lambda x, y: (x, y, tf.gather(weights, tf.argmax(y, axis=-1))),
+                       num_parallel_calls=tf.data.AUTOTUNE)
+
+
+# ==========================
+# LOCAL LAUNCHER
+# ==========================
+def free_ports(n):
+    sockets = [socket.socket() for _ in range(n)]
+    for s in sockets:
+        s.bind(('localhost', 0))
+    ports = [s.getsockname()[1] for s in sockets]
+    for s in sockets:
+        s.close()
+    return ports
+
+
+def launch_local(num_workers, command, env=None, echo=True):
+    """
+    Runs `command` as num_workers local processes, each with its TF_CONFIG.
+    Output is prefixed with the worker index. Returns [(returncode, output lines)].
+    """
+    workers = [f"localhost:{port}" for port in free_ports(num_workers)]
+    processes, outputs, readers = [], [], []
+    for index in range(num_workers):
+        worker_env = dict(os.environ, **(env or {}), TF_CONFIG=json.dumps(tf_config(workers, index)))
+        process = subprocess.Popen(command, env=worker_env, stdout=subprocess.PIPE,
+                                   stderr=subprocess.STDOUT, text=True, bufsize=1)
+        lines = []
+
+        def pump(process=process, lines=lines, index=index):
+            for line in process.stdout:
+                lines.append(line.rstrip('\n'))
+                if echo:
+                    print(f"[worker {index}] {line}", end='', flush=True)
+
+        reader = threading.Thread(target=pump, daemon=True)
+        reader.start()
+        processes.append(process)
+        outputs.append(lines)
+        readers.append(reader)
+
+    try:
+        codes = [process.wait() for process in processes]
+    except KeyboardInterrupt:
+        for process in processes:
+            process.terminate()
+        raise
+    for reader in readers:
+        reader.join()
+    return list(zip(codes, outputs))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Run a training command as N local workers (MultiWorkerMirroredStrategy).",
+        usage="python distributed.py --num-workers N -- COMMAND...",
+    )
+    parser.add_argument('--num-workers', type=int, default=2)
+    parser.add_argument('command', nargs=argparse.REMAINDER)
+    args = parser.parse_args()
+    command = args.command[1:] if args.command[:1] == ['--'] else args.command
+    if not command:
+        parser.error("no command given")
+    results = launch_local(args.num_workers, command)
+    failed = [i for i, (code, _) in enumerate(results) if code != 0]
+    if failed:
+        print(f"❌ Worker(s) {failed} failed")
+        sys.exit(1)
+    print(f"✅ All {args.num_workers} workers finished")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,181 @@
+"""
+Single-pass evaluation: loss, accuracy, confusion matrix, classification
+report and per-class accuracy from one stream over the data.
+
+Replaces model.evaluate(...) followed by model.predict(...) on the same data,
+which decoded and ran inference over the whole test set twice. Memory is
+O(classes^2): only the running loss sum and the confusion matrix are kept,
+never the predictions.
+
+    python evaluation.py --data split_dataset/test --model models/general_skin_model.h5
+    python evaluation.py --data split_dataset/test --model a.h5 --model b.h5   # side by side
+
+From code:
+    result = evaluate_model(model, make_eval_dataset(folder, 32), class_names)
+    print(result.report())
+"""
+
+import argparse
+import os
+import time
+
+import numpy as np
+import tensorflow as tf
+
+EPSILON = 1e-7  # keras.backend.epsilon(), used by categorical_crossentropy
+
+
+class StreamingEvaluator:
+    """Accumulates (labels, predicted probabilities) batches."""
+
+    def __init__(self, num_classes, class_names=None):
+        self.num_classes = num_classes
+        self.class_names = list(class_names) if class_names else [str(i) for i in range(num_classes)]
+        self.confusion = np.zeros((num_classes, num_classes), dtype=np.int64)
+        self.loss_sum = 0.0
+        self.count = 0
+
+    def update(self, labels, probs):
+        """labels: class indices (n,) or one-hot (n, C); probs: (n, C) softmax outputs."""
+        probs = np.asarray(probs, dtype=np.float64)
+        labels = np.asarray(labels)
+        if labels.ndim == 2:
+            labels = np.argmax(labels, axis=1)
+        labels = labels.astype(np.int64)
+        # Same as keras categorical_crossentropy on probabilities
+        probs = probs / probs.sum(axis=1, keepdims=True)
+        true_probs = np.clip(probs[np.arange(len(labels)), labels], EPSILON, 1 - EPSILON)
+        self.loss_sum += float(-np.log(true_probs).sum())
+        self.count += len(labels)
+        predicted = np.argmax(probs, axis=1)
+        self.confusion += np.bincount(
+            labels * self.num_classes + predicted, minlength=self.num_classes ** 2
+        ).reshape(self.num_classes, self.num_classes)
+
+    def result(self, extra_loss=0.0):
+        """extra_loss: per-sample regularization term model.evaluate adds to the loss."""
+        return EvaluationResult(self.confusion.copy(), self.loss_sum / max(self.count, 1) + extra_loss,
+                                self.class_names)
+
+
+class EvaluationResult:
+    def __init__(self, confusion_matrix, loss, class_names):
+        self.confusion_matrix = confusion_matrix
+        self.loss = loss
+        self.class_names = class_names
+        cm = confusion_matrix.astype(np.float64)
+        self.support = confusion_matrix.sum(axis=1)
+        self.samples = int(self.support.sum())
+        true_positives = np.diag(cm)
+        self.accuracy = float(true_positives.sum() / self.samples) if self.samples else 0.0
+        predicted = cm.sum(axis=0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            # 0 where undefined, like sklearn's zero_division default (without the warning)
+            self.precision = np.nan_to_num(true_positives / predicted)
+            self.recall = np.nan_to_num(true_positives / self.support)
+            self.f1 = np.nan_to_num(2 * self.precision * self.recall / (self.precision + self.recall))
+        # Per-class accuracy is the recall of that class
+        self.per_class_accuracy = self.recall
+
+    def as_dict(self):
+        return {
+            'loss': self.loss,
+            'accuracy': self.accuracy,
+            'samples': self.samples,
+            'confusion_matrix': self.confusion_matrix.tolist(),
+            'per_class': {
+                name: {
+                    'precision': float(self.precision[i]),
+                    'recall': float(self.recall[i]),
+                    'f1': float(self.f1[i]),
+                    'support': int(self.support[i]),
+                }
+                for i, name in enumerate(self.class_names)
+            },
+        }
+
+    def report(self, digits=2):
+        """Text report in the layout of sklearn.metrics.classification_report."""
+        width = max(len(name) for name in self.class_names + ['weighted avg'])
+        headers = ['precision', 'recall', 'f1-score', 'support']
+        lines = [f"{'':>{width}} " + ' '.join(f"{h:>9}" for h in headers), '']
+        for i, name in enumerate(self.class_names):
+            lines.append(self._row(name, width, digits, self.precision[i], self.recall[i], self.f1[i], self.support[i]))
+        lines.append('')
+        lines.append(f"{'accuracy':>{width}} {'':>9} {'':>9} {self.accuracy:>9.{digits}f} {self.samples:>9}")
+        weights = self.support / max(self.samples, 1)
+        for label, average in (('macro avg', np.mean), ('weighted avg', lambda v: float(np.sum(v * weights)))):
+            lines.append(self._row(label, width, digits, average(self.precision), average(self.recall),
+                                   average(self.f1), self.samples))
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def _row(name, width, digits, precision, recall, f1, support):
+        return (f"{name:>{width}} {precision:>9.{digits}f} {recall:>9.{digits}f} "
+                f"{f1:>9.{digits}f} {int(support):>9}")
+
+
+def _batches(data):
+    """(x, y) batches from a tf.data.Dataset or a Keras Sequence/DirectoryIterator (one pass)."""
+    if isinstance(data, tf.data.Dataset):
+        yield from data
+    else:
+        for i in range(len(data)):
+            yield data[i]
+
+
+def evaluate_model(model, data, class_names, verbose=True):
+    """
+    One pass over `data` ((images, labels) batches) with `model`, a Keras
+    model or any callable images -> probabilities (e.g. a TFLite runner). The
+    loss includes a Keras model's regularization terms, like model.evaluate.
+    """
+    evaluator = StreamingEvaluator(len(class_names), class_names)
+    if hasattr(model, 'losses'):
+        forward = tf.function(lambda x: model(x, training=False))
+        extra_loss = float(sum(float(loss) for loss in model.losses))
+    else:
+        forward, extra_loss = model, 0.0
+    started = time.perf_counter()
+    for step, (x, y) in enumerate(_batches(data), 1):
+        probs = forward(x)
+        evaluator.update(np.asarray(y), probs.numpy() if hasattr(probs, 'numpy') else probs)
+        if verbose and step % 20 == 0:
+            print(f"   {evaluator.count} images evaluated...", end='\r')
+    result = evaluator.result(extra_loss)
+    if verbose:
+        print(f"   {result.samples} images evaluated in {time.perf_counter() - started:.1f}s")
+    return result
+
+
+def main():
+    from keras.models import load_model
+
+    from data_pipeline import ImageFolder, make_eval_dataset
+    from shard_cache import ShardCache
+
+    parser = argparse.ArgumentParser(description="Evaluate one or more models on a class-per-subdirectory split.")
+    parser.add_argument('--data', required=True, help="Split directory (e.g. split_dataset/test) or its shard directory")
+    parser.add_argument('--model', action='append', required=True, help="Model file; repeat to compare models")
+    parser.add_argument('--batch-size', type=int, default=32)
+    args = parser.parse_args()
+
+    source = ShardCache(args.data) if os.path.exists(os.path.join(args.data, 'index.json')) else ImageFolder(args.data)
+    class_names = list(source.class_indices.keys())
+    dataset = make_eval_dataset(source, args.batch_size)
+
+    results = {}
+    for path in args.model:
+        print(f"\n📊 {path}")
+        result = evaluate_model(load_model(path, compile=False), dataset, class_names)
+        print(result.report())
+        results[path] = result
+
+    if len(results) > 1:
+        print(f"{'model':<50} {'loss':>8} {'accuracy':>9} {'macro f1':>9}")
+        for path, result in results.items():
+            print(f"{path:<50} {result.loss:>8.4f} {result.accuracy:>9.4f} {float(np.mean(result.f1)):>9.4f}")
+
+
+if __name__ == '__main__':
+    main()
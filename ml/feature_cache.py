@@ -0,0 +1,149 @@
+"""
+Cached backbone features for the frozen-base phase of model1train.py.
+
+While the base is frozen, every training step recomputes the same
+MobileNetV2 forward pass just to train the small head. Instead:
+  1. run the frozen backbone (+ global average pooling) once over the
+     training set, for a fixed number of augmented views per image, and once
+     over the validation set without augmentation
+  2. store the pooled features (float16) and labels on disk
+  3. train the head on the features directly
+  4. copy the head weights back into the full model before fine-tuning
+
+View v uses the augmentation of training epoch v (data_pipeline seeds), so the
+features are reproducible. A cache directory is reused only if its metadata
+(backbone, views, seed, source fingerprint) matches.
+"""
+
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+import tensorflow as tf
+
+from data_pipeline import AUTOTUNE, ImageFolder, make_eval_dataset, make_train_dataset
+from shard_cache import source_fingerprint
+
+FORMAT_VERSION = 1
+
+
+def _fingerprint(source):
+    if isinstance(source, ImageFolder):
+        return source_fingerprint(source)
+    return source.index['fingerprint']  # ShardCache already tracks its sources
+
+
+def ensure_features(extractor, source, out_dir, batch_size, seed, views=1, augment=False, key=''):
+    """
+    (features, labels) for `source`: `views` augmented passes (augment=True)
+    or one plain pass. Extracted with `extractor` unless out_dir already holds
+    features for the same metadata. Features are memory-mapped float16.
+    """
+    views = views if augment else 1
+    meta = {
+        'version': FORMAT_VERSION,
+        'key': key,
+        'views': views,
+        'augment': augment,
+        'seed': seed,
+        'samples': source.samples,
+        'source': _fingerprint(source),
+    }
+    meta_path = os.path.join(out_dir, 'meta.json')
+    if os.path.exists(meta_path):
+        with open(meta_path) as f:
+            if json.load(f) == meta:
+                print(f"✅ Reusing cached features in {out_dir}")
+                return _load(out_dir)
+
+    print(f"🧮 Extracting features ({views} view(s) x {source.samples} images) -> {out_dir}")
+    started = time.perf_counter()
+    if augment:
+        dataset = make_train_dataset(source, batch_size, seed, 0, views)
+        steps = views * source.steps(batch_size)
+    else:
+        dataset = make_eval_dataset(source, batch_size)
+        steps = source.steps(batch_size)
+    forward = tf.function(lambda x: extractor(x, training=False))
+
+    tmp_dir = out_dir.rstrip(os.sep) + '.tmp'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    rows = views * source.samples
+    feature_dim = extractor.output_shape[-1]
+    features = np.lib.format.open_memmap(
+        os.path.join(tmp_dir, 'features.npy'), mode='w+', dtype=np.float16, shape=(rows, feature_dim)
+    )
+    labels = np.empty(rows, dtype=np.int32)
+    written = 0
+    for x, y in dataset.take(steps):
+        batch = forward(x).numpy()
+        features[written:written + len(batch)] = batch
+        labels[written:written + len(batch)] = np.argmax(y.numpy(), axis=1)
+        written += len(batch)
+    features.flush()
+    del features
+    np.save(os.path.join(tmp_dir, 'labels.npy'), labels)
+    with open(os.path.join(tmp_dir, 'meta.json'), 'w') as f:
+        json.dump(meta, f, indent=2)
+
+    shutil.rmtree(out_dir, ignore_errors=True)
+    os.replace(tmp_dir, out_dir)
+    print(f"✅ {rows} feature vectors in {time.perf_counter() - started:.1f}s")
+    return _load(out_dir)
+
+
+def _load(out_dir):
+    return (np.load(os.path.join(out_dir, 'features.npy'), mmap_mode='r'),
+            np.load(os.path.join(out_dir, 'labels.npy')))
+
+
+def feature_dataset(features, labels, num_classes, batch_size, seed=None,
+                    start_epoch=0, end_epoch=1, epoch_size=None):
+    """
+    Batches of (float32 features, one-hot labels). Without a seed: one pass in
+    order. With a seed: epochs [start_epoch, end_epoch) back to back, epoch e
+    being `epoch_size` rows drawn without replacement with seed (seed, e), so
+    any epoch can be regenerated on its own (like data_pipeline).
+
+    Only indices go through the graph: each batch's rows are read from the
+    (memory-mapped) features array when the batch is built, so the cache never
+    has to fit in memory or in a graph constant.
+    """
+    feature_dim = features.shape[1]
+    labels = tf.constant(labels)
+    rows = int(labels.shape[0])
+
+    def read_rows(idx):
+        return np.asarray(features[idx], dtype=np.float32)
+
+    def load(idx):
+        batch = tf.numpy_function(read_rows, [idx], tf.float32, stateful=False)
+        batch.set_shape([None, feature_dim])
+        return batch, tf.one_hot(tf.gather(labels, idx), num_classes)
+
+    if seed is None:
+        ds = tf.data.Dataset.range(rows).batch(batch_size)
+    else:
+        epoch_size = epoch_size or rows
+
+        def one_epoch(epoch):
+            order = tf.argsort(tf.random.stateless_uniform([rows], tf.stack([tf.constant(seed, tf.int64), epoch])))
+            return tf.data.Dataset.from_tensor_slices(order[:epoch_size]).batch(batch_size)
+
+        ds = tf.data.Dataset.range(start_epoch, end_epoch).flat_map(one_epoch)
+    ds = ds.map(load, num_parallel_calls=AUTOTUNE)
+    options = tf.data.Options()
+    options.deterministic = True
+    return ds.with_options(options).prefetch(AUTOTUNE)
+
+
+def copy_head_weights(head_model, model):
+    """Copies the head's layer weights into the last layers of the full model, in order."""
+    head_layers = [layer for layer in head_model.layers if not isinstance(layer, tf.keras.layers.InputLayer)]
+    for src, dst in zip(head_layers, model.layers[-len(head_layers):]):
+        if type(src) is not type(dst):
+            raise ValueError(f"Head layer {src.name} does not match model layer {dst.name}")
+        dst.set_weights(src.get_weights())
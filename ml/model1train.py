@@ -1,19 +1,51 @@
 import os
 import json
+import argparse
 import tensorflow as tf
 from keras.src.legacy.preprocessing.image import ImageDataGenerator
 from keras.applications import MobileNetV2
 from keras.models import Model
-from keras.layers import Dense, GlobalAveragePooling2D, Dropout
+from keras.layers import Dense, GlobalAveragePooling2D, Dropout, Input
 from keras.optimizers import Adam
 from keras.callbacks import ModelCheckpoint, EarlyStopping, ReduceLROnPlateau, TensorBoard
 from keras import regularizers
 import sys
-from sklearn.metrics import classification_report, confusion_matrix
 import numpy as np
 import matplotlib.pyplot as plt
 import seaborn as sns
 
+from data_pipeline import ImageFolder, make_train_dataset, make_eval_dataset, shard_steps
+from shard_cache import ensure_shards
+from feature_cache import ensure_features, feature_dataset, copy_head_weights
+from run_checkpoint import TrainingRun, history_object
+from evaluation import evaluate_model
+from telemetry import ThroughputTelemetry
+from distributed import DistributedContext, with_class_weights
+
+parser = argparse.ArgumentParser(description="Train the Stage 1 skin disease classifier (MobileNetV2).")
+parser.add_argument('--input-pipeline', choices=['tfdata', 'shards', 'generator'], default='tfdata',
+                    help="tf.data from JPEGs (default), tf.data from pre-resized shards, or the legacy ImageDataGenerator")
+parser.add_argument('--shard-dir', default=None,
+                    help="shards only: shard location (default: <dataset dir>_shards); rebuilt when the images change")
+parser.add_argument('--cache', default=None,
+                    help="tf.data only: cache decoded images in 'memory' or under this file path prefix")
+parser.add_argument('--feature-views', type=int, default=0,
+                    help="Train the frozen-base phase on cached backbone features with this many augmented views "
+                         "per image (0 = off, train end to end)")
+parser.add_argument('--feature-dir', default=None,
+                    help="--feature-views only: feature cache location (default: <dataset dir>_features)")
+parser.add_argument('--run-dir', default=os.path.join("models", "run"),
+                    help="Where the per-epoch run checkpoints go (see run_checkpoint.py)")
+parser.add_argument('--resume', action='store_true',
+                    help="Continue the run in --run-dir from its last completed epoch instead of starting over")
+parser.add_argument('--workers', default=None,
+                    help="Multi-worker training: comma-separated host:port of every worker (or set TF_CONFIG)")
+parser.add_argument('--worker-index', type=int, default=0,
+                    help="--workers only: this process's position in --workers (0 = chief)")
+args = parser.parse_args()
+if args.feature_views and args.input_pipeline == 'generator':
+    parser.error("--feature-views needs --input-pipeline tfdata or shards")
+
 # ==========================
 # GPU CONFIGURATION
 # ==========================
@@ -60,6 +92,14 @@ else:
 print("=" * 70)
 print()
 
+# ==========================
+# DISTRIBUTION
+# ==========================
+# Single process unless --workers / TF_CONFIG describe several workers (see distributed.py)
+dist = DistributedContext.from_env(args.workers, args.worker_index)
+if dist.distributed and (args.feature_views or args.input_pipeline == 'generator'):
+    parser.error("multi-worker training needs --input-pipeline tfdata or shards, without --feature-views")
+
 # ==========================
 # CONFIGURATION
 # ==========================
@@ -75,6 +115,9 @@ EPOCHS_INITIAL = 20
 EPOCHS_FINETUNE = 25
 LEARNING_RATE = 1e-4  # Good starting point for EfficientNet
 SEED = 42
+# BATCH_SIZE is per worker; with several workers the global batch grows and the
+# learning rates are scaled linearly with it
+GLOBAL_BATCH_SIZE = dist.global_batch_size(BATCH_SIZE)
 
 # Validate directories exist
 if not os.path.exists(TRAIN_DIR):
@@ -104,52 +147,111 @@ else:
 # ==========================
 # DATA AUGMENTATION / GENERATORS
 # ==========================
-train_datagen = ImageDataGenerator(
-    rescale=1./255,
-    rotation_range=30,        # Increased from 15
-    width_shift_range=0.15,   # Increased from 0.1
-    height_shift_range=0.15,  # Increased from 0.1
-    horizontal_flip=True,
-    vertical_flip=True,       # Added - medical images can be flipped
-    zoom_range=0.15,          # Added zoom
-    brightness_range=[0.7, 1.3],  # Wider range
-    shear_range=0.1,          # Added shear transformation
-    fill_mode='nearest'
-)
-
-# Validation data should only be rescaled, no augmentation
-val_datagen = ImageDataGenerator(rescale=1./255)
-
-train_generator = train_datagen.flow_from_directory(
-    TRAIN_DIR,
-    target_size=IMG_SIZE,
-    batch_size=BATCH_SIZE,
-    class_mode='categorical',
-    shuffle=True,
-    seed=SEED
-)
-
-val_generator = val_datagen.flow_from_directory(
-    VAL_DIR,
-    target_size=IMG_SIZE,
-    batch_size=BATCH_SIZE,
-    class_mode='categorical',
-    shuffle=False,
-    seed=SEED
-)
-
-num_classes = len(train_generator.class_indices)
-print("✅ Classes detected:", train_generator.class_indices)
-print(f"📊 Training samples: {train_generator.samples}")
-print(f"📊 Validation samples: {val_generator.samples}")
+if args.input_pipeline == 'generator':
+    train_datagen = ImageDataGenerator(
+        rescale=1./255,
+        rotation_range=30,        # Increased from 15
+        width_shift_range=0.15,   # Increased from 0.1
+        height_shift_range=0.15,  # Increased from 0.1
+        horizontal_flip=True,
+        vertical_flip=True,       # Added - medical images can be flipped
+        zoom_range=0.15,          # Added zoom
+        brightness_range=[0.7, 1.3],  # Wider range
+        shear_range=0.1,          # Added shear transformation
+        fill_mode='nearest'
+    )
+
+    # Validation data should only be rescaled, no augmentation
+    val_datagen = ImageDataGenerator(rescale=1./255)
+
+    train_generator = train_datagen.flow_from_directory(
+        TRAIN_DIR,
+        target_size=IMG_SIZE,
+        batch_size=BATCH_SIZE,
+        class_mode='categorical',
+        shuffle=True,
+        seed=SEED
+    )
+
+    val_generator = val_datagen.flow_from_directory(
+        VAL_DIR,
+        target_size=IMG_SIZE,
+        batch_size=BATCH_SIZE,
+        class_mode='categorical',
+        shuffle=False,
+        seed=SEED
+    )
+    class_indices = train_generator.class_indices
+    train_samples, val_samples = train_generator.samples, val_generator.samples
+    val_data = val_generator
+else:
+    # tf.data: same files, class indices and augmentation, decoded/augmented in parallel
+    # (see data_pipeline.py)
+    def cache_for(split):
+        """--cache per split: 'memory' as is, a path prefix gets a per-split suffix."""
+        if args.cache in (None, 'memory'):
+            return args.cache
+        suffix = f"_worker{dist.worker_index}" if dist.distributed else ""
+        return f"{args.cache}_{split}{suffix}"
+
+    # With --input-pipeline shards the "folders" are pre-resized uint8 shards (see shard_cache.py)
+    shard_dir = args.shard_dir or DATASET_DIR.rstrip("/") + "_shards"
+
+    def open_split(split_dir, split):
+        if args.input_pipeline == 'shards':
+            return ensure_shards(split_dir, os.path.join(shard_dir, split))
+        return ImageFolder(split_dir)
+
+    train_folder = open_split(TRAIN_DIR, 'train')
+    val_folder = open_split(VAL_DIR, 'val')
+    if val_folder.class_indices != train_folder.class_indices:
+        print("❌ ERROR: train and val directories have different classes")
+        sys.exit(1)
+    class_indices = train_folder.class_indices
+    train_samples, val_samples = train_folder.samples, val_folder.samples
+    # Each worker evaluates its own slice of the validation set
+    val_data = dist.distribute(
+        lambda batch, shard: make_eval_dataset(val_folder, batch, cache=cache_for('val'), shard=shard),
+        GLOBAL_BATCH_SIZE
+    )
+
+
+def train_inputs(start_epoch, end_epoch):
+    """(training data, steps_per_epoch) for epochs [start_epoch, end_epoch) of model.fit."""
+    if args.input_pipeline == 'generator':
+        return train_generator, None
+
+    def worker_dataset(batch, shard):
+        dataset = make_train_dataset(train_folder, batch, SEED, start_epoch, end_epoch,
+                                     cache=cache_for('train'), shard=shard)
+        if dist.distributed and class_weights:
+            dataset = with_class_weights(dataset, class_weights)
+        return telemetry.instrument(dataset)
+
+    dataset = dist.distribute(worker_dataset, GLOBAL_BATCH_SIZE)
+    return dataset, shard_steps(train_folder, GLOBAL_BATCH_SIZE // dist.num_workers, dist.num_workers)
+
+
+# Multi-worker datasets carry the class weights as sample weights instead
+fit_class_weights = None if dist.distributed else class_weights
+
+
+num_classes = len(class_indices)
+print("✅ Classes detected:", class_indices)
+print(f"📊 Training samples: {train_samples}")
+print(f"📊 Validation samples: {val_samples}")
 print(f"📊 Number of classes: {num_classes}")
 
 # ==========================
 # CALLBACKS
 # ==========================
+# Data-wait vs compute per step; first so TensorBoard and the history see its epoch metrics
+telemetry = ThroughputTelemetry(log_dir=dist.write_path(os.path.join('logs', 'telemetry')))
+
 callbacks = [
+    telemetry,
     ModelCheckpoint(
-        filepath=os.path.join("models", "best_model.h5"),
+        filepath=dist.write_path(os.path.join("models", "best_model.h5")),
         monitor='val_accuracy',
         save_best_only=True,
         mode='max',
@@ -169,7 +271,7 @@ callbacks = [
         verbose=1
     ),
     TensorBoard(
-        log_dir='logs',
+        log_dir=dist.write_path('logs'),
         histogram_freq=1,
         write_graph=True,
         update_freq='epoch'
@@ -181,33 +283,40 @@ callbacks = [
 # ==========================
 # Load MobileNetV2 backbone (lightweight, efficient, and stable for medical images)
 print("\n🏗️  Building MobileNetV2 model...")
-base_model = MobileNetV2(
-    weights='imagenet',
-    include_top=False,
-    input_shape=(224, 224, 3),
-    alpha=1.0  # Width multiplier
-)
-base_model.trainable = False  # freeze base layers initially
 
 # Add custom classification head
-x = base_model.output
-x = GlobalAveragePooling2D()(x)
-x = Dense(256, activation='relu', kernel_regularizer=regularizers.l2(0.01))(x)
-x = Dropout(0.4)(x)
-x = Dense(128, activation='relu', kernel_regularizer=regularizers.l2(0.01))(x)
-x = Dropout(0.3)(x)
-predictions = Dense(num_classes, activation='softmax')(x)
+def classification_head(x):
+    x = Dense(256, activation='relu', kernel_regularizer=regularizers.l2(0.01))(x)
+    x = Dropout(0.4)(x)
+    x = Dense(128, activation='relu', kernel_regularizer=regularizers.l2(0.01))(x)
+    x = Dropout(0.3)(x)
+    return Dense(num_classes, activation='softmax')(x)
+
+
+# Variables created under the strategy scope are mirrored across workers
+with dist.strategy.scope():
+    base_model = MobileNetV2(
+        weights='imagenet',
+        include_top=False,
+        input_shape=(224, 224, 3),
+        alpha=1.0  # Width multiplier
+    )
+    base_model.trainable = False  # freeze base layers initially
 
-model = Model(inputs=base_model.input, outputs=predictions)
+    pooled = GlobalAveragePooling2D()(base_model.output)
+    predictions = classification_head(pooled)
+
+    model = Model(inputs=base_model.input, outputs=predictions)
 
 # ==========================
 # COMPILE MODEL
 # ==========================
-model.compile(
-    optimizer=Adam(learning_rate=LEARNING_RATE),
-    loss='categorical_crossentropy',
-    metrics=['accuracy']
-)
+with dist.strategy.scope():
+    model.compile(
+        optimizer=Adam(learning_rate=dist.scaled_learning_rate(LEARNING_RATE)),
+        loss='categorical_crossentropy',
+        metrics=['accuracy']
+    )
 
 model.summary()
 
@@ -215,13 +324,72 @@ model.summary()
 # TRAIN MODEL
 # ==========================
 print("\n🚀 Starting initial training (frozen base)...")
-history = model.fit(
-    train_generator,
-    epochs=EPOCHS_INITIAL,
-    validation_data=val_generator,
-    callbacks=callbacks,
-    class_weight=class_weights  # Use class weights for balanced training
-)
+# Every epoch checkpoints the whole run state; --resume continues from it
+run = TrainingRun(dist.run_path(args.run_dir), resume=args.resume)
+# A worker resuming at another epoch than the chief would hang in the first collective
+dist.check_agreement("the run state to resume from", [
+    value for phase in ('initial', 'finetune') for value in (run.initial_epoch(phase), run.completed(phase))
+])
+initial_epoch = run.initial_epoch('initial')
+if run.completed('initial'):
+    history = run.restore_completed('initial', model)
+elif args.feature_views:
+    # The frozen backbone's output never changes, so run it once (K augmented
+    # views per training image), train the head on the pooled features and copy
+    # it back into the full model (see feature_cache.py)
+    feature_dir = args.feature_dir or DATASET_DIR.rstrip("/") + "_features"
+    extractor = Model(inputs=base_model.input, outputs=pooled)
+    feature_key = f"{base_model.name}-imagenet-{IMG_SIZE[0]}x{IMG_SIZE[1]}"
+    train_features, train_labels = ensure_features(
+        extractor, train_folder, os.path.join(feature_dir, 'train'), BATCH_SIZE, SEED,
+        views=args.feature_views, augment=True, key=feature_key
+    )
+    val_features, val_labels = ensure_features(
+        extractor, val_folder, os.path.join(feature_dir, 'val'), BATCH_SIZE, SEED, key=feature_key
+    )
+
+    feature_input = Input(shape=(extractor.output_shape[-1],))
+    head_model = Model(inputs=feature_input, outputs=classification_head(feature_input))
+    head_model.compile(
+        optimizer=Adam(learning_rate=LEARNING_RATE),
+        loss='categorical_crossentropy',
+        metrics=['accuracy']
+    )
+    # The checkpoint would save the head alone; the full model is saved below
+    head_callbacks = [cb for cb in callbacks if not isinstance(cb, ModelCheckpoint)]
+    checkpoint = run.checkpoint('initial', head_callbacks)
+    # One epoch = as many images as an end-to-end epoch, drawn from all the views
+    head_model.fit(
+        telemetry.instrument(feature_dataset(train_features, train_labels, num_classes, BATCH_SIZE, seed=SEED,
+                                             start_epoch=initial_epoch, end_epoch=EPOCHS_INITIAL,
+                                             epoch_size=train_folder.samples)),
+        epochs=EPOCHS_INITIAL,
+        initial_epoch=initial_epoch,
+        steps_per_epoch=train_folder.steps(BATCH_SIZE),
+        validation_data=feature_dataset(val_features, val_labels, num_classes, BATCH_SIZE),
+        callbacks=head_callbacks + [checkpoint],
+        class_weight=class_weights
+    )
+    copy_head_weights(head_model, model)
+    os.makedirs("models", exist_ok=True)
+    model.save(os.path.join("models", "best_model.h5"))
+    print("✅ Head trained on cached features and loaded into the full model")
+    history = history_object(checkpoint.history)
+    run.complete('initial', model, checkpoint.history)
+else:
+    train_data, steps_per_epoch = train_inputs(initial_epoch, EPOCHS_INITIAL)
+    checkpoint = run.checkpoint('initial', callbacks)
+    model.fit(
+        train_data,
+        epochs=EPOCHS_INITIAL,
+        initial_epoch=initial_epoch,
+        steps_per_epoch=steps_per_epoch,
+        validation_data=val_data,
+        callbacks=callbacks + [checkpoint],
+        class_weight=fit_class_weights  # Use class weights for balanced training
+    )
+    history = history_object(checkpoint.history)
+    run.complete('initial', model, checkpoint.history)
 
 # ==========================
 # FINE-TUNE (optional)
@@ -234,16 +402,18 @@ for layer in base_model.layers[:-40]:
     layer.trainable = False
 
 # Recompile with lower learning rate
-model.compile(
-    optimizer=Adam(learning_rate=1e-5),  # Lower learning rate for fine-tuning
-    loss='categorical_crossentropy',
-    metrics=['accuracy']
-)
+with dist.strategy.scope():
+    model.compile(
+        optimizer=Adam(learning_rate=dist.scaled_learning_rate(1e-5)),  # Lower learning rate for fine-tuning
+        loss='categorical_crossentropy',
+        metrics=['accuracy']
+    )
 
 # Update callbacks for fine-tuning
 finetune_callbacks = [
+    telemetry,
     ModelCheckpoint(
-        filepath=os.path.join("models", "finetuned_model.h5"),
+        filepath=dist.write_path(os.path.join("models", "finetuned_model.h5")),
         monitor='val_accuracy',
         save_best_only=True,
         mode='max',
@@ -263,7 +433,7 @@ finetune_callbacks = [
         verbose=1
     ),
     TensorBoard(
-        log_dir='logs/finetune',
+        log_dir=dist.write_path('logs/finetune'),
         histogram_freq=1,
         write_graph=True,
         update_freq='epoch'
@@ -271,23 +441,39 @@ finetune_callbacks = [
 ]
 
 # Reset generators to ensure fresh epoch
-train_generator.reset()
-val_generator.reset()
+if args.input_pipeline == 'generator':
+    train_generator.reset()
+    val_generator.reset()
 
-history_finetune = model.fit(
-    train_generator,
-    epochs=EPOCHS_FINETUNE,
-    validation_data=val_generator,
-    callbacks=finetune_callbacks,
-    class_weight=class_weights  # Continue using class weights
-)
+if run.completed('finetune'):
+    history_finetune = run.restore_completed('finetune', model)
+else:
+    # tf.data: fine-tuning epochs get their own shuffle/augmentation seeds
+    finetune_epoch = run.initial_epoch('finetune')
+    train_data, steps_per_epoch = train_inputs(EPOCHS_INITIAL + finetune_epoch, EPOCHS_INITIAL + EPOCHS_FINETUNE)
+    checkpoint = run.checkpoint('finetune', finetune_callbacks)
+    model.fit(
+        train_data,
+        epochs=EPOCHS_FINETUNE,
+        initial_epoch=finetune_epoch,
+        steps_per_epoch=steps_per_epoch,
+        validation_data=val_data,
+        callbacks=finetune_callbacks + [checkpoint],
+        class_weight=fit_class_weights  # Continue using class weights
+    )
+    history_finetune = history_object(checkpoint.history)
+    run.complete('finetune', model, checkpoint.history)
 
 # ==========================
 # SAVE MODEL
 # ==========================
 MODEL_PATH = os.path.join("models", "general_skin_model.h5")
 os.makedirs("models", exist_ok=True)
-model.save(MODEL_PATH)
+model.save(dist.write_path(MODEL_PATH))
+if not dist.is_chief:
+    # Every worker takes part in saving; history, evaluation and plots are the chief's
+    print(f"\n✅ Worker {dist.worker_index} finished")
+    sys.exit(0)
 print(f"\n✅ Final model saved at {MODEL_PATH}")
 
 # Save training history
@@ -298,6 +484,12 @@ with open(history_path, 'wb') as f:
         'initial_training': history.history,
         'fine_tuning': history_finetune.history
     }, f)
+# Same history as JSON (accuracy/loss curves plus the telemetry columns)
+with open(os.path.join("models", "training_history.json"), 'w') as f:
+    json.dump({
+        'initial_training': history.history,
+        'fine_tuning': history_finetune.history
+    }, f, indent=2)
 print(f"✅ Training history saved at {history_path}")
 
 # ==========================
@@ -308,35 +500,36 @@ if os.path.exists(TEST_DIR):
     print("📊 EVALUATING ON TEST SET")
     print("="*70)
     
-    test_datagen = ImageDataGenerator(rescale=1./255)
-    test_generator = test_datagen.flow_from_directory(
-        TEST_DIR,
-        target_size=IMG_SIZE,
-        batch_size=BATCH_SIZE,
-        class_mode='categorical',
-        shuffle=False
-    )
+    if args.input_pipeline == 'generator':
+        test_datagen = ImageDataGenerator(rescale=1./255)
+        test_data = test_datagen.flow_from_directory(
+            TEST_DIR,
+            target_size=IMG_SIZE,
+            batch_size=BATCH_SIZE,
+            class_mode='categorical',
+            shuffle=False
+        )
+        test_class_indices = test_data.class_indices
+    else:
+        test_folder = open_split(TEST_DIR, 'test')
+        test_data = make_eval_dataset(test_folder, BATCH_SIZE)
+        test_class_indices = test_folder.class_indices
+    
+    # Get class names
+    class_names = list(test_class_indices.keys())
     
-    # Get predictions
-    test_loss, test_accuracy = model.evaluate(test_generator)
+    # One pass over the test set: loss, accuracy and confusion matrix together
+    test_results = evaluate_model(model, test_data, class_names)
+    test_loss, test_accuracy = test_results.loss, test_results.accuracy
     print(f"\n✅ Test Loss: {test_loss:.4f}")
     print(f"✅ Test Accuracy: {test_accuracy:.4f}")
     
-    # Get detailed predictions for classification report
-    test_generator.reset()
-    y_pred = model.predict(test_generator, verbose=1)
-    y_pred_classes = np.argmax(y_pred, axis=1)
-    y_true = test_generator.classes
-    
-    # Get class names
-    class_names = list(test_generator.class_indices.keys())
-    
     print("\n📋 Classification Report:")
     print("="*70)
-    print(classification_report(y_true, y_pred_classes, target_names=class_names))
+    print(test_results.report())
     
     # Confusion matrix
-    cm = confusion_matrix(y_true, y_pred_classes)
+    cm = test_results.confusion_matrix
     print("\n🔢 Confusion Matrix:")
     print(cm)
     
@@ -0,0 +1,134 @@
+"""
+Shared image preprocessing: image file / bytes -> float32 model input.
+
+    from preprocessing import preprocess_image, preprocess_batch
+    x = preprocess_image(image_bytes)                   # (1, 224, 224, 3) float32 in [0, 1]
+    x = preprocess_batch([path1, path2], backend='opencv')  # (2, 224, 224, 3)
+
+One definition of what the models see, used by training (data_pipeline
+decodes with `tf_decode`), the report model, TwoStagePredictor, the servers
+and the test scripts:
+  1. decode to 8-bit RGB (alpha dropped, grayscale expanded, no EXIF rotation;
+     JPEG with the accurate integer DCT)
+  2. resize to 224x224 with nearest neighbour: output pixel i takes source
+     pixel floor((i + 0.5) * in / out), computed in integers by every backend
+     (nearest_indices), so no library's own tie-breaking can creep in
+  3. float32, x * (1/255)
+
+Backends, selectable per call or with PREPROCESS_BACKEND (default 'pil'):
+  - 'pil':    Pillow
+  - 'opencv': cv2.imdecode
+  - 'tf':     the exact ops of the training pipeline
+test_preprocessing.py checks that all of them match the training pipeline;
+benchmark_preprocessing.py times them per input size.
+
+Sources can be bytes, a path, a file-like object or (PIL backend only) a
+PIL image.
+"""
+
+import io
+import os
+
+import numpy as np
+from PIL import Image
+
+IMG_SIZE = (224, 224)  # (height, width)
+SCALE = np.float32(1.0 / 255)  # the same float32 constant the training pipeline multiplies by
+BACKENDS = ('pil', 'opencv', 'tf')
+DEFAULT_BACKEND = os.getenv('PREPROCESS_BACKEND', 'pil')
+
+
+def _read(source):
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return bytes(source)
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, 'rb') as f:
+            return f.read()
+    return source.read()
+
+
+# ==========================
+# NEAREST-NEIGHBOUR RESIZE (shared by every backend)
+# ==========================
+def nearest_indices(in_size, out_size):
+    """Source index of each output pixel: floor((i + 0.5) * in / out), in exact integer arithmetic."""
+    return (2 * np.arange(out_size) + 1) * in_size // (2 * out_size)
+
+
+def resize_nearest(image, img_size):
+    """(h, w, c) array -> (img_size[0], img_size[1], c) by gathering nearest_indices rows and columns."""
+    height, width = image.shape[:2]
+    if (height, width) == tuple(img_size):
+        return image
+    return image[nearest_indices(height, img_size[0])[:, None], nearest_indices(width, img_size[1])]
+
+
+# ==========================
+# BACKENDS: source -> uint8 (h, w, 3)
+# ==========================
+def _pil(source, img_size):
+    img = source if isinstance(source, Image.Image) else Image.open(io.BytesIO(_read(source)))
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+    return resize_nearest(np.asarray(img, dtype=np.uint8), img_size)
+
+
+def _opencv(source, img_size):
+    import cv2
+
+    data = np.frombuffer(_read(source), dtype=np.uint8)
+    img = cv2.imdecode(data, cv2.IMREAD_COLOR | cv2.IMREAD_IGNORE_ORIENTATION)
+    if img is None:
+        raise ValueError("OpenCV could not decode the image")
+    return resize_nearest(cv2.cvtColor(img, cv2.COLOR_BGR2RGB), img_size)
+
+
+def tf_decode(contents, img_size=IMG_SIZE):
+    """Encoded image (string tensor) -> uint8 (h, w, 3) tensor. Graph-safe: data_pipeline maps it over files."""
+    import tensorflow as tf
+
+    def jpeg():
+        return tf.io.decode_jpeg(contents, channels=3, dct_method='INTEGER_ACCURATE')
+
+    def other():
+        return tf.io.decode_image(contents, channels=3, expand_animations=False)
+
+    image = tf.cond(tf.io.is_jpeg(contents), jpeg, other)
+    # nearest_indices in graph ops (tf.image.resize breaks ties differently for some sizes)
+    shape = tf.shape(image)
+    rows = (2 * tf.range(img_size[0]) + 1) * shape[0] // (2 * img_size[0])
+    cols = (2 * tf.range(img_size[1]) + 1) * shape[1] // (2 * img_size[1])
+    return tf.gather(tf.gather(image, rows, axis=0), cols, axis=1)
+
+
+def _tf(source, img_size):
+    return tf_decode(_read(source), img_size).numpy()
+
+
+_DECODERS = {'pil': _pil, 'opencv': _opencv, 'tf': _tf}
+
+
+def load_uint8(source, img_size=IMG_SIZE, backend=None):
+    """Decoded, resized uint8 (h, w, 3) image."""
+    backend = backend or DEFAULT_BACKEND
+    if backend not in _DECODERS:
+        raise ValueError(f"Unknown preprocessing backend '{backend}' (choose from {', '.join(BACKENDS)})")
+    if isinstance(source, Image.Image) and backend != 'pil':
+        backend = 'pil'  # already decoded by Pillow
+    return _DECODERS[backend](source, img_size)
+
+
+# ==========================
+# MODEL INPUT
+# ==========================
+def preprocess_batch(sources, img_size=IMG_SIZE, backend=None):
+    """(n, h, w, 3) float32 in [0, 1], written in place into one array."""
+    batch = np.empty((len(sources), img_size[0], img_size[1], 3), dtype=np.float32)
+    for i, source in enumerate(sources):
+        np.multiply(load_uint8(source, img_size, backend), SCALE, out=batch[i])
+    return batch
+
+
+def preprocess_image(source, img_size=IMG_SIZE, backend=None):
+    """(1, h, w, 3) float32 in [0, 1] for a single image."""
+    return preprocess_batch([source], img_size, backend)
@@ -0,0 +1,149 @@
+"""
+Skin cancer report model: prediction + Grad-CAM heatmap for one image.
+
+Shared by the standalone AI brain (ml/main.py) and the combined server
+(backend/aio_server.py). Nothing is loaded at import time; callers load the
+model once with `load_report_model()` and pass it in.
+"""
+
+import base64
+import os
+from typing import Optional
+
+import cv2
+import numpy as np
+import tensorflow as tf
+from keras.models import load_model, Model
+
+from preprocessing import load_uint8, preprocess_image as preprocess
+
+MODEL_PATH = os.path.join(os.path.dirname(__file__), "models", "skin_cancer_model.h5")
+
+# Define the 7 classes your model was trained on (from the Hugging Face card)
+# This order is CRITICAL.
+CLASS_NAMES = [
+    'Actinic Keratoses (akiec)',
+    'Basal Cell Carcinoma (bcc)',
+    'Benign Keratosis (bkl)',
+    'Dermatofibroma (df)',
+    'Melanocytic Nevus (nv)',
+    'Vascular Lesions (vasc)',
+    'Melanoma (mel)'
+]
+
+
+def load_report_model(model_path: str = MODEL_PATH) -> Optional[Model]:
+    """
+    Loads the Keras model, or returns None (with a log line) if it is missing
+    or not a Keras Model, so servers can still start and report the problem.
+    """
+    try:
+        loaded_model = load_model(model_path)
+        if isinstance(loaded_model, Model):
+            print(f"✅ Model loaded successfully from {model_path}")
+            return loaded_model
+        print(f"❌ ERROR: Loaded object is not a Keras Model")
+    except Exception as e:
+        print(f"❌ ERROR loading model: {e}")
+        print(f"👉 Make sure '{model_path}' exists.")
+    return None
+
+
+def preprocess_image(image_bytes: bytes) -> np.ndarray:
+    """
+    Loads image from bytes, resizes to 224x224, and preprocesses
+    for the `syaha/skin_cancer_detection_model` (shared preprocessing module).
+    """
+    return preprocess(image_bytes)
+
+
+def find_last_conv_layer(model: Model) -> str:
+    """
+    Finds the name of the last convolutional layer in the model.
+    """
+    for layer in reversed(model.layers):
+        if "conv2d" in layer.name:
+            print(f"Found last conv layer: {layer.name}")
+            return layer.name
+
+    # Fallback if no "conv2d" found
+    # You may need to manually find this by printing model.summary()
+    # For this specific model, a good guess is one of the last conv layers.
+    # We'll guess a common name. If this fails, we'll need model.summary().
+    print("Warning: Could not auto-find 'conv2d' layer. Guessing 'conv2d_9'.")
+    return "conv2d_9"
+
+
+def get_grad_cam(model: Model, img_array: np.ndarray, last_conv_layer_name: str, pred_index: int) -> np.ndarray:
+    """
+    Generates the Grad-CAM heatmap.
+    """
+    grad_model = Model(
+        [model.inputs],
+        [model.get_layer(last_conv_layer_name).output, model.output]
+    )
+
+    with tf.GradientTape() as tape:
+        last_conv_layer_output, preds = grad_model(img_array)
+        class_channel = preds[:, pred_index]
+
+    grads = tape.gradient(class_channel, last_conv_layer_output)
+    pooled_grads = tf.reduce_mean(grads, axis=(0, 1, 2))
+    last_conv_layer_output = last_conv_layer_output[0]
+
+    heatmap = last_conv_layer_output @ pooled_grads[..., tf.newaxis]
+    heatmap = tf.squeeze(heatmap)
+
+    heatmap = tf.maximum(heatmap, 0) / tf.math.reduce_max(heatmap)
+    heatmap = heatmap.numpy()
+
+    return heatmap
+
+
+def overlay_heatmap(image_bytes: bytes, heatmap: np.ndarray, alpha=0.4) -> bytes:
+    """
+    Overlays the heatmap on the original image and returns bytes.
+    """
+    img = load_uint8(image_bytes).astype(np.float32)
+
+    heatmap_resized = cv2.resize(heatmap, (img.shape[1], img.shape[0]))
+    heatmap_uint8 = (255 * heatmap_resized).astype(np.uint8)
+    heatmap_colored = cv2.applyColorMap(heatmap_uint8, cv2.COLORMAP_JET)
+
+    superimposed_img = (heatmap_colored * alpha) + img
+    superimposed_img = np.clip(superimposed_img, 0, 255).astype(np.uint8)
+
+    is_success, buffer = cv2.imencode(".jpg", superimposed_img)
+    if not is_success:
+        raise ValueError("Failed to encode heatmap image.")
+
+    return buffer.tobytes()
+
+
+def build_report(model: Model, last_conv_layer: str, image_bytes: bytes, processed_image: np.ndarray) -> dict:
+    """
+    Prediction + Grad-CAM overlay for one preprocessed image.
+    A Grad-CAM failure is logged and leaves the heatmap empty rather than
+    failing the whole report.
+    """
+    # Get model prediction
+    preds = model.predict(processed_image, verbose=0)[0]
+    pred_index = int(np.argmax(preds))
+    prediction = CLASS_NAMES[pred_index]
+    confidence = float(np.max(preds))
+
+    # Generate Grad-CAM heatmap
+    try:
+        heatmap = get_grad_cam(model, processed_image, last_conv_layer, pred_index)
+        heatmap_overlay_bytes = overlay_heatmap(image_bytes, heatmap)
+        heatmap_base64 = base64.b64encode(heatmap_overlay_bytes).decode('utf-8')
+
+    except Exception as e:
+        print(f"❌ Grad-CAM Error: {e}")
+        heatmap_base64 = None
+
+    return {
+        "prediction": prediction,
+        "confidence": confidence,
+        "heatmap_image": f"data:image/jpeg;base64,{heatmap_base64}"
+    }
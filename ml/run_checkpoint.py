@@ -0,0 +1,215 @@
+"""
+Resumable training runs for model1train.py (--run-dir / --resume).
+
+A run has two phases, 'initial' (frozen base) and 'finetune'. After every
+epoch, RunCheckpoint writes the complete state of the phase to the run
+directory:
+  - every model variable (weights, BatchNorm statistics, dropout seed state)
+  - every optimizer variable (moments, iteration count) and the learning rate
+  - the next epoch and the phase history
+  - EarlyStopping / ReduceLROnPlateau / ModelCheckpoint counters and bests,
+    including EarlyStopping's best weights
+  - Python, NumPy and TensorFlow global RNG states
+The data pipelines are keyed by epoch (data_pipeline.make_train_dataset,
+feature_cache.feature_dataset), so restarting at the saved epoch replays
+exactly the batches the killed run would have seen next. With the legacy
+ImageDataGenerator only weights and counters are exact; its shuffle order is
+not.
+
+When a phase ends, TrainingRun.complete stores the final weights and history,
+so a resumed run skips finished phases.
+
+Layout of a run directory:
+    state.json          phase progress and histories
+    initial.npz         last epoch checkpoint of a phase (variables + callback arrays)
+    initial_rng.pkl     RNG states for that checkpoint
+    initial_final.npz   model variables when the phase finished
+    worker1/ ...        the same for each non-chief worker of a multi-worker run
+"""
+
+import json
+import os
+import pickle
+import random
+
+import numpy as np
+import tensorflow as tf
+from keras.callbacks import Callback, History
+
+# Scalar callback attributes worth restoring, when a callback has them
+CALLBACK_ATTRIBUTES = ('wait', 'best', 'best_epoch', 'stopped_epoch', 'cooldown_counter')
+
+
+def _atomic_write(path, write):
+    tmp = path + '.tmp'
+    write(tmp)
+    os.replace(tmp, path)
+
+
+def _save_npz(path, arrays):
+    def write(tmp):
+        with open(tmp, 'wb') as f:
+            np.savez(f, **arrays)
+    _atomic_write(path, write)
+
+
+def _rng_state():
+    return {
+        'python': random.getstate(),
+        'numpy': np.random.get_state(),
+        'tensorflow': tf.random.get_global_generator().state.numpy(),
+    }
+
+
+def _set_rng_state(state):
+    random.setstate(state['python'])
+    np.random.set_state(state['numpy'])
+    tf.random.get_global_generator().reset(state['tensorflow'])
+
+
+def history_object(logs):
+    """A keras History holding `logs`, for code that expects model.fit's return value."""
+    history = History()
+    history.history = logs
+    return history
+
+
+class TrainingRun:
+    """Phase bookkeeping (state.json) of one run directory."""
+
+    def __init__(self, run_dir, resume=False):
+        self.run_dir = run_dir
+        state_path = os.path.join(run_dir, 'state.json')
+        if resume and os.path.exists(state_path):
+            with open(state_path) as f:
+                self.state = json.load(f)
+            print(f"♻️  Resuming run from {run_dir}: {self.describe()}")
+        else:
+            if resume:
+                print(f"⚠️  No run state in {run_dir}, starting a new run")
+            os.makedirs(run_dir, exist_ok=True)
+            # Only this run's files: worker{i}/ subdirectories belong to other workers (distributed.run_path)
+            for name in os.listdir(run_dir):
+                path = os.path.join(run_dir, name)
+                if os.path.isfile(path):
+                    os.remove(path)
+            self.state = {'phases': {}}
+            self._write()
+
+    def describe(self):
+        parts = []
+        for phase, info in self.state['phases'].items():
+            parts.append(f"{phase} done" if info['completed'] else f"{phase} at epoch {info['epoch']}")
+        return ', '.join(parts) or 'nothing trained yet'
+
+    def _write(self):
+        def write(tmp):
+            with open(tmp, 'w') as f:
+                json.dump(self.state, f, indent=2)
+        _atomic_write(os.path.join(self.run_dir, 'state.json'), write)
+
+    def _phase(self, phase):
+        return self.state['phases'].setdefault(phase, {'epoch': 0, 'history': {}, 'completed': False})
+
+    def completed(self, phase):
+        return self._phase(phase)['completed']
+
+    def initial_epoch(self, phase):
+        """Epoch to pass to model.fit(initial_epoch=...) and to the data pipeline."""
+        return self._phase(phase)['epoch']
+
+    def checkpoint(self, phase, callbacks=()):
+        """The callback for model.fit; put it LAST in the list so it sees the other callbacks' updates."""
+        return RunCheckpoint(self, phase, callbacks)
+
+    def complete(self, phase, model, history):
+        """Marks a phase finished with the model's final variables and its full history."""
+        _save_npz(os.path.join(self.run_dir, f"{phase}_final.npz"),
+                  {f"m{i}": v.numpy() for i, v in enumerate(model.variables)})
+        info = self._phase(phase)
+        info.update(completed=True, history=history)
+        self._write()
+
+    def restore_completed(self, phase, model):
+        """Loads a finished phase's final variables into model; returns its History."""
+        with np.load(os.path.join(self.run_dir, f"{phase}_final.npz")) as data:
+            for i, variable in enumerate(model.variables):
+                variable.assign(data[f"m{i}"])
+        print(f"♻️  Phase '{phase}' already finished, loaded its final weights")
+        return history_object(self._phase(phase)['history'])
+
+    def _record_epoch(self, phase, epoch, history):
+        info = self._phase(phase)
+        info.update(epoch=epoch, history=history)
+        self._write()
+
+
+class RunCheckpoint(Callback):
+    """Saves the full phase state after every epoch and restores it when model.fit starts."""
+
+    def __init__(self, run, phase, callbacks=()):
+        super().__init__()
+        self.run = run
+        self.phase = phase
+        self.callbacks = list(callbacks)
+        self.history = {k: list(v) for k, v in run._phase(phase)['history'].items()}
+        self._path = os.path.join(run.run_dir, f"{phase}.npz")
+        self._rng_path = os.path.join(run.run_dir, f"{phase}_rng.pkl")
+
+    # --- save ---
+    def on_epoch_end(self, epoch, logs=None):
+        logs = dict(logs or {})
+        logs['learning_rate'] = float(self.model.optimizer.learning_rate.numpy())
+        for key, value in logs.items():
+            self.history.setdefault(key, []).append(float(value))
+        # The last epoch (or an early stop) is recorded by TrainingRun.complete
+        # once the other callbacks' on_train_end has run
+        if self.model.stop_training or epoch + 1 >= self.params['epochs']:
+            return
+        self._save(epoch + 1)
+
+    def _save(self, next_epoch):
+        optimizer = self.model.optimizer
+        arrays = {f"m{i}": v.numpy() for i, v in enumerate(self.model.variables)}
+        arrays.update({f"o{i}": v.numpy() for i, v in enumerate(optimizer.variables)})
+        arrays['learning_rate'] = np.array(float(optimizer.learning_rate.numpy()))
+        callback_state = []
+        for c, callback in enumerate(self.callbacks):
+            callback_state.append({
+                name: (float(getattr(callback, name)) if name == 'best' else getattr(callback, name))
+                for name in CALLBACK_ATTRIBUTES if getattr(callback, name, None) is not None
+            })
+            for j, weight in enumerate(getattr(callback, 'best_weights', None) or []):
+                arrays[f"c{c}_w{j}"] = np.asarray(weight)
+        arrays['callbacks'] = np.array(json.dumps(callback_state))
+        _save_npz(self._path, arrays)
+
+        def write_rng(tmp):
+            with open(tmp, 'wb') as f:
+                pickle.dump(_rng_state(), f)
+        _atomic_write(self._rng_path, write_rng)
+        self.run._record_epoch(self.phase, next_epoch, self.history)
+
+    # --- restore ---
+    def on_train_begin(self, logs=None):
+        # Runs after the other callbacks' on_train_begin, which reset their counters
+        if self.run.initial_epoch(self.phase) == 0 or not os.path.exists(self._path):
+            return
+        optimizer = self.model.optimizer
+        if not optimizer.built:
+            optimizer.build(self.model.trainable_variables)
+        with np.load(self._path) as data:
+            for i, variable in enumerate(self.model.variables):
+                variable.assign(data[f"m{i}"])
+            for i, variable in enumerate(optimizer.variables):
+                variable.assign(data[f"o{i}"])
+            optimizer.learning_rate = float(data['learning_rate'])
+            for c, (callback, state) in enumerate(zip(self.callbacks, json.loads(str(data['callbacks'])))):
+                for name, value in state.items():
+                    setattr(callback, name, value)
+                weights = sorted((k for k in data.files if k.startswith(f"c{c}_w")), key=lambda k: int(k.split('_w')[1]))
+                if weights:
+                    callback.best_weights = [data[k] for k in weights]
+        with open(self._rng_path, 'rb') as f:
+            _set_rng_state(pickle.load(f))
+        print(f"♻️  Restored '{self.phase}' at epoch {self.run.initial_epoch(self.phase)}")
@@ -0,0 +1,179 @@
+"""
+Pre-resized dataset shards: every image decoded and resized to 224x224 once,
+stored as uint8 in memory-mapped .npy shards with a label index.
+
+    python shard_cache.py build --src split_dataset --out split_dataset_shards
+    python shard_cache.py status --src split_dataset --out split_dataset_shards
+
+Layout of one split (e.g. split_dataset_shards/train):
+    index.json          class indices, image count, shard names, source fingerprint
+    labels.npy          int32 class index per image
+    images_00000.npy    uint8 (n, 224, 224, 3), up to --shard-size images per file
+
+The fingerprint covers every source file's relative path, size and mtime plus
+the image size, so adding, removing or editing an image makes the shards
+stale; `ensure_shards` rebuilds them. Pixels are produced by
+data_pipeline.decode_image, so training from shards sees exactly what the
+tf.data pipeline would decode.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+import tensorflow as tf
+
+from data_pipeline import AUTOTUNE, IMG_SIZE, ImageFolder, decode_image
+
+FORMAT_VERSION = 3  # 2: JPEGs decoded with the accurate DCT; 3: integer nearest-neighbour indices (preprocessing)
+DEFAULT_SHARD_SIZE = 2048  # ~300 MB per shard at 224x224x3
+SPLITS = ('train', 'val', 'test')
+
+
+def source_fingerprint(folder, img_size=IMG_SIZE):
+    digest = hashlib.sha256(f"v{FORMAT_VERSION}:{img_size[0]}x{img_size[1]}".encode())
+    for path in folder.filenames:
+        stat = os.stat(path)
+        rel = os.path.relpath(path, folder.directory)
+        digest.update(f"\n{rel}\t{stat.st_size}\t{stat.st_mtime_ns}".encode())
+    return digest.hexdigest()
+
+
+def build_shards(src_dir, out_dir, img_size=IMG_SIZE, shard_size=DEFAULT_SHARD_SIZE):
+    """Decodes every image of src_dir once and writes the shards (atomically replaces out_dir)."""
+    folder = ImageFolder(src_dir)
+    tmp_dir = out_dir.rstrip(os.sep) + '.tmp'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    started = time.perf_counter()
+    decoded = tf.data.Dataset.from_tensor_slices(folder.filenames).map(
+        lambda path: decode_image(path, img_size), num_parallel_calls=AUTOTUNE
+    ).batch(256).prefetch(AUTOTUNE)
+
+    shard_names = []
+    shard, written = None, 0
+    for batch in decoded.as_numpy_iterator():
+        for image in batch:
+            offset = written % shard_size
+            if offset == 0:
+                if shard is not None:
+                    shard.flush()
+                count = min(shard_size, folder.samples - written)
+                name = f"images_{len(shard_names):05d}.npy"
+                shard = np.lib.format.open_memmap(
+                    os.path.join(tmp_dir, name), mode='w+', dtype=np.uint8, shape=(count, *img_size, 3)
+                )
+                shard_names.append(name)
+            shard[offset] = image
+            written += 1
+    if shard is not None:
+        shard.flush()
+        del shard
+
+    np.save(os.path.join(tmp_dir, 'labels.npy'), folder.classes)
+    index = {
+        'version': FORMAT_VERSION,
+        'img_size': list(img_size),
+        'class_indices': folder.class_indices,
+        'count': folder.samples,
+        'shard_size': shard_size,
+        'shards': shard_names,
+        'fingerprint': source_fingerprint(folder, img_size),
+    }
+    with open(os.path.join(tmp_dir, 'index.json'), 'w') as f:
+        json.dump(index, f, indent=2)
+
+    shutil.rmtree(out_dir, ignore_errors=True)
+    os.replace(tmp_dir, out_dir)
+    print(f"✅ {folder.samples} images from {src_dir} -> {len(shard_names)} shard(s) in {out_dir} "
+          f"({time.perf_counter() - started:.1f}s)")
+    return index
+
+
+def is_fresh(src_dir, out_dir, img_size=IMG_SIZE):
+    index_path = os.path.join(out_dir, 'index.json')
+    if not os.path.exists(index_path):
+        return False
+    with open(index_path) as f:
+        index = json.load(f)
+    return (index.get('version') == FORMAT_VERSION
+            and tuple(index.get('img_size', ())) == tuple(img_size)
+            and index.get('fingerprint') == source_fingerprint(ImageFolder(src_dir), img_size))
+
+
+def ensure_shards(src_dir, out_dir, img_size=IMG_SIZE, shard_size=DEFAULT_SHARD_SIZE):
+    """Opens the shards for src_dir, rebuilding them first if missing or stale."""
+    if not is_fresh(src_dir, out_dir, img_size):
+        print(f"🔄 Shards for {src_dir} are missing or stale, rebuilding...")
+        build_shards(src_dir, out_dir, img_size, shard_size)
+    return ShardCache(out_dir)
+
+
+class ShardCache:
+    """
+    Read side of one split. Same attributes as data_pipeline.ImageFolder
+    (class_indices, classes, samples, num_classes, steps) plus `read`, so the
+    data_pipeline datasets accept either.
+    """
+
+    def __init__(self, out_dir):
+        with open(os.path.join(out_dir, 'index.json')) as f:
+            self.index = json.load(f)
+        self.directory = out_dir
+        self.class_indices = self.index['class_indices']
+        self.img_size = tuple(self.index['img_size'])
+        self.shard_size = self.index['shard_size']
+        self.classes = np.load(os.path.join(out_dir, 'labels.npy'))
+        self._shards = [np.load(os.path.join(out_dir, name), mmap_mode='r') for name in self.index['shards']]
+
+    @property
+    def samples(self):
+        return self.index['count']
+
+    @property
+    def num_classes(self):
+        return len(self.class_indices)
+
+    def steps(self, batch_size):
+        return -(-self.samples // batch_size)
+
+    def read(self, indices):
+        """uint8 (len(indices), h, w, 3) for global image indices, in the given order."""
+        indices = np.asarray(indices, dtype=np.int64)
+        out = np.empty((len(indices), *self.img_size, 3), dtype=np.uint8)
+        shard_ids, offsets = np.divmod(indices, self.shard_size)
+        for shard_id in np.unique(shard_ids):
+            rows = shard_ids == shard_id
+            out[rows] = self._shards[shard_id][offsets[rows]]
+        return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or check pre-resized uint8 dataset shards.")
+    parser.add_argument('command', choices=['build', 'status'])
+    parser.add_argument('--src', required=True, help="Dataset root containing train/ val/ test/")
+    parser.add_argument('--out', required=True, help="Where the shards go (one sub-directory per split)")
+    parser.add_argument('--shard-size', type=int, default=DEFAULT_SHARD_SIZE)
+    parser.add_argument('--force', action='store_true', help="Rebuild even if the shards are fresh")
+    args = parser.parse_args()
+
+    for split in SPLITS:
+        src_dir, out_dir = os.path.join(args.src, split), os.path.join(args.out, split)
+        if not os.path.isdir(src_dir):
+            continue
+        fresh = is_fresh(src_dir, out_dir)
+        if args.command == 'status':
+            print(f"{'✅' if fresh else '❌'} {split}: {'fresh' if fresh else 'missing or stale'}")
+        elif fresh and not args.force:
+            print(f"✅ {split}: shards are fresh, skipping")
+        else:
+            build_shards(src_dir, out_dir, shard_size=args.shard_size)
+
+
+if __name__ == '__main__':
+    main()
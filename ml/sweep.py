@@ -0,0 +1,389 @@
+"""
+Hyperparameter sweep for the Stage 1 classifier with asynchronous successive
+halving (ASHA): many trials start, bad ones are stopped early on val_accuracy,
+and the epochs go to the promising ones.
+
+    python sweep.py --space sweep_space.json --data split_dataset --trials 27 --parallel 4 --cpus 16
+    python sweep.py --space sweep_space.json --data split_dataset --shards split_dataset_shards
+    python sweep.py --space sweep_space.json --data split_dataset --features 5   # head only, on cached features
+    python sweep.py --space sweep_space.json --data split_dataset --sweep-id lr-search --trials 9   # add to a sweep
+    python sweep.py --results sweep_results.db --show [--sweep-id lr-search]
+
+Search space (JSON), one entry per hyperparameter:
+    {"learning_rate": {"type": "loguniform", "low": 1e-5, "high": 1e-3},
+     "dropout":       {"type": "uniform", "low": 0.2, "high": 0.6},
+     "unfreeze_layers": {"type": "choice", "values": [20, 40, 80]},
+     "initial_epochs":  {"type": "int", "low": 2, "high": 10}}
+Known hyperparameters (defaults = model1train.py): learning_rate,
+finetune_learning_rate, dropout, unfreeze_layers, initial_epochs (frozen-base
+epochs before fine-tuning starts).
+
+ASHA: the resource is epochs. Rungs sit at min_epochs * eta^k up to
+max_epochs. A trial reaching a rung records its val_accuracy there and goes
+on only if it is in the top 1/eta of everything recorded at that rung so far
+(always while fewer than eta trials have reported). No trial waits for
+another, so workers never sit idle. Only trials of the same sweep are
+compared: every invocation gets a new --sweep-id (a timestamp) unless one is
+given, so one results file can hold unrelated sweeps, and passing an earlier
+id adds trials to that sweep.
+
+Trials run in parallel worker processes; --cpus is split evenly between them
+(TensorFlow intra-op threads). Every trial and rung result goes into a SQLite
+results table (--results), which the workers also use to take the promotion
+decisions. Shards (--shards) and backbone features (--features) are prepared
+once by the parent and shared read-only by every trial.
+"""
+
+import argparse
+import json
+import math
+import os
+import random
+import sqlite3
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import get_context
+
+SEED = 42
+BATCH_SIZE = 32
+DEFAULTS = {
+    'learning_rate': 1e-4,
+    'finetune_learning_rate': 1e-5,
+    'dropout': 0.4,
+    'unfreeze_layers': 40,
+    'initial_epochs': 20,
+}
+
+
+# ==========================
+# SEARCH SPACE
+# ==========================
+def sample(space, rng):
+    params = {}
+    for name, spec in space.items():
+        kind = spec['type']
+        if kind == 'choice':
+            params[name] = rng.choice(spec['values'])
+        elif kind == 'uniform':
+            params[name] = rng.uniform(spec['low'], spec['high'])
+        elif kind == 'loguniform':
+            params[name] = math.exp(rng.uniform(math.log(spec['low']), math.log(spec['high'])))
+        elif kind == 'int':
+            params[name] = rng.randint(spec['low'], spec['high'])
+        else:
+            raise ValueError(f"Unknown search space type {kind!r} for {name}")
+    unknown = set(params) - set(DEFAULTS)
+    if unknown:
+        raise ValueError(f"Unknown hyperparameters: {sorted(unknown)}")
+    return params
+
+
+def rungs(min_epochs, max_epochs, eta):
+    """Epoch counts at which trials are compared: min_epochs * eta^k, ending with max_epochs."""
+    points, epochs = [], min_epochs
+    while epochs < max_epochs:
+        points.append(epochs)
+        epochs *= eta
+    return points + [max_epochs]
+
+
+# ==========================
+# RESULTS TABLE
+# ==========================
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS trials (
+    id INTEGER PRIMARY KEY,
+    sweep_id TEXT,
+    params TEXT NOT NULL,
+    status TEXT NOT NULL,
+    epochs INTEGER NOT NULL DEFAULT 0,
+    best_val_accuracy REAL,
+    seconds REAL,
+    error TEXT
+);
+CREATE TABLE IF NOT EXISTS rung_results (
+    trial_id INTEGER NOT NULL REFERENCES trials(id),
+    rung INTEGER NOT NULL,
+    val_accuracy REAL NOT NULL,
+    PRIMARY KEY (trial_id, rung)
+);
+"""
+
+
+class ResultsTable:
+    """SQLite table shared by the parent and the trial workers (one connection per process)."""
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path, timeout=60, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(_SCHEMA)
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(trials)")]
+        if 'sweep_id' not in columns:  # results file from before sweep ids
+            self.conn.execute("ALTER TABLE trials ADD COLUMN sweep_id TEXT")
+
+    def add_trial(self, sweep_id, params):
+        cursor = self.conn.execute(
+            "INSERT INTO trials (sweep_id, params, status) VALUES (?, ?, 'pending')", (sweep_id, json.dumps(params))
+        )
+        return cursor.lastrowid
+
+    def set_status(self, trial_id, status):
+        self.conn.execute("UPDATE trials SET status = ? WHERE id = ?", (status, trial_id))
+
+    def record_rung(self, trial_id, rung, val_accuracy, eta):
+        """
+        Stores the rung result; True if the trial is in the top 1/eta of its
+        sweep at this rung and should go on.
+        """
+        self.conn.execute("BEGIN IMMEDIATE")  # decisions are taken one at a time across workers
+        try:
+            self.conn.execute("INSERT OR REPLACE INTO rung_results VALUES (?, ?, ?)", (trial_id, rung, val_accuracy))
+            rows = self.conn.execute(
+                "SELECT r.val_accuracy FROM rung_results r JOIN trials t ON t.id = r.trial_id"
+                " WHERE r.rung = ? AND t.sweep_id = (SELECT sweep_id FROM trials WHERE id = ?)",
+                (rung, trial_id),
+            )
+            values = sorted((row[0] for row in rows), reverse=True)
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+        if len(values) < eta:
+            return True
+        cutoff = values[max(len(values) // eta - 1, 0)]
+        return val_accuracy >= cutoff
+
+    def finish(self, trial_id, status, epochs, best, seconds, error=None):
+        self.conn.execute(
+            "UPDATE trials SET status = ?, epochs = ?, best_val_accuracy = ?, seconds = ?, error = ? WHERE id = ?",
+            (status, epochs, best, seconds, error, trial_id),
+        )
+
+    def rows(self, sweep_id=None):
+        where, params = ("WHERE sweep_id = ?", (sweep_id,)) if sweep_id else ("", ())
+        return self.conn.execute(
+            "SELECT id, sweep_id, status, epochs, best_val_accuracy, seconds, params FROM trials " + where +
+            " ORDER BY best_val_accuracy IS NULL, best_val_accuracy DESC, id",
+            params,
+        ).fetchall()
+
+
+def show(table, limit=20, sweep_id=None):
+    rows = table.rows(sweep_id)
+    print(f"{'trial':>5} {'sweep':<16} {'status':<9} {'epochs':>6} {'val_acc':>8} {'minutes':>7}  params")
+    for trial_id, sweep, status, epochs, best, seconds, params in rows[:limit]:
+        best_text = f"{best:.4f}" if best is not None else '-'
+        minutes = f"{seconds / 60:.1f}" if seconds else '-'
+        print(f"{trial_id:>5} {sweep or '-':<16} {status:<9} {epochs:>6} {best_text:>8} {minutes:>7}  {params}")
+    statuses = [row[2] for row in rows]
+    print(f"\n{len(rows)} trials: " + ', '.join(f"{statuses.count(s)} {s}" for s in sorted(set(statuses))))
+
+
+# ==========================
+# TRIAL (runs in a worker process)
+# ==========================
+def run_trial(config):
+    """Trains one configuration epoch by epoch until ASHA stops it or max_epochs is reached."""
+    import tensorflow as tf
+
+    tf.config.threading.set_intra_op_parallelism_threads(config['threads'])
+    tf.config.threading.set_inter_op_parallelism_threads(2)
+
+    from keras import regularizers
+    from keras.applications import MobileNetV2
+    from keras.layers import Dense, Dropout, GlobalAveragePooling2D, Input
+    from keras.models import Model
+    from keras.optimizers import Adam
+
+    from data_pipeline import ImageFolder, make_eval_dataset, make_train_dataset
+    from feature_cache import feature_dataset
+    from shard_cache import ShardCache
+
+    table = ResultsTable(config['results'])
+    trial_id, params = config['trial_id'], dict(DEFAULTS, **config['params'])
+    table.set_status(trial_id, 'running')
+    started = time.perf_counter()
+    tf.keras.utils.set_random_seed(SEED + trial_id)
+
+    def head(x, num_classes):
+        x = Dense(256, activation='relu', kernel_regularizer=regularizers.l2(0.01))(x)
+        x = Dropout(params['dropout'])(x)
+        x = Dense(128, activation='relu', kernel_regularizer=regularizers.l2(0.01))(x)
+        x = Dropout(params['dropout'] * 0.75)(x)  # model1train: 0.4 / 0.3
+        return Dense(num_classes, activation='softmax')(x)
+
+    def compile_model(model, learning_rate):
+        model.compile(optimizer=Adam(learning_rate=learning_rate), loss='categorical_crossentropy',
+                      metrics=['accuracy'])
+
+    if config['features']:
+        # Head-only trials on the shared cached backbone features
+        import numpy as np
+        train_x = np.load(os.path.join(config['features'], 'train', 'features.npy'), mmap_mode='r')
+        train_y = np.load(os.path.join(config['features'], 'train', 'labels.npy'))
+        val_x = np.load(os.path.join(config['features'], 'val', 'features.npy'), mmap_mode='r')
+        val_y = np.load(os.path.join(config['features'], 'val', 'labels.npy'))
+        num_classes, epoch_size = config['num_classes'], config['train_samples']
+        inputs = Input(shape=(train_x.shape[1],))
+        model = Model(inputs, head(inputs, num_classes))
+        compile_model(model, params['learning_rate'])
+        val_data = feature_dataset(val_x, val_y, num_classes, BATCH_SIZE)
+
+        def epoch_data(epoch):
+            return (feature_dataset(train_x, train_y, num_classes, BATCH_SIZE, seed=SEED, start_epoch=epoch,
+                                    end_epoch=epoch + 1, epoch_size=epoch_size),
+                    math.ceil(epoch_size / BATCH_SIZE))
+    else:
+        open_split = ShardCache if config['shards'] else ImageFolder
+        root = config['shards'] or config['data']
+        train_source = open_split(os.path.join(root, 'train'))
+        val_source = open_split(os.path.join(root, 'val'))
+        num_classes = train_source.num_classes
+        base_model = MobileNetV2(weights='imagenet', include_top=False, input_shape=(224, 224, 3))
+        base_model.trainable = False
+        model = Model(base_model.input, head(GlobalAveragePooling2D()(base_model.output), num_classes))
+        compile_model(model, params['learning_rate'])
+        val_data = make_eval_dataset(val_source, BATCH_SIZE, cache='memory')
+
+        def epoch_data(epoch):
+            return (make_train_dataset(train_source, BATCH_SIZE, SEED, epoch, epoch + 1),
+                    train_source.steps(BATCH_SIZE))
+
+    class_weights = config['class_weights']
+    best, status, epoch = None, 'completed', 0
+    try:
+        for epoch in range(config['max_epochs']):
+            if not config['features'] and epoch == params['initial_epochs']:
+                base_model.trainable = True
+                for layer in base_model.layers[:-params['unfreeze_layers']]:
+                    layer.trainable = False
+                compile_model(model, params['finetune_learning_rate'])
+            data, steps = epoch_data(epoch)
+            history = model.fit(data, epochs=epoch + 1, initial_epoch=epoch, steps_per_epoch=steps,
+                                validation_data=val_data, class_weight=class_weights, verbose=0)
+            val_accuracy = float(history.history['val_accuracy'][-1])
+            best = val_accuracy if best is None else max(best, val_accuracy)
+            if epoch + 1 in config['rungs'][:-1] and not table.record_rung(trial_id, epoch + 1, val_accuracy, config['eta']):
+                status = 'pruned'
+                break
+        else:
+            table.record_rung(trial_id, config['max_epochs'], val_accuracy, config['eta'])
+        epochs_done = epoch + 1
+    except Exception:
+        table.finish(trial_id, 'failed', epoch, best, time.perf_counter() - started, traceback.format_exc())
+        raise
+    table.finish(trial_id, status, epochs_done, best, time.perf_counter() - started)
+    return trial_id, status, epochs_done, best
+
+
+# ==========================
+# SWEEP (parent process)
+# ==========================
+def prepare_features(data_dir, out_dir, views):
+    """Extracts the shared backbone features once, before any trial starts (see feature_cache.py)."""
+    from keras.applications import MobileNetV2
+
+    from data_pipeline import ImageFolder
+    from feature_cache import ensure_features
+
+    extractor = MobileNetV2(weights='imagenet', include_top=False, input_shape=(224, 224, 3), pooling='avg')
+    key = f"{extractor.name}-imagenet-224x224"
+    train = ImageFolder(os.path.join(data_dir, 'train'))
+    ensure_features(extractor, train, os.path.join(out_dir, 'train'), BATCH_SIZE, SEED,
+                    views=views, augment=True, key=key)
+    ensure_features(extractor, ImageFolder(os.path.join(data_dir, 'val')), os.path.join(out_dir, 'val'),
+                    BATCH_SIZE, SEED, key=key)
+    return train.num_classes, train.samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ASHA hyperparameter sweep for the Stage 1 classifier.")
+    parser.add_argument('--space', help="Search space JSON file")
+    parser.add_argument('--data', help="Dataset root with train/ and val/ class folders")
+    parser.add_argument('--results', default='sweep_results.db', help="SQLite results table")
+    parser.add_argument('--show', action='store_true', help="Print the results table and exit")
+    parser.add_argument('--sweep-id', default=None,
+                        help="Sweep to add trials to (ASHA compares only within a sweep; default: a new one)")
+    parser.add_argument('--trials', type=int, default=27)
+    parser.add_argument('--parallel', type=int, default=None, help="Trials at a time (default: cpus / 4)")
+    parser.add_argument('--cpus', type=int, default=os.cpu_count() or 1, help="CPU budget shared by the trials")
+    parser.add_argument('--min-epochs', type=int, default=1)
+    parser.add_argument('--max-epochs', type=int, default=27)
+    parser.add_argument('--eta', type=int, default=3, help="Keep the top 1/eta at each rung")
+    parser.add_argument('--shards', default=None, help="Pre-resized shard root (built/refreshed once, then shared)")
+    parser.add_argument('--features', type=int, default=0,
+                        help="Head-only trials on cached backbone features with this many augmented views")
+    parser.add_argument('--feature-dir', default=None, help="--features only (default: <data>_features)")
+    parser.add_argument('--class-weights', default=None, help="class_weights.json as used by model1train.py")
+    parser.add_argument('--seed', type=int, default=SEED, help="Seed for sampling the search space")
+    args = parser.parse_args()
+
+    table = ResultsTable(args.results)
+    if args.show:
+        show(table, sweep_id=args.sweep_id)
+        return
+    if not args.space or not args.data:
+        parser.error("--space and --data are required to run a sweep")
+
+    with open(args.space) as f:
+        space = json.load(f)
+    class_weights = None
+    if args.class_weights:
+        with open(args.class_weights) as f:
+            class_weights = {int(k): v for k, v in json.load(f).items()}
+
+    # Shared, read-only inputs are prepared once here, not per trial
+    feature_dir, num_classes, train_samples = None, None, None
+    if args.features:
+        feature_dir = args.feature_dir or args.data.rstrip('/') + '_features'
+        num_classes, train_samples = prepare_features(args.data, feature_dir, args.features)
+    elif args.shards:
+        from shard_cache import ensure_shards
+        for split in ('train', 'val'):
+            ensure_shards(os.path.join(args.data, split), os.path.join(args.shards, split))
+
+    parallel = args.parallel or max(1, args.cpus // 4)
+    threads = max(1, args.cpus // parallel)
+    schedule = rungs(args.min_epochs, args.max_epochs, args.eta)
+    sweep_id = args.sweep_id or time.strftime('%Y%m%d-%H%M%S')
+    rng = random.Random(args.seed)
+    print(f"🔎 Sweep {sweep_id}: {args.trials} trials, {parallel} at a time with {threads} thread(s) each; rungs at epochs {schedule}")
+
+    configs = []
+    for _ in range(args.trials):
+        params = sample(space, rng)
+        configs.append({
+            'trial_id': table.add_trial(sweep_id, params),
+            'params': params,
+            'results': args.results,
+            'data': args.data,
+            'shards': args.shards,
+            'features': feature_dir,
+            'num_classes': num_classes,
+            'train_samples': train_samples,
+            'class_weights': class_weights,
+            'threads': threads,
+            'rungs': schedule,
+            'max_epochs': args.max_epochs,
+            'eta': args.eta,
+        })
+
+    started = time.perf_counter()
+    # spawn: TensorFlow does not survive fork
+    with ProcessPoolExecutor(max_workers=parallel, mp_context=get_context('spawn')) as pool:
+        futures = {pool.submit(run_trial, config): config['trial_id'] for config in configs}
+        for future in as_completed(futures):
+            try:
+                trial_id, status, epochs, best = future.result()
+                print(f"  trial {trial_id}: {status} after {epochs} epoch(s), best val_accuracy {best:.4f}")
+            except Exception as e:
+                print(f"  ❌ trial {futures[future]} failed: {e}")
+
+    print(f"\n✅ Sweep {sweep_id} finished in {(time.perf_counter() - started) / 60:.1f} min\n")
+    show(table, sweep_id=sweep_id)
+
+
+if __name__ == '__main__':
+    main()
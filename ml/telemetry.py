@@ -0,0 +1,136 @@
+"""
+Training throughput telemetry: is the input pipeline or the model the bottleneck?
+
+    telemetry = ThroughputTelemetry(log_dir='logs/telemetry')
+    model.fit(telemetry.instrument(train_dataset), callbacks=[telemetry, ...])
+
+Keras fetches the next batch inside the compiled train step, so a callback
+alone only sees the total step time. `instrument` appends a marker to the
+tf.data pipeline that records when a batch actually leaves it; per step:
+  data wait = batch ready - step start   (the model sat idle waiting for input)
+  compute   = step end - batch ready
+Per epoch the callback adds images_per_sec, step_time_ms, data_wait_ms,
+compute_ms and data_wait_fraction to the epoch logs, so they end up in the
+Keras history (training_history.pkl/.json), the run checkpoint and, when the
+callback comes before TensorBoard, in TensorBoard. With log_dir, per-step
+values are also written as TensorBoard scalars every `log_every` steps.
+
+Without `instrument` (e.g. the legacy ImageDataGenerator) only step time and
+images/sec are reported.
+"""
+
+import time
+
+import numpy as np
+import tensorflow as tf
+from keras.callbacks import Callback
+
+STARVATION_THRESHOLD = 0.2  # warn when the model waits for data this fraction of the step time
+
+
+class ThroughputTelemetry(Callback):
+    def __init__(self, log_dir=None, starvation_threshold=STARVATION_THRESHOLD, warmup_steps=2, log_every=50):
+        super().__init__()
+        self.log_dir = log_dir
+        self.starvation_threshold = starvation_threshold
+        self.warmup_steps = warmup_steps  # the first steps of each fit include tracing
+        self.log_every = log_every
+        self._writer = None
+        self._ready = []  # (perf_counter when a batch left the pipeline, batch size)
+        self._global_step = 0
+
+    def instrument(self, dataset):
+        """dataset with a final marker that timestamps each batch as the train step receives it."""
+        def record(batch_size):
+            self._ready.append((time.perf_counter(), int(batch_size)))
+            return np.int64(0)
+
+        def mark(x, *rest):
+            marker = tf.py_function(record, [tf.shape(x)[0]], tf.int64)
+            with tf.control_dependencies([marker]):
+                x = tf.identity(x)
+            return (x, *rest)
+
+        return dataset.map(mark)
+
+    # --- Keras hooks ---
+    def on_train_begin(self, logs=None):
+        if self.log_dir and self._writer is None:
+            self._writer = tf.summary.create_file_writer(self.log_dir)
+        self._fit_steps = 0
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self._steps = []  # (step seconds, data wait seconds or None, images)
+        self._ready.clear()
+
+    def on_train_batch_begin(self, batch, logs=None):
+        self._ready.clear()
+        self._step_start = time.perf_counter()
+
+    def on_train_batch_end(self, batch, logs=None):
+        if logs and 'loss' in logs:
+            float(logs['loss'])  # wait for the step to actually finish
+        end = time.perf_counter()
+        self._fit_steps += 1
+        if self._fit_steps <= self.warmup_steps:
+            return
+        step = end - self._step_start
+        wait, images = None, None
+        if self._ready:
+            ready, images = self._ready[-1]
+            wait = min(max(ready - self._step_start, 0.0), step)
+        elif self.params.get('batch_size'):
+            images = self.params['batch_size']
+        self._steps.append((step, wait, images))
+
+        self._global_step += 1
+        if self._writer is not None and self._global_step % self.log_every == 0:
+            with self._writer.as_default(step=self._global_step):
+                tf.summary.scalar('step_time_ms', step * 1000)
+                if wait is not None:
+                    tf.summary.scalar('data_wait_ms', wait * 1000)
+                    tf.summary.scalar('compute_ms', (step - wait) * 1000)
+                if images:
+                    tf.summary.scalar('images_per_sec', images / step)
+
+    def on_epoch_end(self, epoch, logs=None):
+        summary = self.summary()
+        if not summary:
+            return
+        if logs is not None:
+            logs.update(summary)
+        line = f"⏱️  Epoch {epoch + 1}: {summary['step_time_ms']:.0f} ms/step"
+        if 'images_per_sec' in summary:
+            line += f", {summary['images_per_sec']:.1f} images/sec"
+        if 'data_wait_fraction' in summary:
+            fraction = summary['data_wait_fraction']
+            line += (f" (data wait {summary['data_wait_ms']:.0f} ms = {fraction:.0%},"
+                     f" compute {summary['compute_ms']:.0f} ms)")
+        print(line)
+        if summary.get('data_wait_fraction', 0.0) > self.starvation_threshold:
+            print(f"⚠️  Input pipeline is starving the model: {summary['data_wait_fraction']:.0%} of each step "
+                  f"is spent waiting for data. Try --cache, --input-pipeline shards or --feature-views.")
+
+    def on_train_end(self, logs=None):
+        if self._writer is not None:
+            self._writer.flush()
+
+    def summary(self):
+        """Epoch summary so far (empty before the first measured step)."""
+        if not self._steps:
+            return {}
+        steps = np.array([s for s, _, _ in self._steps])
+        summary = {
+            'step_time_ms': float(steps.mean() * 1000),
+            'step_time_p95_ms': float(np.percentile(steps, 95) * 1000),
+        }
+        images = [n for _, _, n in self._steps if n]
+        if len(images) == len(self._steps):
+            summary['images_per_sec'] = float(sum(images) / steps.sum())
+        waits = [w for _, w, _ in self._steps if w is not None]
+        if len(waits) == len(self._steps):
+            wait = float(np.mean(waits))
+            summary['data_wait_ms'] = wait * 1000
+            summary['compute_ms'] = float(steps.mean() - wait) * 1000
+            summary['data_wait_fraction'] = float(np.sum(waits) / steps.sum())
+        return summary
@@ -1,12 +1,13 @@
 import tensorflow as tf
 import numpy as np
 from keras.models import load_model, Model
-from keras.preprocessing.image import img_to_array
 from PIL import Image
 import os
 import sys
 from typing import Optional
 
+import preprocessing
+
 # --- CONFIG ---
 MODEL_PATH = os.path.join(os.path.dirname(__file__), "models", "skin_cancer_model.h5")
 
@@ -59,12 +60,8 @@ def create_test_image():
     return Image.fromarray(test_img)
 
 def preprocess_image(image: Image.Image) -> np.ndarray:
-    """Preprocess image for model prediction"""
-    img = image.convert("RGB")
-    img = img.resize((224, 224))
-    img_array = img_to_array(img) / 255.0
-    img_array = np.expand_dims(img_array, axis=0)
-    return img_array
+    """Preprocess image for model prediction (shared preprocessing module)"""
+    return preprocessing.preprocess_image(image)
 
 def predict_image(model: Model, img_array: np.ndarray):
     """Make prediction on preprocessed image"""
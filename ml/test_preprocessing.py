@@ -0,0 +1,158 @@
+"""
+Parity check: every preprocessing backend must produce exactly the tensors
+the training pipeline produces for the same file.
+
+    python -m pytest test_preprocessing.py             # as a test (synthetic samples)
+    python test_preprocessing.py                       # synthetic JPEG/PNG samples, with a report
+    python test_preprocessing.py --images some/folder  # your own images too
+    python test_preprocessing.py --tolerance 0.004     # accept 1/255 differences
+
+The reference is data_pipeline.make_eval_dataset (decode, nearest resize,
+x * (1/255) in float32), i.e. what the model sees during training and
+evaluation, without augmentation. Samples cover large and small JPEGs,
+grayscale JPEG, RGBA and palette PNG, at sizes where nearest-neighbour
+resizing has ties. Exits 1 on any mismatch.
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+
+import numpy as np
+from PIL import Image
+
+import preprocessing
+from data_pipeline import ImageFolder, make_eval_dataset
+
+SAMPLES = [
+    # (name, width, height, PIL mode, format)
+    ('photo_large.jpg', 3024, 4032, 'RGB', 'JPEG'),
+    ('photo_medium.jpg', 1280, 960, 'RGB', 'JPEG'),
+    ('photo_small.jpg', 180, 150, 'RGB', 'JPEG'),
+    ('exact_size.jpg', 224, 224, 'RGB', 'JPEG'),
+    ('grayscale.jpg', 640, 480, 'L', 'JPEG'),
+    ('dermoscopy.png', 600, 450, 'RGB', 'PNG'),
+    ('with_alpha.png', 500, 500, 'RGBA', 'PNG'),
+    ('palette.png', 320, 240, 'P', 'PNG'),
+]
+
+
+def synthetic_image(width, height, mode='RGB', seed=0):
+    """Smooth colour gradients plus noise, so it compresses and decodes like a photo."""
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    channels = [np.sin(x / rng.uniform(20, 80) + c) * np.cos(y / rng.uniform(20, 80)) for c in range(3)]
+    pixels = (np.stack(channels, axis=-1) * 100 + 128 + rng.normal(0, 12, (height, width, 3)))
+    img = Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8), 'RGB')
+    if mode == 'RGBA':
+        img.putalpha(Image.fromarray(rng.integers(0, 256, (height, width), dtype=np.uint8)))
+        return img
+    if mode == 'P':
+        return img.convert('P', palette=Image.ADAPTIVE)
+    return img.convert(mode)
+
+
+def write_samples(directory):
+    for i, (name, width, height, mode, fmt) in enumerate(SAMPLES):
+        synthetic_image(width, height, mode, seed=i).save(os.path.join(directory, name), format=fmt, quality=90)
+
+
+def training_tensors(folder):
+    """{file path: (224, 224, 3) float32} from the training input pipeline."""
+    source = ImageFolder(folder)
+    images = np.concatenate([x.numpy() for x, _ in make_eval_dataset(source, 16)])
+    return dict(zip(source.filenames, images))
+
+
+def backend_available(backend):
+    if backend == 'opencv':
+        try:
+            import cv2  # noqa: F401
+        except ImportError:
+            return False
+    return True
+
+
+def check(workdir, images=None, tolerance=0.0, echo=True):
+    """Writes the samples (plus `images`) under workdir and compares every backend; returns the mismatches."""
+    class_dir = os.path.join(workdir, 'samples')  # ImageFolder wants class sub-folders
+    os.makedirs(class_dir)
+    write_samples(class_dir)
+    if images:
+        for name in os.listdir(images):
+            if name.lower().endswith(('.jpg', '.jpeg', '.png')):
+                shutil.copy(os.path.join(images, name), class_dir)
+    expected = training_tensors(workdir)
+    if echo:
+        print(f"🔍 {len(expected)} images, reference: training pipeline (make_eval_dataset)\n")
+
+    mismatches = []
+    for backend in preprocessing.BACKENDS:
+        if not backend_available(backend):
+            if echo:
+                print(f"⏭️  {backend}: not installed, skipped")
+            continue
+        paths = sorted(expected)
+        batch = preprocessing.preprocess_batch(paths, backend=backend)
+        for path, actual in zip(paths, batch):
+            single = preprocessing.preprocess_image(path, backend=backend)
+            reference = expected[path]
+            diff = float(np.abs(actual - reference).max())
+            problems = []
+            if actual.dtype != np.float32 or single.shape != (1,) + reference.shape:
+                problems.append(f"dtype/shape {single.dtype} {single.shape}")
+            if not np.array_equal(single[0], actual):
+                problems.append("single != batch")
+            if diff > tolerance:
+                problems.append(f"max diff {diff:.5f} ({int(round(diff * 255))}/255), "
+                                f"{np.mean(actual != reference):.2%} of values differ")
+            if problems:
+                mismatches.append(f"{backend} {os.path.basename(path)}: {'; '.join(problems)}")
+            if echo:
+                detail = 'identical' if diff == 0 else f"within tolerance ({diff:.5f})"
+                print(f"{'❌' if problems else '✅'} {backend:<7} {os.path.basename(path):<20} "
+                      f"{'; '.join(problems) or detail}")
+        if echo:
+            print()
+    return mismatches
+
+
+# ==========================
+# PYTEST
+# ==========================
+def test_backends_match_training_pipeline(tmp_path):
+    mismatches = check(str(tmp_path), echo=False)
+    assert not mismatches, "\n".join(mismatches)
+
+
+def test_nearest_indices_sample_pixel_centres():
+    # 640 -> 224: ties at exact half pixels must resolve the same way everywhere
+    indices = preprocessing.nearest_indices(640, 224)
+    expected = np.floor((np.arange(224) + 0.5) * 640 / 224).astype(int)
+    assert np.array_equal(indices, expected)
+    assert indices[0] >= 0 and indices[-1] < 640
+    assert np.array_equal(preprocessing.nearest_indices(224, 224), np.arange(224))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check that every preprocessing backend matches training.")
+    parser.add_argument('--images', default=None, help="Folder of extra images to check")
+    parser.add_argument('--tolerance', type=float, default=0.0, help="Allowed max absolute difference")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='preprocessing_parity_')
+    try:
+        failures = len(check(workdir, args.images, args.tolerance))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if failures:
+        print(f"❌ {failures} mismatch(es)")
+        sys.exit(1)
+    print("✅ All backends match the training pipeline")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,38 @@
+"""
+ASHA bookkeeping in sweep.ResultsTable (no training involved).
+
+    python -m pytest test_sweep.py
+"""
+
+import sqlite3
+
+from sweep import ResultsTable
+
+
+def test_rung_cutoff_only_counts_trials_of_the_same_sweep(tmp_path):
+    table = ResultsTable(str(tmp_path / 'sweep_results.db'))
+    # An earlier sweep in the same file reached high accuracy at rung 1
+    for accuracy in (0.9, 0.91, 0.92):
+        table.record_rung(table.add_trial('old', {}), 1, accuracy, eta=3)
+
+    new = [table.add_trial('new', {}) for _ in range(3)]
+    assert table.record_rung(new[0], 1, 0.5, eta=3)  # fewer than eta results in this sweep
+    assert table.record_rung(new[1], 1, 0.6, eta=3)
+    assert table.record_rung(new[2], 1, 0.7, eta=3)  # best of its sweep, worse than every old trial
+    assert not table.record_rung(table.add_trial('new', {}), 1, 0.55, eta=3)
+    assert [row[0] for row in table.rows('new')] == new + [new[-1] + 1]
+
+
+def test_results_file_without_sweep_ids_is_upgraded(tmp_path):
+    path = str(tmp_path / 'sweep_results.db')
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE trials (id INTEGER PRIMARY KEY, params TEXT NOT NULL, status TEXT NOT NULL,"
+                 " epochs INTEGER NOT NULL DEFAULT 0, best_val_accuracy REAL, seconds REAL, error TEXT)")
+    conn.execute("INSERT INTO trials (params, status) VALUES ('{}', 'done')")
+    conn.commit()
+    conn.close()
+
+    table = ResultsTable(path)
+    trial_id = table.add_trial('new', {})
+    assert table.record_rung(trial_id, 1, 0.5, eta=3)
+    assert [row[1] for row in table.rows()] == [None, 'new']
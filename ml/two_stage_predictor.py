@@ -8,10 +8,41 @@ Stage 2: If cancer detected, specialized model provides detailed analysis
 import os
 import numpy as np
 from keras.models import load_model
-from keras.preprocessing import image
 import json
 from pathlib import Path
 
+from preprocessing import preprocess_image
+
+# Class mappings for Stage 1 (10 general classes)
+STAGE1_CLASSES = {
+    0: '1. Eczema 1677',
+    1: '10. Warts Molluscum and other Viral Infections - 2103',
+    2: '2. Melanoma 15.75k',
+    3: '3. Atopic Dermatitis - 1.25k',
+    4: '4. Basal Cell Carcinoma (BCC) 3323',
+    5: '5. Melanocytic Nevi (NV) - 7970',
+    6: '6. Benign Keratosis-like Lesions (BKL) 2624',
+    7: '7. Psoriasis pictures Lichen Planus and related diseases - 2k',
+    8: '8. Seborrheic Keratoses and other Benign Tumors - 1.8k',
+    9: '9. Tinea Ringworm Candidiasis and other Fungal Infections - 1.7k'
+}
+
+# Cancer-related classes from Stage 1 (indices that trigger Stage 2)
+CANCER_CLASSES = [2, 4, 5, 6, 8]  # Melanoma, BCC, Nevi, BKL, Seborrheic
+
+# Class mappings for Stage 2 (cancer types)
+# Adjust these based on your actual cancer model's classes
+STAGE2_CLASSES = {
+    0: 'Melanoma (Malignant)',
+    1: 'Basal Cell Carcinoma',
+    2: 'Squamous Cell Carcinoma',
+    3: 'Benign Nevus',
+    4: 'Seborrheic Keratosis',
+    5: 'Actinic Keratosis',
+    6: 'Dermatofibroma',
+    7: 'Vascular Lesion'
+}
+
 class TwoStagePredictor:
     """
     Two-stage skin disease prediction system
@@ -19,53 +50,48 @@ class TwoStagePredictor:
     
     def __init__(self, 
                  stage1_model_path='models/finetuned_model.h5',
-                 stage2_model_path='models/skin_cancer_model.h5'):
+                 stage2_model_path='models/skin_cancer_model.h5',
+                 stage1_model=None,
+                 stage2_model=None,
+                 student_model_path=None,
+                 student_model=None):
         """
         Initialize both models
         
         Args:
             stage1_model_path: Path to general skin disease classifier
             stage2_model_path: Path to specialized cancer classifier
+            stage1_model: Already-loaded Stage 1 model (skips loading from path)
+            stage2_model: Already-loaded Stage 2 model (skips loading from path)
+            student_model_path: Path to a distilled two-head student (distill.py);
+                when given, it replaces both stage models
+            student_model: Already-loaded two-head student
         """
         print("🔧 Loading Two-Stage Prediction System...")
         
+        # Distilled student: one model with [stage1, stage2] outputs
+        if student_model is None and student_model_path:
+            print(f"📦 Loading distilled student model: {student_model_path}")
+            student_model = load_model(student_model_path)
+        self.student_model = student_model
+        if student_model is not None:
+            stage1_model = stage2_model = student_model
+        
         # Load Stage 1 model (general classifier)
-        print(f"📦 Loading Stage 1 model: {stage1_model_path}")
-        self.stage1_model = load_model(stage1_model_path)
+        if stage1_model is None:
+            print(f"📦 Loading Stage 1 model: {stage1_model_path}")
+            stage1_model = load_model(stage1_model_path)
+        self.stage1_model = stage1_model
         
         # Load Stage 2 model (cancer specialist)
-        print(f"📦 Loading Stage 2 model: {stage2_model_path}")
-        self.stage2_model = load_model(stage2_model_path)
-        
-        # Define class mappings for Stage 1 (10 general classes)
-        self.stage1_classes = {
-            0: '1. Eczema 1677',
-            1: '10. Warts Molluscum and other Viral Infections - 2103',
-            2: '2. Melanoma 15.75k',
-            3: '3. Atopic Dermatitis - 1.25k',
-            4: '4. Basal Cell Carcinoma (BCC) 3323',
-            5: '5. Melanocytic Nevi (NV) - 7970',
-            6: '6. Benign Keratosis-like Lesions (BKL) 2624',
-            7: '7. Psoriasis pictures Lichen Planus and related diseases - 2k',
-            8: '8. Seborrheic Keratoses and other Benign Tumors - 1.8k',
-            9: '9. Tinea Ringworm Candidiasis and other Fungal Infections - 1.7k'
-        }
-        
-        # Cancer-related classes from Stage 1 (indices that trigger Stage 2)
-        self.cancer_classes = [2, 4, 5, 6, 8]  # Melanoma, BCC, Nevi, BKL, Seborrheic
+        if stage2_model is None:
+            print(f"📦 Loading Stage 2 model: {stage2_model_path}")
+            stage2_model = load_model(stage2_model_path)
+        self.stage2_model = stage2_model
         
-        # Define class mappings for Stage 2 (cancer types)
-        # Adjust these based on your actual cancer model's classes
-        self.stage2_classes = {
-            0: 'Melanoma (Malignant)',
-            1: 'Basal Cell Carcinoma',
-            2: 'Squamous Cell Carcinoma',
-            3: 'Benign Nevus',
-            4: 'Seborrheic Keratosis',
-            5: 'Actinic Keratosis',
-            6: 'Dermatofibroma',
-            7: 'Vascular Lesion'
-        }
+        self.stage1_classes = dict(STAGE1_CLASSES)
+        self.cancer_classes = list(CANCER_CLASSES)
+        self.stage2_classes = dict(STAGE2_CLASSES)
         
         print("✅ Two-Stage Prediction System Ready!")
         print(f"   Stage 1: {len(self.stage1_classes)} general disease classes")
@@ -77,17 +103,13 @@ class TwoStagePredictor:
         Preprocess image for prediction
         
         Args:
-            img_path: Path to image file
+            img_path: Path to image file (or bytes / file-like object)
             target_size: Target size for model input
             
         Returns:
-            Preprocessed image array
+            Preprocessed image array (shared preprocessing module)
         """
-        img = image.load_img(img_path, target_size=target_size)
-        img_array = image.img_to_array(img)
-        img_array = np.expand_dims(img_array, axis=0)
-        img_array = img_array / 255.0  # Normalize to [0, 1]
-        return img_array
+        return preprocess_image(img_path, target_size)
     
     def predict(self, img_path, confidence_threshold=0.5):
         """
@@ -97,19 +119,39 @@ class TwoStagePredictor:
             img_path: Path to image file
             confidence_threshold: Minimum confidence to trigger Stage 2
             
+        Returns:
+            Dictionary with prediction results
+        """
+        img_processed = self.preprocess_image(img_path)
+        return self.predict_array(img_processed, confidence_threshold, label=Path(img_path).name)
+    
+    def predict_array(self, img_processed, confidence_threshold=0.5, label='image'):
+        """
+        Two-stage prediction on an already preprocessed image
+        
+        Args:
+            img_processed: Array of shape (1, 224, 224, 3), scaled to [0, 1]
+            confidence_threshold: Minimum confidence to trigger Stage 2
+            label: Name used in the log output
+            
         Returns:
             Dictionary with prediction results
         """
         print(f"\n{'='*70}")
-        print(f"🔍 ANALYZING IMAGE: {Path(img_path).name}")
+        print(f"🔍 ANALYZING IMAGE: {label}")
         print(f"{'='*70}")
         
         # ========== STAGE 1: General Classification ==========
         print("\n📊 STAGE 1: General Skin Disease Classification")
         print("-" * 70)
         
-        img_processed = self.preprocess_image(img_path)
-        stage1_predictions = self.stage1_model.predict(img_processed, verbose=0)[0]
+        if self.student_model is not None:
+            # One forward pass gives both stages
+            stage1_output, stage2_output = self.student_model.predict(img_processed, verbose=0)
+            stage1_predictions, student_stage2 = stage1_output[0], stage2_output[0]
+        else:
+            stage1_predictions = self.stage1_model.predict(img_processed, verbose=0)[0]
+            student_stage2 = None
         
         # Get top 3 predictions from Stage 1
         top3_indices = np.argsort(stage1_predictions)[-3:][::-1]
@@ -146,7 +188,10 @@ class TwoStagePredictor:
             print("\n📊 STAGE 2: Detailed Cancer Classification")
             print("-" * 70)
             
-            stage2_predictions = self.stage2_model.predict(img_processed, verbose=0)[0]
+            if student_stage2 is not None:
+                stage2_predictions = student_stage2
+            else:
+                stage2_predictions = self.stage2_model.predict(img_processed, verbose=0)[0]
             
             # Get top 3 predictions from Stage 2
             top3_stage2 = np.argsort(stage2_predictions)[-3:][::-1]